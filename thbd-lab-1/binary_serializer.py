@@ -1,8 +1,384 @@
 from typing import Dict, Union
 from pathlib import Path
+import hashlib
+import json
 import struct
 import inspect
 import sys
+from array import array
+from copy import deepcopy
+from itertools import accumulate, chain
+from operator import attrgetter
+from functools import partial
+
+from record_classes import make_record_classes
+from compression import get_codec
+
+
+_LEN = struct.Struct(">I")
+_FLOAT = struct.Struct("d")
+_ZERO_LEN = bytes(4)
+
+# Файл без встроенной схемы: магическая метка + отпечаток схемы.
+# Обычный файл всегда начинается с байта типа dict, так что
+# первый байт 0xFE их однозначно различает
+_FINGERPRINT_MAGIC = b"\xfeSFP"
+_FINGERPRINT_SIZE = 8
+
+# Сжатый файл: MAGIC | номер кодека (1) | сжатое содержимое обычного файла
+_COMPRESSED_MAGIC = b"\xfeSZC"
+
+# Пачка записей, разложенная по колонкам (serialize_many):
+#   MAGIC | номер кодека (1) | отпечаток схемы (8) | длина схемы (4) | схема
+#   | число записей (4) | колонки (сжаты вместе)
+# где колонки - для каждой колонки: длина (4) | байты колонки
+_BATCH_MAGIC = b"\xfeSCB"
+
+# Списки из этих типов можно писать упакованными: число элементов
+# и подряд идущие значения фиксированной ширины без байтов типа.
+# Значения - код для array и нужно ли переворачивать байты
+# (int пишется big-endian, как и одиночные int, float - как struct "d")
+_PACKED_ITEM_TYPES = {
+    "int": ("I", sys.byteorder == "little"),
+    "float": ("d", False),
+    "bool": ("B", False),
+    "int8": ("b", False),
+    "int16": ("h", sys.byteorder == "little"),
+    "int64": ("q", sys.byteorder == "little"),
+    "float32": ("f", False),
+}
+
+# Числа фиксированной ширины (целые - знаковые big-endian)
+_FIXED_WIDTH_TYPES = {
+    "int8": struct.Struct(">b"),
+    "int16": struct.Struct(">h"),
+    "int64": struct.Struct(">q"),
+    "float32": struct.Struct("f"),
+}
+
+# LEB128: по 7 бит на байт, старший бит - "дальше есть еще байт".
+# sint перед этим переводится в zigzag (0, -1, 1, -2 -> 0, 1, 2, 3),
+# чтобы маленькие по модулю отрицательные числа тоже были короткими
+_VARINT_TYPES = ("varint", "sint")
+_PACKABLE_ITEM_TYPES = set(_PACKED_ITEM_TYPES) | set(_VARINT_TYPES)
+_SMALL_VARINTS = [bytes([value]) for value in range(0x80)]
+
+
+# Числа, которые пишутся одним struct: тип -> struct (int - 4 байта
+# big-endian без знака). Общая таблица для кодировщика в bytearray
+# и для записи на место в dumps/dump_into
+_FIXED_SCALARS = {"int": _LEN, "float": _FLOAT, **_FIXED_WIDTH_TYPES}
+
+
+def _encode_varint(value: int) -> bytes:
+    if 0 <= value < 0x80:
+        return _SMALL_VARINTS[value]
+    if value < 0:
+        raise ValueError(f"varint can't hold negative value {value}, use sint")
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _varint_size(value: int) -> int:
+    if value < 0x80:
+        return 1
+    return (value.bit_length() + 6) // 7
+
+
+def _decode_varint(buffer, pos: int):
+    byte = buffer[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result = byte & 0x7F
+    shift = 7
+    pos += 1
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def _pack_array(item_type: str, values) -> bytes:
+    if item_type == "varint":
+        return b"".join(map(_encode_varint, values))
+    if item_type == "sint":
+        return b"".join(_encode_varint(_zigzag(value)) for value in values)
+    typecode, swap = _PACKED_ITEM_TYPES[item_type]
+    packed = array(typecode, values)
+    if swap:
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _packed_array_size(item_type: str, values) -> int:
+    if item_type == "varint":
+        return sum(map(_varint_size, values))
+    if item_type == "sint":
+        return sum(_varint_size(_zigzag(value)) for value in values)
+    return len(values) * array(_PACKED_ITEM_TYPES[item_type][0]).itemsize
+
+
+def _unpack_array(item_type: str, buffer, pos: int, count: int):
+    if item_type in _VARINT_TYPES:
+        values = []
+        for _ in range(count):
+            value, pos = _decode_varint(buffer, pos)
+            values.append(value)
+        if item_type == "sint":
+            values = list(map(_unzigzag, values))
+        return values, pos
+    typecode, swap = _PACKED_ITEM_TYPES[item_type]
+    unpacked = array(typecode)
+    end = pos + count * unpacked.itemsize
+    unpacked.frombytes(buffer[pos:end])
+    if swap:
+        unpacked.byteswap()
+    if item_type == "bool":
+        return list(map(bool, unpacked)), end
+    return unpacked.tolist(), end
+
+_pack_len = _LEN.pack_into
+_unpack_len = _LEN.unpack_from
+
+# Функции вложенных контейнеров собираются и вызывают друг друга рекурсивно.
+# Больше всего стека на уровень схемы берет компиляция кодировщика
+# (_compile_at, _compile_encoder, _compile_plain_encoder, _compile_typed_encoder),
+# кодирование и чтение - не больше. Схема, которая не помещается в текущий
+# лимит рекурсии (с запасом под вызывающий код), отвергается сразу, а не
+# падает посреди компиляции. Сам лимит сериализатор не меняет: слишком
+# высокий лимит переполняет уже стек интерпретатора
+_FRAMES_PER_LEVEL = 4
+_RECURSION_RESERVE = 200
+_CONTAINER_TYPES = ("list", "dict", "class")
+_DEDUP_TYPES = _CONTAINER_TYPES + ("packed_list",)
+
+# Повышение типа при чтении данных по новой схеме - только расширение:
+# целые фиксированной ширины от узкого к широкому
+_INT_WIDENING = ("int8", "int16", "int", "int64")
+
+# Операции на стеке нерекурсивного кодировщика
+_ENCODE = 0             # закодировать значение
+_ENCODE_WITH_LEN = 1    # то же, но с 4 байтами длины перед ним
+_CLOSE = 2              # дописать длину, место под которую начинается с позиции
+_NO_VALUE = object()
+
+
+def schema_fingerprint(schema: Dict) -> bytes:
+    canonical = json.dumps(_written_schema(schema), sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=_FINGERPRINT_SIZE).digest()
+
+
+def _written_schema(schema_to_use):
+    # Схема без default: это значения для читателя, в данных которого
+    # поля нет, на байты записи они не влияют. В файл и в отпечаток
+    # идет только такая схема, так что default может быть любым
+    # (None, отрицательным) и не меняет отпечаток
+    if not isinstance(schema_to_use, dict):
+        return schema_to_use
+    written = {key: value for key, value in schema_to_use.items() if key != 'default'}
+    field_type = written['type']
+    if field_type.startswith("nullable_"):
+        field_type = field_type[len("nullable_"):]
+    if field_type == "list":
+        written['value_type'] = _written_schema(written['value_type'])
+    elif field_type in ("dict", "class"):
+        written['value_type'] = {
+            key: _written_schema(value) for key, value in written['value_type'].items()
+        }
+    return written
+
+
+def _schema_depth(schema_to_use) -> int:
+    # Наибольшее число вложенных list/dict/class, обход без рекурсии
+    depth = 0
+    stack = [(schema_to_use, 1)]
+    while stack:
+        schema_to_use, level = stack.pop()
+        if not isinstance(schema_to_use, dict):
+            continue
+        field_type = schema_to_use['type']
+        if field_type.startswith("nullable_"):
+            field_type = field_type[len("nullable_"):]
+        if field_type not in _CONTAINER_TYPES:
+            continue
+        depth = max(depth, level)
+        if field_type == "list":
+            stack.append((schema_to_use['value_type'], level + 1))
+        elif field_type == "dict":
+            stack.append((schema_to_use['value_type']['keys'], level + 1))
+            stack.append((schema_to_use['value_type']['values'], level + 1))
+        else:
+            stack.extend((field_schema, level + 1) for field_schema in schema_to_use['value_type'].values())
+    return depth
+
+
+def _max_schema_depth() -> int:
+    return (sys.getrecursionlimit() - _RECURSION_RESERVE) // _FRAMES_PER_LEVEL
+
+
+def _contains_class(schema_to_use) -> bool:
+    stack = [schema_to_use]
+    while stack:
+        schema_to_use = stack.pop()
+        if not isinstance(schema_to_use, dict):
+            continue
+        field_type = schema_to_use['type']
+        if field_type.startswith("nullable_"):
+            field_type = field_type[len("nullable_"):]
+        if field_type == "class":
+            return True
+        if field_type == "list":
+            stack.append(schema_to_use['value_type'])
+        elif field_type == "dict":
+            stack.extend(schema_to_use['value_type'].values())
+    return False
+
+
+def _promotion(writer_type: str, reader_type: str):
+    # Функция перевода значения писателя в тип читателя, None - перевод не нужен.
+    # Разрешено только расширение: int8 -> int16 -> int -> int64,
+    # int (и более узкие) -> float, float32 -> float
+    if writer_type == reader_type:
+        return None
+    if writer_type in _INT_WIDENING and reader_type in _INT_WIDENING:
+        if _INT_WIDENING.index(writer_type) < _INT_WIDENING.index(reader_type):
+            return None
+    elif writer_type in _INT_WIDENING[:3] and reader_type == "float":
+        return float
+    elif writer_type == "float32" and reader_type == "float":
+        return None
+    raise ValueError(f"Can't read {writer_type} data as {reader_type}")
+
+
+def _split_by_lengths(flat, lengths) -> list:
+    offsets = list(accumulate(lengths, initial=0))
+    return [flat[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def _decode_backref(decode, buffer, pos: int, state):
+    # Ссылка dedup на позиции pos: decode читает первое вхождение,
+    # позиция - сразу за ссылкой
+    distance, end = _decode_varint(buffer, pos + 1)
+    return decode(buffer, pos - distance, state)[0], end
+
+
+class StringTable:
+    # Таблица строк одного файла или блока контейнера: каждая строка
+    # пишется в таблицу один раз, в данных остается только ее номер.
+    # strings - уже прочитанная из файла таблица
+    def __init__(self, strings: Union[list, None] = None):
+        self.ids = {}
+        self.strings = [] if strings is None else strings
+
+    def add(self, value: str) -> int:
+        string_id = len(self.strings)
+        self.ids[value] = string_id
+        self.strings.append(value)
+        return string_id
+
+    def encode(self, code: bytes) -> bytes:
+        # код типа | число строк | (длина | utf-8) для каждой строки, все числа - varint
+        out = bytearray(code)
+        out += _encode_varint(len(self.strings))
+        for value in self.strings:
+            encoded_string = value.encode('utf-8')
+            out += _encode_varint(len(encoded_string))
+            out += encoded_string
+        return bytes(out)
+
+
+class CodingState:
+    # Состояние одного вызова кодирования или декодирования: файла, блока
+    # контейнера или файла с индексом. Создается на каждый вызов и передается
+    # во все скомпилированные функции, поэтому в самом сериализаторе
+    # изменяемого состояния нет и один сериализатор можно одновременно
+    # использовать для разных файлов
+    def __init__(self, strings: Union[list, None] = None):
+        self.string_table = StringTable(strings)
+        # dedup при записи: ключ поддерева -> позиция первого вхождения.
+        # Действует на весь файл или блок, как и таблица строк
+        self.objects = {}
+        # (начало, конец, позиция первого вхождения) закодированных
+        # поддеревьев, которые еще не забрал объемлющий их контейнер
+        self.children = []
+        # (id(значение), кодировщик) -> (значение, позиция, размер) в пределах
+        # одной записи: тот же самый объект не кодируется второй раз.
+        # Значение держится, чтобы его id не достался другому объекту
+        self.by_id = {}
+        # позиция начала буфера out в файле: у файла с индексом каждая
+        # запись кодируется в свой буфер, а ссылки идут через весь файл
+        self.base = 0
+
+
+def _field_list(fields):
+    # Ключ набора полей для кешей декодеров. Одна строка - это одно поле,
+    # а не последовательность букв: fields="name" == fields=["name"]
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = [fields]
+    return tuple(sorted(fields))
+
+
+def _projection_tree(fields) -> Dict:
+    # ["name", "basket.items"] -> {"name": None, "basket": {"items": None}},
+    # None - поле нужно целиком
+    tree = {}
+    for field in fields:
+        node = tree
+        *parents, leaf = field.split(".")
+        for parent in parents:
+            if parent in node and node[parent] is None:
+                break
+            node = node.setdefault(parent, {})
+        else:
+            node[leaf] = None
+    return tree
+
+
+class LazyRecord:
+    # Запись, поля которой декодируются при первом обращении
+    # и дальше лежат как обычные атрибуты.
+    # Держит ссылку на весь буфер, из которого была прочитана
+    def __init__(
+            self,
+            classname: str,
+            buffer,
+            field_offsets: Dict,
+            state: CodingState
+    ):
+        self._classname = classname
+        self._buffer = buffer
+        self._field_offsets = field_offsets
+        # состояние чтения файла, из которого запись (его таблица строк)
+        self._state = state
+
+    def __getattr__(self, name):
+        field_offsets = self.__dict__.get('_field_offsets', {})
+        if name not in field_offsets:
+            raise AttributeError(f"{self.__dict__.get('_classname')} record has no field {name}")
+        decode_field, pos = field_offsets.pop(name)
+        value, _ = decode_field(self._buffer, pos, self._state)
+        setattr(self, name, value)
+        return value
+
+    def __repr__(self) -> str:
+        return f"Lazy {self._classname} (not decoded yet: {', '.join(self._field_offsets)})"
 
 
 class NullableItem:
@@ -31,12 +407,73 @@ class NullableItem:
 
 
 class Serializer:
-    def __init__(self, schema: Dict, caller_module_name):
+    def __init__(
+            self,
+            schema: Dict,
+            caller_module_name,
+            embed_schema: bool = True,
+            registry=None,
+            packed_arrays: bool = False,
+            intern_strings: bool = False,
+            generate_classes: bool = False,
+            compression: str = "none",
+            dedup: bool = False,
+            metrics=None
+    ):
         #caller = inspect.stack()[1]
         #caller_module = inspect.getmodule(caller[0])
         self.module = caller_module_name #caller_module.__name__
 
         self.schema = schema
+        depth = _schema_depth(schema)
+        if depth > _max_schema_depth():
+            raise ValueError(
+                f"Schema nests {depth} containers, at most {_max_schema_depth()} fit "
+                f"into the recursion limit {sys.getrecursionlimit()}"
+            )
+        # embed_schema=False - вместо схемы в файл пишется только ее отпечаток,
+        # читатель находит схему по отпечатку в реестре (schema_registry.py)
+        self.embed_schema = embed_schema
+        self.registry = registry
+        self.fingerprint = schema_fingerprint(schema)
+        # схема, которая пишется в файлы (без default читателя)
+        self.written_schema = _written_schema(schema)
+        if registry is not None:
+            registry.register(schema)
+        # packed_arrays=True - списки int/float/bool пишутся одним блоком
+        # (packed_list) вместо длины и байта типа на каждый элемент.
+        # Читаются оба варианта независимо от флага
+        self.packed_arrays = packed_arrays
+        # intern_strings=True - строки собираются в таблицу (StringTable),
+        # которая пишется один раз на файл или блок контейнера,
+        # а в данных остаются только номера строк.
+        # Таблица своя у каждого вызова (CodingState)
+        self.intern_strings = intern_strings
+        # generate_classes=True - классы записей (со __slots__) создаются
+        # по самой схеме (record_classes.py), иначе берутся из caller_module_name.
+        # В обоих случаях класс ищется один раз и запоминается в self.classes
+        self.generate_classes = generate_classes
+        self.classes = make_record_classes(schema) if generate_classes else {}
+        # compression - кодек из compression.py (zlib, lzma, bz2, lz77),
+        # которым сжимаются файлы и блоки контейнера. Номер кодека пишется
+        # в заголовок, при чтении данные распаковываются сами
+        self.compression = get_codec(compression)
+        # dedup=True - повторяющиеся списки, словари и объекты пишутся
+        # ссылкой на первое такое же поддерево в том же файле или блоке
+        # контейнера. При чтении по ссылке создаются новые объекты -
+        # списки, словари и записи изменяемы, делить их между местами нельзя.
+        # Ссылки читаются независимо от флага
+        self.dedup = dedup
+        # metrics - SerializerMetrics (metrics.py): время и байты по полям
+        # и типам схемы
+        self.metrics = metrics
+        # путь поля схемы, для которого сейчас компилируется кодировщик
+        self._compile_path = ""
+        self._writer_serializers = {}
+        # байты схемы из заголовка встроенной схемы -> отпечаток писателя
+        self._writer_fingerprints = {}
+        # декодеры данных чужих схем в объекты нашей: (отпечаток писателя, поля) -> декодер
+        self._resolved_decoders = {}
         codes = [
             "class",
             "dict",
@@ -58,7 +495,29 @@ class Serializer:
             "nullable_float",
             "nullable_dict",
             "nullable_list",
-            "nullable_class"
+            "nullable_class",
+            "nullable_bool",
+
+            # упакованные списки чисел
+            "packed_list",
+            "nullable_packed_list",
+
+            # числа переменной и заданной ширины
+            "varint",
+            "sint",
+            "int8",
+            "int16",
+            "int64",
+            "float32",
+            "nullable_varint",
+            "nullable_sint",
+            "nullable_int8",
+            "nullable_int16",
+            "nullable_int64",
+            "nullable_float32",
+
+            "string_table",
+            "backref"
         ]
 
         self.codes = {k: int.to_bytes(v, 1) for v, k in enumerate(codes)}
@@ -66,393 +525,1712 @@ class Serializer:
 
         self.missing_value = int.to_bytes(255, 1)
         self.missing_value_int = 255
-        
+        # вместо сокращения - ссылка (varint) на строку из таблицы строк
+        self.string_ref_value = int.to_bytes(254, 1)
+        self.string_ref_value_int = 254
 
+        # Схема компилируется один раз: на каждое поле заранее собирается
+        # своя функция кодирования/декодирования, чтобы при сериализации
+        # не строить промежуточный словарь и не разбирать схему заново
+        self._decode_key = self._compile_plain_decoder("string")
+        self._encode_object = self._compile_encoder(self.schema)
+        if self.dedup:
+            self._encode_object = self._record_encoder(self._encode_object)
+        # подсчет размера и запись на место для dump_into - при первом вызове
+        self._object_size = self._write_object = None
+        self._decode_object = self._compile_decoder(self.schema)
+        self._object_decoders = {(None, False): self._decode_object}
+        # колоночные кодировщики собираются при первом serialize_many/deserialize_many
+        self._column_codecs = None
 
-    def _sub_serialize(self, object, schema_to_use: Union[Dict, None] = None, n_tabs: int = 0):
+        # Заголовок файла (сама схема + ключ object_data) не меняется
+        # от объекта к объекту, поэтому кодируем его тоже один раз
+        header = bytearray(self.codes['dict'])
+        header.extend(_ZERO_LEN)
+        for key, value in self.written_schema.items():
+            header.extend(self._encode_dict_entry(key, value))
+        object_key = self._recursive_dictionary_encode("object_data")
+        self._object_key = bytes(object_key)
+        header.extend(len(object_key).to_bytes(4))
+        header.extend(object_key)
+        self._object_len_pos = len(header)
+        header.extend(_ZERO_LEN)
+        self._header = bytes(header)
+        self._fingerprint_header = _FINGERPRINT_MAGIC + self.fingerprint
+        string_table_key = self._recursive_dictionary_encode("string_table")
+        self._string_table_key = bytes(len(string_table_key).to_bytes(4) + string_table_key)
 
-        if schema_to_use is None:
-            schema_to_use = self.schema
-        
-        if not isinstance(schema_to_use, dict):
-            #print("\t"*n_tabs + f"{schema_to_use}: {object}")
-            return object
-
-        def subserialize_list():
-            val_type = schema_to_use['value_type']
-            return [
-                self._sub_serialize(
-                    sub_obj,
-                    val_type,
-                    n_tabs=n_tabs+1
-                )
-                for sub_obj in object
+    def _encode_dict_entry(self, key, value) -> bytearray:
+        key_coded = self._recursive_dictionary_encode(key)
+        value_coded = self._recursive_dictionary_encode(value)
+        entry = bytearray(len(key_coded).to_bytes(4))
+        entry.extend(key_coded)
+        entry.extend(len(value_coded).to_bytes(4))
+        entry.extend(value_coded)
+        return entry
+
+    @staticmethod
+    def _schema_type(schema_to_use) -> str:
+        if isinstance(schema_to_use, dict):
+            return schema_to_use['type']
+        return schema_to_use
+
+    def _encoded_type(self, schema_to_use, field_type: str) -> str:
+        if (
+            field_type == "list"
+            and self.packed_arrays
+            and self._schema_type(schema_to_use['value_type']) in _PACKABLE_ITEM_TYPES
+        ):
+            return "packed_list"
+        return field_type
+
+    def _compile_at(self, path: str, compile, *args):
+        # Компилирует вложенное поле с путем path (для metrics)
+        parent_path = self._compile_path
+        self._compile_path = path
+        try:
+            return compile(*args)
+        finally:
+            self._compile_path = parent_path
+
+    def _field_path(self, field: str) -> str:
+        return f"{self._compile_path}.{field}" if self._compile_path else field
+
+    def _compile_encoder(self, schema_to_use):
+        encode = self._compile_plain_encoder(schema_to_use)
+        if self.metrics is None:
+            return encode
+        return self.metrics.measured_encoder(self._compile_path, self._schema_type(schema_to_use), encode)
+
+    def _encoder_layout(self, schema_to_use):
+        # (тип значения, байты перед ним, байты None или None, если тип
+        # не nullable) - общие для кодировщика в bytearray и для пары size/write.
+        # nullable_class, как и раньше, пишется под кодом nullable_dict
+        field_type = self._schema_type(schema_to_use)
+        if field_type.startswith("nullable_"):
+            inner_type = self._encoded_type(schema_to_use, field_type[len("nullable_"):])
+            code = self.codes["nullable_dict" if inner_type == "class" else "nullable_" + inner_type]
+            return inner_type, code + int(False).to_bytes(1), code + int(True).to_bytes(1)
+        field_type = self._encoded_type(schema_to_use, field_type)
+        return field_type, self.codes["dict" if field_type == "class" else field_type], None
+
+    def _compile_plain_encoder(self, schema_to_use):
+        field_type, prefix, none_bytes = self._encoder_layout(schema_to_use)
+        encode = encode_value = self._compile_typed_encoder(schema_to_use, field_type, prefix)
+
+        if none_bytes is not None:
+            def encode_nullable(value, out: bytearray, state):
+                if value is None:
+                    out += none_bytes
+                else:
+                    encode_value(value, out, state)
+
+            encode = encode_nullable
+
+        if self.dedup and field_type in _DEDUP_TYPES:
+            return self._dedup_encoder(encode, len(prefix))
+        return encode
+
+    def _dedup_encoder(self, encode_value, prefix_len: int):
+        # Обертка над кодировщиком контейнера: кодирует значение как обычно,
+        # и если такое поддерево уже есть в файле или блоке - заменяет его
+        # ссылкой назад (код backref и varint расстояния до первого вхождения).
+        # Ключ поддерева - его байты, в которых вложенные поддеревья (и длины
+        # перед ними) заменены позициями их первых вхождений, поэтому
+        # одинаковые поддеревья совпадают независимо от того, записаны ли
+        # внутри них ссылки или сами данные.
+        # prefix_len - байты типа (и флага None) перед длиной контейнера
+        backref = self.codes['backref']
+        header_len = prefix_len + 4
+
+        def encode_dedup(value, out: bytearray, state):
+            if value is None:
+                encode_value(value, out, state)
+                return
+            start = len(out)
+            position = state.base + start
+            children = state.children
+
+            seen = state.by_id.get((id(value), encode_dedup))
+            if seen is not None:
+                ref = backref + _encode_varint(position - seen[1])
+                if len(ref) < seen[2]:
+                    out += ref
+                    children.append((start, len(out), seen[1]))
+                    return
+
+            first_child = len(children)
+            encode_value(value, out, state)
+            size = len(out) - start
+            if len(children) == first_child:
+                key = bytes(out[start:])
+            else:
+                key = [bytes(out[start:start + prefix_len])]
+                cursor = start + header_len
+                for child_start, child_end, child_target in children[first_child:]:
+                    key.append(bytes(out[cursor:child_start - 4]))
+                    key.append(child_target)
+                    cursor = child_end
+                key.append(bytes(out[cursor:]))
+                del children[first_child:]
+                key = tuple(key)
+
+            target = state.objects.setdefault(key, position)
+            if target != position:
+                ref = backref + _encode_varint(position - target)
+                if len(ref) < size:
+                    del out[start:]
+                    out += ref
+            state.by_id[(id(value), encode_dedup)] = (value, target, size)
+            children.append((start, len(out), target))
+
+        return encode_dedup
+
+    def _record_encoder(self, encode):
+        # Тот же самый объект узнается по id только в пределах записи:
+        # между записями его могли изменить. Одинаковые по содержимому
+        # поддеревья находятся и дальше - по всему файлу или блоку
+        def encode_record(value, out: bytearray, state):
+            encode(value, out, state)
+            state.children.clear()
+            state.by_id.clear()
+
+        return encode_record
+
+    def _compile_typed_encoder(self, schema_to_use, field_type: str, prefix: bytes):
+        # prefix - байт типа (и флаг None для nullable), который пишется
+        # перед самим значением
+        if field_type == "string":
+            shorthands = {k: prefix + v for k, v in self.codes.items()}
+            literal_prefix = prefix + self.missing_value
+
+            def encode_string(value: str, out: bytearray, state):
+                shorthand = shorthands.get(value)
+                if shorthand is not None:
+                    out += shorthand
+                    return
+                encoded_string = value.encode('utf-8')
+                out += literal_prefix
+                out += len(encoded_string).to_bytes(4)
+                out += encoded_string
+
+            if not self.intern_strings:
+                return encode_string
+
+            ref_prefix = prefix + self.string_ref_value
+
+            def encode_interned_string(value: str, out: bytearray, state):
+                shorthand = shorthands.get(value)
+                if shorthand is not None:
+                    out += shorthand
+                    return
+                string_table = state.string_table
+                string_id = string_table.ids.get(value)
+                if string_id is None:
+                    string_id = string_table.add(value)
+                out += ref_prefix
+                out += _encode_varint(string_id)
+
+            return encode_interned_string
+
+        if field_type in _FIXED_SCALARS:
+            pack_fixed = _FIXED_SCALARS[field_type].pack
+
+            def encode_fixed_width(value, out: bytearray, state):
+                out += prefix
+                out += pack_fixed(value)
+
+            return encode_fixed_width
+
+        if field_type == "varint":
+            def encode_varint(value: int, out: bytearray, state):
+                out += prefix
+                out += _encode_varint(value)
+
+            return encode_varint
+
+        if field_type == "sint":
+            def encode_sint(value: int, out: bytearray, state):
+                out += prefix
+                out += _encode_varint(_zigzag(value))
+
+            return encode_sint
+
+        if field_type == "bool":
+            true_bytes = prefix + int(True).to_bytes(1)
+            false_bytes = prefix + int(False).to_bytes(1)
+
+            def encode_bool(value: bool, out: bytearray, state):
+                out += true_bytes if value else false_bytes
+
+            return encode_bool
+
+        if field_type == "list":
+            encode_item = self._compile_at(
+                self._compile_path + "[]", self._compile_encoder, schema_to_use['value_type']
+            )
+
+            def encode_list(value: list, out: bytearray, state):
+                out += prefix
+                start = len(out)
+                out += _ZERO_LEN
+                for item in value:
+                    item_start = len(out)
+                    out += _ZERO_LEN
+                    encode_item(item, out, state)
+                    _pack_len(out, item_start, len(out) - item_start - 4)
+                _pack_len(out, start, len(out) - start - 4)
+
+            return encode_list
+
+        if field_type == "packed_list":
+            item_type = self._schema_type(schema_to_use['value_type'])
+            # после префикса - код типа элементов и их количество
+            prefix = prefix + self.codes[item_type]
+
+            def encode_packed_list(value: list, out: bytearray, state):
+                out += prefix
+                out += len(value).to_bytes(4)
+                out += _pack_array(item_type, value)
+
+            return encode_packed_list
+
+        if field_type == "dict":
+            encode_key = self._compile_at(
+                self._compile_path + "{keys}", self._compile_encoder, schema_to_use['value_type']['keys']
+            )
+            encode_value = self._compile_at(
+                self._compile_path + "{}", self._compile_encoder, schema_to_use['value_type']['values']
+            )
+
+            def encode_dict(value: dict, out: bytearray, state):
+                out += prefix
+                start = len(out)
+                out += _ZERO_LEN
+                for key, item in value.items():
+                    item_start = len(out)
+                    out += _ZERO_LEN
+                    encode_key(key, out, state)
+                    _pack_len(out, item_start, len(out) - item_start - 4)
+                    item_start = len(out)
+                    out += _ZERO_LEN
+                    encode_value(item, out, state)
+                    _pack_len(out, item_start, len(out) - item_start - 4)
+                _pack_len(out, start, len(out) - start - 4)
+
+            return encode_dict
+
+        if field_type == "class":
+            # Объект пишется как словарь "имя поля -> значение"
+            fields = [
+                (field, self._compile_at(self._field_path(field), self._compile_encoder, field_schema))
+                for field, field_schema in schema_to_use['value_type'].items()
             ]
-        
-        def subserialize_dict():
-            key_type = schema_to_use['value_type']['keys']
-            values_type = schema_to_use['value_type']['values']
-            res = {}
-            for key, value in object.items():
-                k = self._sub_serialize(
-                    key,
-                    key_type,
-                    n_tabs=n_tabs+1
-                )
-                v = self._sub_serialize(
-                    value,
-                    values_type,
-                    n_tabs=n_tabs+2
-                )
-                res[k] = v
-            
-            return res
-        
-        def subserialize_class():
-            parse_results = {}
-            for field in schema_to_use['value_type']:
-                #print("\t"*n_tabs + f"{field}:")
-                parse_results[field] = self._sub_serialize(
-                    getattr(object, field),
-                    schema_to_use['value_type'][field],
-                    n_tabs=n_tabs+1
-                )
-            
-            return parse_results
 
-        field_type = schema_to_use['type']
-        
+            if self.intern_strings:
+                # номер имени поля есть только в таблице строк текущего файла
+                encode_key = self._compile_plain_encoder("string")
+
+                def encode_interned_class(value, out: bytearray, state):
+                    out += prefix
+                    start = len(out)
+                    out += _ZERO_LEN
+                    for field, encode_field in fields:
+                        item_start = len(out)
+                        out += _ZERO_LEN
+                        encode_key(field, out, state)
+                        _pack_len(out, item_start, len(out) - item_start - 4)
+                        item_start = len(out)
+                        out += _ZERO_LEN
+                        encode_field(getattr(value, field), out, state)
+                        _pack_len(out, item_start, len(out) - item_start - 4)
+                    _pack_len(out, start, len(out) - start - 4)
+
+                return encode_interned_class
+
+            # иначе имена полей с длинами кодируются заранее
+            keyed_fields = []
+            for field, encode_field in fields:
+                key_coded = self._recursive_dictionary_encode(field)
+                keyed_fields.append((field, bytes(len(key_coded).to_bytes(4) + key_coded), encode_field))
+
+            def encode_class(value, out: bytearray, state):
+                out += prefix
+                start = len(out)
+                out += _ZERO_LEN
+                for field, key_bytes, encode_field in keyed_fields:
+                    out += key_bytes
+                    item_start = len(out)
+                    out += _ZERO_LEN
+                    encode_field(getattr(value, field), out, state)
+                    _pack_len(out, item_start, len(out) - item_start - 4)
+                _pack_len(out, start, len(out) - start - 4)
+
+            return encode_class
+
+        raise ValueError(f"Unknown schema type {field_type}")
+
+    def _compile_sized_encoder(self, schema_to_use):
+        # Пара функций для dump_into: size(value, state) - точный размер
+        # закодированного значения, write(value, buffer, pos, state) -> позиция
+        # за ним - запись на место в заранее выделенный буфер (pack_into
+        # и присваивание срезу). Типы, префиксы и struct берутся из тех же
+        # таблиц, что у _compile_plain_encoder, байты получаются те же
+        field_type, prefix, none_bytes = self._encoder_layout(schema_to_use)
+        size_value, write_value = self._compile_typed_sized_encoder(schema_to_use, field_type, prefix)
+        if none_bytes is None:
+            return size_value, write_value
+
+        def size_nullable(value, state) -> int:
+            return 2 if value is None else size_value(value, state)
+
+        def write_nullable(value, buffer, pos: int, state) -> int:
+            if value is None:
+                buffer[pos:pos + 2] = none_bytes
+                return pos + 2
+            return write_value(value, buffer, pos, state)
+
+        return size_nullable, write_nullable
+
+    def _compile_typed_sized_encoder(self, schema_to_use, field_type: str, prefix: bytes):
+        # Постоянные байты пишутся заранее собранными struct (pack_into),
+        # переменные - присваиванием срезу: оно в несколько раз медленнее
+        prefix_len = len(prefix)
+        pack_prefix = struct.Struct(f"{prefix_len}s").pack_into
+
+        if field_type == "string":
+            shorthands = {k: prefix + v for k, v in self.codes.items()}
+            pack_shorthand = struct.Struct(f"{prefix_len + 1}s").pack_into
+
+            if not self.intern_strings:
+                literal_prefix = prefix + self.missing_value
+                literal_len = prefix_len + 5
+                pack_literal = struct.Struct(f">{prefix_len + 1}sI").pack_into
+
+                def size_string(value: str, state) -> int:
+                    if value in shorthands:
+                        return prefix_len + 1
+                    if value.isascii():
+                        return literal_len + len(value)
+                    return literal_len + len(value.encode('utf-8'))
+
+                def write_string(value: str, buffer, pos: int, state) -> int:
+                    shorthand = shorthands.get(value)
+                    if shorthand is not None:
+                        pack_shorthand(buffer, pos, shorthand)
+                        return pos + prefix_len + 1
+                    encoded_string = value.encode('utf-8')
+                    pack_literal(buffer, pos, literal_prefix, len(encoded_string))
+                    pos += literal_len
+                    end = pos + len(encoded_string)
+                    buffer[pos:end] = encoded_string
+                    return end
+
+                return size_string, write_string
+
+            # Номера строк раздаются при подсчете размера,
+            # при записи они уже есть в таблице
+            ref_prefix = prefix + self.string_ref_value
+
+            def size_interned_string(value: str, state) -> int:
+                if value in shorthands:
+                    return prefix_len + 1
+                string_table = state.string_table
+                string_id = string_table.ids.get(value)
+                if string_id is None:
+                    string_id = string_table.add(value)
+                return prefix_len + 1 + _varint_size(string_id)
+
+            def write_interned_string(value: str, buffer, pos: int, state) -> int:
+                shorthand = shorthands.get(value)
+                if shorthand is not None:
+                    pack_shorthand(buffer, pos, shorthand)
+                    return pos + prefix_len + 1
+                pack_shorthand(buffer, pos, ref_prefix)
+                pos += prefix_len + 1
+                string_id = state.string_table.ids[value]
+                if string_id < 0x80:
+                    buffer[pos] = string_id
+                    return pos + 1
+                encoded_id = _encode_varint(string_id)
+                buffer[pos:pos + len(encoded_id)] = encoded_id
+                return pos + len(encoded_id)
+
+            return size_interned_string, write_interned_string
+
+        if field_type in _FIXED_SCALARS:
+            # префикс и значение - одним struct: порядок байтов и ширина
+            # значения те же, что у struct из _FIXED_SCALARS
+            packer = _FIXED_SCALARS[field_type]
+            byte_order = packer.format[0] if packer.format[0] in "<>!=" else "="
+            pack_value = struct.Struct(f"{byte_order}{prefix_len}s{packer.format.lstrip('@=<>!')}").pack_into
+            value_size = prefix_len + packer.size
+
+            def size_fixed_width(value, state) -> int:
+                return value_size
+
+            def write_fixed_width(value, buffer, pos: int, state) -> int:
+                pack_value(buffer, pos, prefix, value)
+                return pos + value_size
+
+            return size_fixed_width, write_fixed_width
+
+        if field_type in _VARINT_TYPES:
+            to_varint = _zigzag if field_type == "sint" else int
+
+            def size_varint(value: int, state) -> int:
+                return prefix_len + _varint_size(to_varint(value))
+
+            def write_varint(value: int, buffer, pos: int, state) -> int:
+                encoded_value = _encode_varint(to_varint(value))
+                pack_prefix(buffer, pos, prefix)
+                pos += prefix_len
+                buffer[pos:pos + len(encoded_value)] = encoded_value
+                return pos + len(encoded_value)
+
+            return size_varint, write_varint
+
+        if field_type == "bool":
+            pack_bool = struct.Struct(f"{prefix_len}s?").pack_into
+
+            def size_bool(value: bool, state) -> int:
+                return prefix_len + 1
+
+            def write_bool(value: bool, buffer, pos: int, state) -> int:
+                pack_bool(buffer, pos, prefix, value)
+                return pos + prefix_len + 1
+
+            return size_bool, write_bool
+
+        if field_type == "list":
+            size_item, write_item = self._compile_sized_encoder(schema_to_use['value_type'])
+
+            def size_list(value: list, state) -> int:
+                size = prefix_len + 4 + 4 * len(value)
+                for item in value:
+                    size += size_item(item, state)
+                return size
+
+            def write_list(value: list, buffer, pos: int, state) -> int:
+                pack_prefix(buffer, pos, prefix)
+                start = pos + prefix_len
+                pos = start + 4
+                for item in value:
+                    item_start = pos
+                    pos = write_item(item, buffer, pos + 4, state)
+                    _pack_len(buffer, item_start, pos - item_start - 4)
+                _pack_len(buffer, start, pos - start - 4)
+                return pos
+
+            return size_list, write_list
+
+        if field_type == "packed_list":
+            item_type = self._schema_type(schema_to_use['value_type'])
+            # после префикса - код типа элементов и их количество
+            prefix = prefix + self.codes[item_type]
+            header_len = len(prefix) + 4
+            pack_header = struct.Struct(f">{len(prefix)}sI").pack_into
+
+            def size_packed_list(value: list, state) -> int:
+                return header_len + _packed_array_size(item_type, value)
+
+            def write_packed_list(value: list, buffer, pos: int, state) -> int:
+                pack_header(buffer, pos, prefix, len(value))
+                pos += header_len
+                packed = _pack_array(item_type, value)
+                buffer[pos:pos + len(packed)] = packed
+                return pos + len(packed)
+
+            return size_packed_list, write_packed_list
+
+        if field_type == "dict":
+            size_key, write_key = self._compile_sized_encoder(schema_to_use['value_type']['keys'])
+            size_value, write_value = self._compile_sized_encoder(schema_to_use['value_type']['values'])
+
+            def size_dict(value: dict, state) -> int:
+                size = prefix_len + 4 + 8 * len(value)
+                for key, item in value.items():
+                    size += size_key(key, state) + size_value(item, state)
+                return size
+
+            def write_dict(value: dict, buffer, pos: int, state) -> int:
+                pack_prefix(buffer, pos, prefix)
+                start = pos + prefix_len
+                pos = start + 4
+                for key, item in value.items():
+                    item_start = pos
+                    pos = write_key(key, buffer, pos + 4, state)
+                    _pack_len(buffer, item_start, pos - item_start - 4)
+                    item_start = pos
+                    pos = write_value(item, buffer, pos + 4, state)
+                    _pack_len(buffer, item_start, pos - item_start - 4)
+                _pack_len(buffer, start, pos - start - 4)
+                return pos
+
+            return size_dict, write_dict
+
+        if field_type == "class":
+            # Как и в _compile_typed_encoder: при intern_strings имена полей -
+            # строки таблицы строк, иначе - заранее закодированные байты с длиной
+            fields = [
+                (field, *self._compile_sized_encoder(field_schema))
+                for field, field_schema in schema_to_use['value_type'].items()
+            ]
+
+            if self.intern_strings:
+                size_key, write_key = self._compile_sized_encoder("string")
+                fields_size = prefix_len + 4 + 8 * len(fields)
+
+                def size_interned_class(value, state) -> int:
+                    size = fields_size
+                    for field, size_field, _ in fields:
+                        size += size_key(field, state) + size_field(getattr(value, field), state)
+                    return size
+
+                def write_interned_class(value, buffer, pos: int, state) -> int:
+                    pack_prefix(buffer, pos, prefix)
+                    start = pos + prefix_len
+                    pos = start + 4
+                    for field, _, write_field in fields:
+                        item_start = pos
+                        pos = write_key(field, buffer, pos + 4, state)
+                        _pack_len(buffer, item_start, pos - item_start - 4)
+                        item_start = pos
+                        pos = write_field(getattr(value, field), buffer, pos + 4, state)
+                        _pack_len(buffer, item_start, pos - item_start - 4)
+                    _pack_len(buffer, start, pos - start - 4)
+                    return pos
+
+                return size_interned_class, write_interned_class
+
+            keyed_fields = []
+            for field, size_field, write_field in fields:
+                key_coded = self._recursive_dictionary_encode(field)
+                key_bytes = bytes(len(key_coded).to_bytes(4) + key_coded)
+                pack_key = struct.Struct(f"{len(key_bytes)}s").pack_into
+                keyed_fields.append((field, key_bytes, pack_key, size_field, write_field))
+            keys_size = prefix_len + 4 + sum(len(key_bytes) + 4 for _, key_bytes, _, _, _ in keyed_fields)
+
+            def size_class(value, state) -> int:
+                size = keys_size
+                for field, _, _, size_field, _ in keyed_fields:
+                    size += size_field(getattr(value, field), state)
+                return size
+
+            def write_class(value, buffer, pos: int, state) -> int:
+                pack_prefix(buffer, pos, prefix)
+                start = pos + prefix_len
+                pos = start + 4
+                for field, key_bytes, pack_key, _, write_field in keyed_fields:
+                    pack_key(buffer, pos, key_bytes)
+                    item_start = pos + len(key_bytes)
+                    pos = write_field(getattr(value, field), buffer, item_start + 4, state)
+                    _pack_len(buffer, item_start, pos - item_start - 4)
+                _pack_len(buffer, start, pos - start - 4)
+                return pos
+
+            return size_class, write_class
+
+        raise ValueError(f"Unknown schema type {field_type}")
+
+    def _compile_decoder(self, schema_to_use, projection: Union[Dict, None] = None):
+        decode = self._compile_plain_decoder(schema_to_use, projection)
+        if self.metrics is None:
+            return decode
+        return self.metrics.measured_decoder(self._compile_path, self._schema_type(schema_to_use), decode)
+
+    def _compile_plain_decoder(self, schema_to_use, projection: Union[Dict, None] = None):
+        field_type = self._schema_type(schema_to_use)
+
+        if field_type.startswith("nullable_"):
+            # 2 байта: тип + флаг None
+            decode_value = self._compile_typed_decoder(
+                schema_to_use, field_type[len("nullable_"):], 2, projection
+            )
+
+            def decode_nullable(buffer, pos: int, state):
+                if buffer[pos + 1] == 1:
+                    return None, pos + 2
+                return decode_value(buffer, pos, state)
+
+            if field_type[len("nullable_"):] not in _CONTAINER_TYPES:
+                return decode_nullable
+
+            # на месте контейнера может стоять ссылка (dedup), у нее второй
+            # байт - уже расстояние, а не флаг None
+            backref_code = self.codes['backref'][0]
+
+            def decode_nullable_container(buffer, pos: int, state):
+                if buffer[pos + 1] == 1 and buffer[pos] != backref_code:
+                    return None, pos + 2
+                return decode_value(buffer, pos, state)
+
+            return decode_nullable_container
+
+        return self._compile_typed_decoder(schema_to_use, field_type, 1, projection)
+
+    def _compile_typed_decoder(
+            self,
+            schema_to_use,
+            field_type: str,
+            skip: int,
+            projection: Union[Dict, None] = None
+    ):
+        # Каждый декодер получает буфер и позицию начала значения,
+        # возвращает (значение, позиция сразу за ним)
+        if projection is not None and field_type != "class":
+            raise ValueError(f"Can't select sub-fields of a {field_type}")
+
+        # Ссылка назад (dedup): тот же декодер читает поддерево
+        # с позиции первого вхождения, объекты создаются заново
+        backref_code = self.codes['backref'][0]
+
+        if field_type == "string":
+            inverse_codes = self.inverse_codes
+            missing_value_int = self.missing_value_int
+            string_ref_value_int = self.string_ref_value_int
+
+            def decode_string(buffer, pos: int, state):
+                pos += skip
+                shorthand_type = buffer[pos]
+                if shorthand_type != missing_value_int:
+                    if shorthand_type == string_ref_value_int:
+                        string_id, pos = _decode_varint(buffer, pos + 1)
+                        return state.string_table.strings[string_id], pos
+                    return inverse_codes[shorthand_type], pos + 1
+                string_len = _unpack_len(buffer, pos + 1)[0]
+                pos += 5
+                return str(buffer[pos:pos + string_len], 'utf-8'), pos + string_len
+
+            return decode_string
+
+        if field_type == "int":
+            def decode_int(buffer, pos: int, state):
+                pos += skip
+                return _unpack_len(buffer, pos)[0], pos + 4
+
+            return decode_int
+
+        if field_type == "float":
+            unpack_float = _FLOAT.unpack_from
+
+            def decode_float(buffer, pos: int, state):
+                pos += skip
+                return unpack_float(buffer, pos)[0], pos + 8
+
+            return decode_float
+
+        if field_type in _FIXED_WIDTH_TYPES:
+            unpack_fixed = _FIXED_WIDTH_TYPES[field_type].unpack_from
+            size = _FIXED_WIDTH_TYPES[field_type].size
+
+            def decode_fixed_width(buffer, pos: int, state):
+                pos += skip
+                return unpack_fixed(buffer, pos)[0], pos + size
+
+            return decode_fixed_width
+
+        if field_type == "varint":
+            def decode_varint(buffer, pos: int, state):
+                return _decode_varint(buffer, pos + skip)
+
+            return decode_varint
+
+        if field_type == "sint":
+            def decode_sint(buffer, pos: int, state):
+                value, pos = _decode_varint(buffer, pos + skip)
+                return _unzigzag(value), pos
+
+            return decode_sint
+
+        if field_type == "bool":
+            def decode_bool(buffer, pos: int, state):
+                pos += skip
+                return buffer[pos] == 1, pos + 1
+
+            return decode_bool
+
+        if field_type == "list":
+            decode_item = self._compile_at(
+                self._compile_path + "[]", self._compile_decoder, schema_to_use['value_type']
+            )
+
+            def decode_list(buffer, pos: int, state):
+                if buffer[pos] == backref_code:
+                    return _decode_backref(decode_list, buffer, pos, state)
+                pos += skip
+                end = pos + 4 + _unpack_len(buffer, pos)[0]
+                pos += 4
+                items = []
+                while pos < end:
+                    # длина элемента не нужна - границы знает декодер
+                    item, pos = decode_item(buffer, pos + 4, state)
+                    items.append(item)
+                return items, end
+
+            item_type = self._schema_type(schema_to_use['value_type'])
+            if item_type not in _PACKABLE_ITEM_TYPES:
+                return decode_list
+
+            # Список мог быть записан и упакованным, смотрим на байт типа
+            packed_codes = {self.codes['packed_list'][0], self.codes['nullable_packed_list'][0]}
+
+            def decode_list_or_packed(buffer, pos: int, state):
+                if buffer[pos] == backref_code:
+                    return _decode_backref(decode_list_or_packed, buffer, pos, state)
+                if buffer[pos] not in packed_codes:
+                    return decode_list(buffer, pos, state)
+                pos += skip + 1
+                return _unpack_array(item_type, buffer, pos + 4, _unpack_len(buffer, pos)[0])
+
+            return decode_list_or_packed
+
+        if field_type == "dict":
+            decode_key = self._compile_at(
+                self._compile_path + "{keys}", self._compile_decoder, schema_to_use['value_type']['keys']
+            )
+            decode_value = self._compile_at(
+                self._compile_path + "{}", self._compile_decoder, schema_to_use['value_type']['values']
+            )
+
+            def decode_dict(buffer, pos: int, state):
+                if buffer[pos] == backref_code:
+                    return _decode_backref(decode_dict, buffer, pos, state)
+                pos += skip
+                end = pos + 4 + _unpack_len(buffer, pos)[0]
+                pos += 4
+                res = {}
+                while pos < end:
+                    key, pos = decode_key(buffer, pos + 4, state)
+                    res[key], pos = decode_value(buffer, pos + 4, state)
+                return res, end
+
+            return decode_dict
+
+        if field_type == "class":
+            decode_key = self._compile_plain_decoder("string")
+            field_decoders = self._compile_field_decoders(schema_to_use, projection)
+            classname = schema_to_use['classname']
+            make_instance = None
+
+            def decode_class(buffer, pos: int, state):
+                nonlocal make_instance
+                if make_instance is None:
+                    make_instance = self._instance_factory(classname, projection is None)
+                if buffer[pos] == backref_code:
+                    return _decode_backref(decode_class, buffer, pos, state)
+                pos += skip
+                end = pos + 4 + _unpack_len(buffer, pos)[0]
+                pos += 4
+                class_instance = make_instance()
+                while pos < end:
+                    field, pos = decode_key(buffer, pos + 4, state)
+                    decode_field = field_decoders.get(field)
+                    if decode_field is None:
+                        # поле не запрошено - перескакиваем его по длине
+                        pos += 4 + _unpack_len(buffer, pos)[0]
+                        continue
+                    value, pos = decode_field(buffer, pos + 4, state)
+                    setattr(class_instance, field, value)
+                return class_instance, end
+
+            return decode_class
+
+        raise ValueError(f"Unknown schema type {field_type}")
+
+    def _resolve_class(self, classname: str) -> type:
+        if classname not in self.classes:
+            self.classes[classname] = getattr(sys.modules[self.module], classname)
+        return self.classes[classname]
+
+    def _instance_factory(self, classname: str, all_fields: bool):
+        # Если из данных будут записаны все поля, значения по умолчанию
+        # из __init__ не нужны - объект создается в обход него
+        classtype = self._resolve_class(classname)
+        if all_fields:
+            return partial(classtype.__new__, classtype)
+        return classtype
+
+    def _compile_field_decoders(self, schema_to_use, projection: Union[Dict, None] = None) -> Dict:
+        fields_schema = schema_to_use['value_type']
+        if projection is None:
+            return {
+                field: self._compile_at(self._field_path(field), self._compile_decoder, field_schema)
+                for field, field_schema in fields_schema.items()
+            }
+
+        unknown_fields = set(projection) - set(fields_schema)
+        if unknown_fields:
+            raise ValueError(f"{schema_to_use['classname']} has no fields {sorted(unknown_fields)}")
         return {
-            "list": subserialize_list,
-            "dict": subserialize_dict,
-            "class": subserialize_class,
-            "nullable_class": lambda: NullableItem(dict, None if object is None else subserialize_class()),
-            "nullable_list": lambda: NullableItem(list, None if object is None else subserialize_list()),
-            "nullable_dict": lambda: NullableItem(dict, None if object is None else subserialize_dict()),
-            "nullable_string": lambda: NullableItem(str, None if object is None else object),
-            "nullable_int": lambda: NullableItem(int, None if object is None else object),
-            "nullable_float": lambda: NullableItem(float, None if object is None else object)
-        }[field_type]()
-
-
-    def _recursive_dictionary_encode(self, item_to_code, n_tabs: int = 0) -> bytearray:
-        #start = "\t"*n_tabs + f"{item_to_code}: "
-        bytes_out = bytearray()
+            field: self._compile_at(
+                self._field_path(field), self._compile_decoder, fields_schema[field], sub_projection
+            )
+            for field, sub_projection in projection.items()
+        }
 
-        def bool_to_bytes(is_nullable=False):
-            if is_nullable:
-                is_item_none = item_to_code.item is None
-                if is_item_none:
-                    return self.codes['nullable_bool'] + int(is_item_none).to_bytes(1)
-                else:
-                    return self.codes['nullable_bool'] + int(is_item_none).to_bytes(1) + int(item_to_code.item).to_bytes(1)
-            # if not nullable
-            return self.codes['bool'] + int(item_to_code).to_bytes(1)
-        
-        def int_to_bytes(is_nullable=False):
-            if is_nullable:
-                is_item_none = item_to_code.item is None
-                if is_item_none:
-                    return self.codes['nullable_int'] + int(is_item_none).to_bytes(1)
-                else:
-                    return self.codes['nullable_int'] + int(is_item_none).to_bytes(1) + int.to_bytes(item_to_code.item, 4)
-            # if not nullable
-            return self.codes['int'] + int.to_bytes(item_to_code, 4)
-        
-        def float_to_bytes(is_nullable=False):
-            if is_nullable:
-                is_item_none = item_to_code.item is None
-                if is_item_none:
-                    return self.codes['nullable_float'] + int(is_item_none).to_bytes(1)
-                else:
-                    return self.codes['nullable_float'] + int(is_item_none).to_bytes(1) + bytearray(struct.pack("d", item_to_code.item))
-            # if not nullable
-            return self.codes['float'] + bytearray(struct.pack("d", item_to_code))
-        
-        def string_to_bytes(is_nullable=False):
-            bytes_to_add = self.codes.get(item_to_code.item if is_nullable else item_to_code, self.missing_value)
-            bytes_out.extend(self.codes['nullable_string' if is_nullable else 'string'])
-
-            if is_nullable:
-                is_item_none = item_to_code.item is None
-                bytes_out.extend(int(is_item_none).to_bytes(1))
-                if is_item_none:
-                    return bytes_out
-            
-            bytes_out.extend(bytes_to_add)
+    def _compile_lazy_decoder(self, schema_to_use, projection: Union[Dict, None] = None):
+        # Вместо объекта отдает LazyRecord: при разборе запоминаются только
+        # смещения полей, сами значения декодируются при первом обращении
+        decode_key = self._compile_plain_decoder("string")
+        field_decoders = self._compile_field_decoders(schema_to_use, projection)
+        classname = schema_to_use['classname']
+
+        backref_code = self.codes['backref'][0]
+
+        def decode_lazy(buffer, pos: int, state):
+            if buffer[pos] == backref_code:
+                return _decode_backref(decode_lazy, buffer, pos, state)
+            end = pos + 5 + _unpack_len(buffer, pos + 1)[0]
+            pos += 5
+            field_offsets = {}
+            while pos < end:
+                field, pos = decode_key(buffer, pos + 4, state)
+                decode_field = field_decoders.get(field)
+                if decode_field is not None:
+                    field_offsets[field] = (decode_field, pos + 4)
+                pos += 4 + _unpack_len(buffer, pos)[0]
+            return LazyRecord(classname, buffer, field_offsets, state), end
+
+        return decode_lazy
+
+    def _object_decoder(self, fields=None, lazy: bool = False):
+        # fields - нужные поля (список или одно имя), вложенные через точку: ["name", "basket.items"]
+        fields = _field_list(fields)
+        key = (fields, lazy)
+        if key not in self._object_decoders:
+            if self._schema_type(self.schema) != "class":
+                raise ValueError("Field selection and lazy mode need a class at the top of the schema")
+            projection = None if fields is None else _projection_tree(fields)
+            if lazy:
+                self._object_decoders[key] = self._compile_lazy_decoder(self.schema, projection)
+            else:
+                self._object_decoders[key] = self._compile_decoder(self.schema, projection)
+        return self._object_decoders[key]
+
+    def _reader_decoder(self, writer, fields=None, lazy: bool = False):
+        # Декодер записей, сделанных сериализатором writer, в объекты нашей схемы.
+        # План разрешения схем собирается один раз на пару (писатель, читатель).
+        # LazyRecord отдает поля так, как они записаны, без разрешения
+        if writer is self or lazy:
+            return writer._object_decoder(fields, lazy)
+        fields = _field_list(fields)
+        key = (writer.fingerprint, fields)
+        if key not in self._resolved_decoders:
+            projection = None if fields is None else _projection_tree(fields)
+            self._resolved_decoders[key] = writer._compile_resolving_decoder(
+                self, writer.schema, self.schema, projection
+            )
+        return self._resolved_decoders[key]
+
+    def _compile_resolving_decoder(self, reader, writer_schema, reader_schema, projection: Union[Dict, None] = None):
+        # self - сериализатор писателя (его коды, таблица строк и декодеры),
+        # reader - сериализатор, в классы которого собираются объекты.
+        # Новые поля класса получают default из схемы читателя (или значение
+        # из __init__ класса), удаленные - перескакиваются по длине
+        writer_type = self._schema_type(writer_schema)
+        reader_type = self._schema_type(reader_schema)
+        writer_nullable = writer_type.startswith("nullable_")
+        if writer_nullable:
+            if not reader_type.startswith("nullable_"):
+                raise ValueError(f"Can't read {writer_type} data as {reader_type}: it may hold None")
+            writer_base = self._not_nullable(writer_schema)
+        else:
+            writer_base = writer_schema
+        reader_base = self._not_nullable(reader_schema) if reader_type.startswith("nullable_") else reader_schema
+        field_type = self._schema_type(writer_base)
+        reader_type = self._schema_type(reader_base)
+        if projection is not None and reader_type != "class":
+            raise ValueError(f"Can't select sub-fields of a {reader_type}")
+
+        if field_type not in _CONTAINER_TYPES or field_type != reader_type:
+            convert = _promotion(field_type, reader_type)
+            decode_value = self._compile_decoder(writer_schema)
+            if convert is None:
+                return decode_value
+
+            def decode_promoted(buffer, pos: int, state):
+                value, pos = decode_value(buffer, pos, state)
+                return (value if value is None else convert(value)), pos
+
+            return decode_promoted
+
+        if writer_base == reader_base and not _contains_class(writer_base):
+            return self._compile_decoder(writer_schema)
+
+        skip = 2 if writer_nullable else 1
+        backref_code = self.codes['backref'][0]
+
+        if field_type == "list":
+            writer_item = writer_base['value_type']
+            reader_item = reader_base['value_type']
+            if self._schema_type(writer_item) in _PACKABLE_ITEM_TYPES:
+                # список чисел мог быть записан упакованным - читаем его
+                # обычным декодером и переводим значения
+                decode_items = self._compile_decoder(writer_schema)
+                convert = _promotion(self._schema_type(writer_item), self._schema_type(reader_item))
+                if convert is None:
+                    return decode_items
+
+                def decode_promoted_list(buffer, pos: int, state):
+                    items, pos = decode_items(buffer, pos, state)
+                    if items is None:
+                        return None, pos
+                    return [item if item is None else convert(item) for item in items], pos
+
+                return decode_promoted_list
+
+            decode_item = self._compile_resolving_decoder(reader, writer_item, reader_item)
+
+            def decode_list(buffer, pos: int, state):
+                if buffer[pos] == backref_code:
+                    return _decode_backref(decode_list, buffer, pos, state)
+                pos += skip
+                end = pos + 4 + _unpack_len(buffer, pos)[0]
+                pos += 4
+                items = []
+                while pos < end:
+                    item, pos = decode_item(buffer, pos + 4, state)
+                    items.append(item)
+                return items, end
+
+            decode = decode_list
+        elif field_type == "dict":
+            decode_key = self._compile_resolving_decoder(
+                reader, writer_base['value_type']['keys'], reader_base['value_type']['keys']
+            )
+            decode_value = self._compile_resolving_decoder(
+                reader, writer_base['value_type']['values'], reader_base['value_type']['values']
+            )
+
+            def decode_dict(buffer, pos: int, state):
+                if buffer[pos] == backref_code:
+                    return _decode_backref(decode_dict, buffer, pos, state)
+                pos += skip
+                end = pos + 4 + _unpack_len(buffer, pos)[0]
+                pos += 4
+                res = {}
+                while pos < end:
+                    key, pos = decode_key(buffer, pos + 4, state)
+                    res[key], pos = decode_value(buffer, pos + 4, state)
+                return res, end
+
+            decode = decode_dict
+        else:
+            writer_fields = writer_base['value_type']
+            reader_fields = reader_base['value_type']
+            if projection is None:
+                projection = dict.fromkeys(reader_fields)
+                all_fields = True
+            else:
+                unknown_fields = set(projection) - set(reader_fields)
+                if unknown_fields:
+                    raise ValueError(f"{reader_base['classname']} has no fields {sorted(unknown_fields)}")
+                all_fields = False
+            field_decoders = {
+                field: self._compile_resolving_decoder(reader, writer_fields[field], reader_fields[field], sub_projection)
+                for field, sub_projection in projection.items()
+                if field in writer_fields
+            }
+            defaults = {
+                field: reader_fields[field]['default']
+                for field in projection
+                if field not in writer_fields
+                and isinstance(reader_fields[field], dict)
+                and 'default' in reader_fields[field]
+            }
+            all_fields = all_fields and len(field_decoders) == len(projection)
+            decode_key = self._decode_key
+            classname = reader_base['classname']
+            make_instance = None
+
+            def decode_class(buffer, pos: int, state):
+                nonlocal make_instance
+                if make_instance is None:
+                    make_instance = reader._instance_factory(classname, all_fields)
+                if buffer[pos] == backref_code:
+                    return _decode_backref(decode_class, buffer, pos, state)
+                pos += skip
+                end = pos + 4 + _unpack_len(buffer, pos)[0]
+                pos += 4
+                class_instance = make_instance()
+                for field, value in defaults.items():
+                    setattr(class_instance, field, deepcopy(value))
+                while pos < end:
+                    field, pos = decode_key(buffer, pos + 4, state)
+                    decode_field = field_decoders.get(field)
+                    if decode_field is None:
+                        # поля нет в схеме читателя - перескакиваем его по длине
+                        pos += 4 + _unpack_len(buffer, pos)[0]
+                        continue
+                    value, pos = decode_field(buffer, pos + 4, state)
+                    setattr(class_instance, field, value)
+                return class_instance, end
+
+            decode = decode_class
+
+        if writer_nullable:
+            decode_value = decode
+
+            def decode_nullable(buffer, pos: int, state):
+                if buffer[pos + 1] == 1 and buffer[pos] != backref_code:
+                    return None, pos + 2
+                return decode_value(buffer, pos, state)
+
+            decode = decode_nullable
+        return decode
+
+    @staticmethod
+    def _not_nullable(schema_to_use):
+        field_type = Serializer._schema_type(schema_to_use)[len("nullable_"):]
+        if isinstance(schema_to_use, dict):
+            return {**schema_to_use, 'type': field_type}
+        return field_type
+
+    def _compile_column_encoder(self, schema_to_use):
+        # Колоночный кодировщик получает значения одного поля сразу у всех
+        # записей пачки и дописывает в columns закодированные колонки
+        # (в порядке обхода схемы в глубину). Вложенные списки и словари
+        # превращаются в колонку длин + колонки их "сплющенных" элементов,
+        # каждая колонка кодируется одной операцией
+        field_type = self._schema_type(schema_to_use)
+
+        if field_type.startswith("nullable_"):
+            encode_present = self._compile_column_encoder(self._not_nullable(schema_to_use))
+
+            def encode_nullable_column(values: list, columns: list):
+                columns.append(bytes(value is not None for value in values))
+                encode_present([value for value in values if value is not None], columns)
+
+            return encode_nullable_column
+
+        if field_type == "string":
+            # длины в символах + все строки одним куском utf-8
+            def encode_string_column(values: list, columns: list):
+                columns.append(
+                    _pack_array("int", list(map(len, values)))
+                    + "".join(values).encode('utf-8')
+                )
+
+            return encode_string_column
+
+        if field_type in _PACKABLE_ITEM_TYPES:
+            def encode_packed_column(values: list, columns: list):
+                columns.append(_pack_array(field_type, values))
+
+            return encode_packed_column
+
+        if field_type == "list":
+            encode_items = self._compile_column_encoder(schema_to_use['value_type'])
+
+            def encode_list_column(values: list, columns: list):
+                columns.append(_pack_array("int", list(map(len, values))))
+                encode_items(list(chain.from_iterable(values)), columns)
+
+            return encode_list_column
+
+        if field_type == "dict":
+            encode_keys = self._compile_column_encoder(schema_to_use['value_type']['keys'])
+            encode_values = self._compile_column_encoder(schema_to_use['value_type']['values'])
+
+            def encode_dict_column(values: list, columns: list):
+                columns.append(_pack_array("int", list(map(len, values))))
+                encode_keys(list(chain.from_iterable(values)), columns)
+                encode_values(list(chain.from_iterable(map(dict.values, values))), columns)
+
+            return encode_dict_column
+
+        if field_type == "class":
+            fields = [
+                (attrgetter(field), self._compile_column_encoder(field_schema))
+                for field, field_schema in schema_to_use['value_type'].items()
+            ]
 
-            if all([b1 == b2 for b1, b2 in zip(bytes_to_add, self.missing_value)]):
+            def encode_class_column(values: list, columns: list):
+                for get_field, encode_field in fields:
+                    encode_field(list(map(get_field, values)), columns)
+
+            return encode_class_column
+
+        raise ValueError(f"Unknown schema type {field_type}")
+
+    def _compile_column_decoder(self, schema_to_use):
+        # Обратная операция: берет из итератора columns свои колонки
+        # и возвращает список из count значений
+        field_type = self._schema_type(schema_to_use)
+
+        if field_type.startswith("nullable_"):
+            decode_present = self._compile_column_decoder(self._not_nullable(schema_to_use))
+
+            def decode_nullable_column(columns, count: int) -> list:
+                is_present = next(columns)
+                present = iter(decode_present(columns, sum(is_present)))
+                return [next(present) if flag else None for flag in is_present]
+
+            return decode_nullable_column
+
+        if field_type == "string":
+            def decode_string_column(columns, count: int) -> list:
+                column = next(columns)
+                lengths, pos = _unpack_array("int", column, 0, count)
+                return _split_by_lengths(str(column[pos:], 'utf-8'), lengths)
+
+            return decode_string_column
+
+        if field_type in _PACKABLE_ITEM_TYPES:
+            def decode_packed_column(columns, count: int) -> list:
+                values, _ = _unpack_array(field_type, next(columns), 0, count)
+                return values
+
+            return decode_packed_column
+
+        if field_type == "list":
+            decode_items = self._compile_column_decoder(schema_to_use['value_type'])
+
+            def decode_list_column(columns, count: int) -> list:
+                lengths, _ = _unpack_array("int", next(columns), 0, count)
+                return _split_by_lengths(decode_items(columns, sum(lengths)), lengths)
+
+            return decode_list_column
+
+        if field_type == "dict":
+            decode_keys = self._compile_column_decoder(schema_to_use['value_type']['keys'])
+            decode_values = self._compile_column_decoder(schema_to_use['value_type']['values'])
+
+            def decode_dict_column(columns, count: int) -> list:
+                lengths, _ = _unpack_array("int", next(columns), 0, count)
+                total = sum(lengths)
+                keys = decode_keys(columns, total)
+                values = decode_values(columns, total)
+                offsets = list(accumulate(lengths, initial=0))
+                return [
+                    dict(zip(keys[start:end], values[start:end]))
+                    for start, end in zip(offsets, offsets[1:])
+                ]
+
+            return decode_dict_column
+
+        if field_type == "class":
+            fields = [
+                (field, self._compile_column_decoder(field_schema))
+                for field, field_schema in schema_to_use['value_type'].items()
+            ]
+            classname = schema_to_use['classname']
+
+            def decode_class_column(columns, count: int) -> list:
+                make_instance = self._instance_factory(classname, True)
+                objects = [make_instance() for _ in range(count)]
+                for field, decode_field in fields:
+                    for class_instance, value in zip(objects, decode_field(columns, count)):
+                        setattr(class_instance, field, value)
+                return objects
+
+            return decode_class_column
+
+        raise ValueError(f"Unknown schema type {field_type}")
+
+    def _encode_scalar(self, item_to_code):
+        # Возвращает (байты, контейнер): для скаляров - все байты значения,
+        # для списков и словарей - только тип (и флаг None) и сам контейнер,
+        # элементы которого кодирует вызывающий
+        is_nullable = isinstance(item_to_code, NullableItem)
+        if is_nullable:
+            inner_type = item_to_code.inner_type
+            item = item_to_code.item
+        else:
+            item = item_to_code
+            # Очень важно тут разместить bool перед int
+            # т.к. isinstance(False, int) -> True
+            # но isinstance(1, bool) -> False
+            # т.е. булевы значения всегда будут считаться числами
+            # но числа никогда не будут считаться булами.
+            # поэтому если на вход пришел все-таки бул,
+            # надо рассматривать случай бул раньше случая целового числа
+            for inner_type in (bool, int, float, str, list, dict):
+                if isinstance(item, inner_type):
+                    break
+            else:
+                raise ValueError(f"Don't know how to serialize {item_to_code}")
+
+        type_name = {
+            bool: "bool", int: "int", float: "float", str: "string", list: "list", dict: "dict"
+        }.get(inner_type)
+        if type_name is None:
+            raise ValueError(f"Don't know how to serialize {item_to_code}")
+
+        bytes_out = bytearray(self.codes['nullable_' + type_name if is_nullable else type_name])
+        if is_nullable:
+            bytes_out.extend(int(item is None).to_bytes(1))
+            if item is None:
+                return bytes_out, None
+
+        if type_name == "bool":
+            bytes_out.extend(int(item).to_bytes(1))
+        elif type_name == "int":
+            bytes_out.extend(int.to_bytes(item, 4))
+        elif type_name == "float":
+            bytes_out.extend(struct.pack("d", item))
+        elif type_name == "string":
+            bytes_to_add = self.codes.get(item, self.missing_value)
+            bytes_out.extend(bytes_to_add)
+            if bytes_to_add == self.missing_value:
                 # Имя поля не найдено
-                # Следующие два байта укажут на длинну имени поля,
-                encoded_string = item_to_code.item.encode('utf-8') if is_nullable else item_to_code.encode('utf-8')
-                len_encoded_string = len(encoded_string)
-                bytes_out.extend(len_encoded_string.to_bytes(4))
-                # теперь само имя поля
+                # Следующие 4 байта укажут на длинну имени поля,
+                # дальше само имя поля
+                encoded_string = item.encode('utf-8')
+                bytes_out.extend(len(encoded_string).to_bytes(4))
                 bytes_out.extend(encoded_string)
-            
-            return bytes_out
-            
-        
-        def list_to_bytes(is_nullable=False):
-            bytes_out.extend(self.codes['nullable_list' if is_nullable else 'list'])
-            if is_nullable:
-                is_item_none = item_to_code.item is None
-                bytes_out.extend(int(is_item_none).to_bytes(1))
-                if is_item_none:
-                    return bytes_out
-            
-            # Иначе собираем список
-            list_bytes = bytearray()
-            
-            for item in (item_to_code.item if is_nullable else item_to_code):
-                item_bytes = self._recursive_dictionary_encode(
-                    item,
-                    n_tabs=n_tabs+1
-                )
-                list_bytes.extend(
-                    int.to_bytes(len(item_bytes), 4)
-                )
-                list_bytes.extend(item_bytes)
-            
-            bytes_out.extend(int.to_bytes(
-                len(list_bytes),
-                4
-            ))
-            bytes_out.extend(list_bytes)
-            return bytes_out
-        
-        def dict_to_bytes(is_nullable=False):
-            bytes_out.extend(self.codes['nullable_dict' if is_nullable else 'dict'])
-            if is_nullable:
-                is_item_none = item_to_code.item is None
-                bytes_out.extend(int(is_item_none).to_bytes(1))
-                if is_item_none:
-                    return bytes_out
-
-            bytes_dict = bytearray()
-            for key, value in (item_to_code.item if is_nullable else item_to_code).items():
-                key_coded = self._recursive_dictionary_encode(key, n_tabs=n_tabs+1)
-                value_coded = self._recursive_dictionary_encode(value, n_tabs=n_tabs+1)
-                bytes_dict.extend(len(key_coded).to_bytes(4))
-                bytes_dict.extend(key_coded)
-                bytes_dict.extend(len(value_coded).to_bytes(4))
-                bytes_dict.extend(value_coded)
-            
-            
-            bytes_out.extend(len(bytes_dict).to_bytes(4))
-            bytes_out.extend(bytes_dict)
-            #print(f"{start}: {bytes_out} as dict")
-            return bytes_out
-
-        # Очень важно тут разместить bool перед int
-        # т.к. isinstance(False, int) -> True
-        # но isinstance(1, bool) -> False
-        # т.е. булевы значения всегда будут считаться числами
-        # но числа никогда не будут считаться булами.
-        # поэтому если на вход пришел все-таки бул,
-        # надо рассматривать случай бул раньше случая целового числа
-        if isinstance(item_to_code, bool):
-            return bool_to_bytes()
-
-        if isinstance(item_to_code, int):
-            return int_to_bytes()
-        
-        if isinstance(item_to_code, float):
-            return float_to_bytes()
-        
-        if isinstance(item_to_code, str):
-            return string_to_bytes()
-
-        if isinstance(item_to_code, list):
-            return list_to_bytes()
-        
-        if isinstance(item_to_code, dict):
-            return dict_to_bytes()
-        
-        if isinstance(item_to_code, NullableItem):
-            if item_to_code.inner_type is bool:
-                return bool_to_bytes(is_nullable=True)
-            if item_to_code.inner_type is int:
-                return int_to_bytes(is_nullable=True)
-            if item_to_code.inner_type is float:
-                return float_to_bytes(is_nullable=True)
-            if item_to_code.inner_type is list:
-                return list_to_bytes(is_nullable=True)
-            if item_to_code.inner_type is dict:
-                return dict_to_bytes(is_nullable=True)
-            if item_to_code.inner_type is str:
-                return string_to_bytes(is_nullable=True)
-
-        raise ValueError(f"Don't know how to serialize {item_to_code}")
-    
-    def _recursive_dictionary_decode(self, item_to_decode, n_tabs: int = 0):
-        item_type = item_to_decode[0]   # первый байт - всегда тип
-
-        item_type_decoded = self.inverse_codes[item_type]
-
-        if item_type_decoded.startswith("nullable"):
-            if item_to_decode[1] == 1:
-                # объект = None
-                return None
+        else:
+            return bytes_out, item
+        return bytes_out, None
+
+    def _recursive_dictionary_encode(self, item_to_code) -> bytearray:
+        # Обход вложенных списков и словарей без рекурсии: на стеке лежат
+        # значения, которые еще нужно закодировать, и позиции длин,
+        # которые дописываются, когда контейнер закончился
+        bytes_out = bytearray()
+        stack = [(_ENCODE, item_to_code)]
+        while stack:
+            op, item = stack.pop()
+            if op == _CLOSE:
+                _pack_len(bytes_out, item, len(bytes_out) - item - 4)
+                continue
+            if op == _ENCODE_WITH_LEN:
+                stack.append((_CLOSE, len(bytes_out)))
+                bytes_out.extend(_ZERO_LEN)
+
+            item_bytes, container = self._encode_scalar(item)
+            bytes_out.extend(item_bytes)
+            if container is None:
+                continue
+            stack.append((_CLOSE, len(bytes_out)))
+            bytes_out.extend(_ZERO_LEN)
+            if isinstance(container, dict):
+                for key, value in reversed(container.items()):
+                    stack.append((_ENCODE_WITH_LEN, value))
+                    stack.append((_ENCODE_WITH_LEN, key))
             else:
-                item_type_decoded = item_type_decoded[len("nullable_"):]
-                item_to_decode = bytearray([item_to_decode[0]]) + item_to_decode[2:]
+                stack.extend([(_ENCODE_WITH_LEN, item) for item in reversed(container)])
+        return bytes_out
 
+    def _decode_scalar(self, item_type_decoded: str, item_to_decode, pos: int, state: CodingState):
         if item_type_decoded == "string":
             # следующий байт - является ли строка сокращенной версией
             # некоего ключевого слова из схемы
-            shorthand_type = item_to_decode[1]
+            shorthand_type = item_to_decode[pos]
             if shorthand_type == self.missing_value_int:
-                string_len = int.from_bytes(item_to_decode[2:6])
-                string_segment = item_to_decode[6:6+string_len].decode('utf-8')
-                #print("\t"*n_tabs + f"{item_type_decoded} {string_segment}")
-                return string_segment
-            else:
-                #print("\t"*n_tabs + f"{item_type_decoded} {self.inverse_codes[shorthand_type]}")
-                return self.inverse_codes[shorthand_type]
-        
+                string_len = _unpack_len(item_to_decode, pos + 1)[0]
+                pos += 5
+                return str(item_to_decode[pos:pos + string_len], 'utf-8'), pos + string_len
+            if shorthand_type == self.string_ref_value_int:
+                string_id, pos = _decode_varint(item_to_decode, pos + 1)
+                return state.string_table.strings[string_id], pos
+            return self.inverse_codes[shorthand_type], pos + 1
+
+        if item_type_decoded == "string_table":
+            count, pos = _decode_varint(item_to_decode, pos)
+            strings = []
+            for _ in range(count):
+                string_len, pos = _decode_varint(item_to_decode, pos)
+                strings.append(str(item_to_decode[pos:pos + string_len], 'utf-8'))
+                pos += string_len
+            return strings, pos
+
         if item_type_decoded == "bool":
-            #print("\t"*n_tabs + f"{item_type_decoded} {item_to_decode[1] == 1}")
-            return item_to_decode[1] == 1
+            return item_to_decode[pos] == 1, pos + 1
 
         if item_type_decoded == "int":
-            #print("\t"*n_tabs + f"{item_type_decoded} {int.from_bytes(item_to_decode[1:5])}")
-            return int.from_bytes(item_to_decode[1:5])
-        
+            return _unpack_len(item_to_decode, pos)[0], pos + 4
+
         if item_type_decoded == "float":
-            #print("\t"*n_tabs + f"{item_type_decoded} {struct.unpack('d', item_to_decode[1:9])}")
-            return struct.unpack("d", item_to_decode[1:9])[0]
-        
-        if item_type_decoded == "list":
-            len_in_bytes = int.from_bytes(item_to_decode[1:5])
-            under_segment = item_to_decode[5:5+len_in_bytes]
-            i = 4
-            seg_len = int.from_bytes(under_segment[0:4])
-            items = []
-            while i < len_in_bytes:
-                items.append(
-                    self._recursive_dictionary_decode(under_segment[i:i+seg_len], n_tabs=n_tabs+1)
-                )
-                i += seg_len
-                seg_len = int.from_bytes(under_segment[i:i+4])
-                i += 4
-
-            return items
-
-        if item_type_decoded == 'dict':
-            len_in_bytes = int.from_bytes(item_to_decode[1:5])
-            under_segment = item_to_decode[5:5+len_in_bytes]
-            keys = []
-            values = []
-            seg_len = int.from_bytes(under_segment[0:4])
-            
-            i = 4
-            while i < len_in_bytes:
-                #print("\t"*n_tabs + str(i))
-                #print(f"Segment length: {seg_len}")
-                #print("\t"*n_tabs + f"Decoding key {under_segment[i:i+seg_len]}")
-                keys.append(
-                    self._recursive_dictionary_decode(under_segment[i:i+seg_len], n_tabs=n_tabs+1)
-                )
-                i += seg_len
-                seg_len = int.from_bytes(under_segment[i:i+4])
-                i += 4
+            return _FLOAT.unpack_from(item_to_decode, pos)[0], pos + 8
 
-                #print("\t"*n_tabs + f"Decoding value {under_segment[i:i+seg_len]}")
-                values.append(
-                    self._recursive_dictionary_decode(under_segment[i:i+seg_len], n_tabs=n_tabs+1)
-                )
-                i += seg_len
-                seg_len = int.from_bytes(under_segment[i:i+4])
-                i += 4
-            
-            return dict(zip(keys, values))
+        if item_type_decoded in _FIXED_WIDTH_TYPES:
+            fixed = _FIXED_WIDTH_TYPES[item_type_decoded]
+            return fixed.unpack_from(item_to_decode, pos)[0], pos + fixed.size
 
+        if item_type_decoded == "varint":
+            return _decode_varint(item_to_decode, pos)
 
+        if item_type_decoded == "sint":
+            value, pos = _decode_varint(item_to_decode, pos)
+            return _unzigzag(value), pos
 
-    def serialize(self, object, out_path: Path):
-        results = self._sub_serialize(
-            object,
-            schema_to_use=self.schema,
-            n_tabs=0
-        )
+        if item_type_decoded == "packed_list":
+            item_type = self.inverse_codes[item_to_decode[pos]]
+            return _unpack_array(item_type, item_to_decode, pos + 5, _unpack_len(item_to_decode, pos + 1)[0])
 
-        out_content = {k: v for k, v in self.schema.items()}
-        out_content['object_data'] = results
+        raise ValueError(f"Don't know how to deserialize {item_type_decoded}")
+
+    def _recursive_dictionary_decode(self, item_to_decode, pos: int = 0, state: Union[CodingState, None] = None):
+        # item_to_decode - memoryview на весь буфер, pos - курсор,
+        # state - состояние чтения этого буфера (таблица строк).
+        # Вложенные значения читаются по смещениям, без срезов и копий
+        # и без рекурсии: открытые списки и словари лежат на стеке
+        # как [контейнер, конец, ключ], закончившийся контейнер
+        # снимается со стека и сам становится значением.
+        # Возвращает (значение, позиция сразу за ним)
+        if state is None:
+            state = CodingState()
+        stack = []
+        while True:
+            start = pos
+            item_type_decoded = self.inverse_codes[item_to_decode[pos]]   # первый байт - всегда тип
+            pos += 1
+            value = _NO_VALUE
+
+            if item_type_decoded == "backref":
+                # копия поддерева из первого вхождения
+                distance, pos = _decode_varint(item_to_decode, pos)
+                value, _ = self._recursive_dictionary_decode(item_to_decode, start - distance, state)
+                item_type_decoded = None
+
+            elif item_type_decoded.startswith("nullable"):
+                is_item_none = item_to_decode[pos]
+                pos += 1
+                if is_item_none == 1:
+                    # объект = None
+                    value = None
+                item_type_decoded = item_type_decoded[len("nullable_"):]
+
+            if value is not _NO_VALUE:
+                pass
+            elif item_type_decoded in ("list", "dict"):
+                end = pos + 4 + _unpack_len(item_to_decode, pos)[0]
+                pos += 4
+                stack.append([[] if item_type_decoded == "list" else {}, end, _NO_VALUE])
+            else:
+                value, pos = self._decode_scalar(item_type_decoded, item_to_decode, pos, state)
 
-        ser_res = self._recursive_dictionary_encode(out_content)
+            while True:
+                if value is not _NO_VALUE:
+                    if not stack:
+                        return value, pos
+                    frame = stack[-1]
+                    if isinstance(frame[0], list):
+                        frame[0].append(value)
+                    elif frame[2] is _NO_VALUE:
+                        frame[2] = value
+                    else:
+                        frame[0][frame[2]] = value
+                        frame[2] = _NO_VALUE
+
+                frame = stack[-1]
+                if pos < frame[1]:
+                    # пропускаем длину элемента - декодер сам знает, где он кончается
+                    pos += 4
+                    break
+                stack.pop()
+                value, pos = frame[0], frame[1]
+
+    def _encode_with_header(self, object) -> bytearray:
+        if self.intern_strings:
+            return self._encode_interned_with_header(object)
+
+        if not self.embed_schema:
+            ser_res = bytearray(self._fingerprint_header)
+            self._encode_object(object, ser_res, CodingState())
+            return ser_res
+
+        ser_res = bytearray(self._header)
+        self._encode_object(object, ser_res, CodingState())
+        _pack_len(ser_res, 1, len(ser_res) - 5)
+        _pack_len(ser_res, self._object_len_pos, len(ser_res) - self._object_len_pos - 4)
+        return ser_res
+
+    def _encode_interned_with_header(self, object) -> bytearray:
+        # Таблица строк известна только после кодирования объекта.
+        # Без схемы она пишется перед данными, со схемой - отдельным
+        # ключом string_table после object_data, чтобы заголовок
+        # оставался таким же, как без таблицы
+        state = CodingState()
+        object_data = bytearray()
+        self._encode_object(object, object_data, state)
+        string_table = state.string_table.encode(self.codes['string_table'])
+
+        if not self.embed_schema:
+            ser_res = bytearray(self._fingerprint_header)
+            ser_res += string_table
+            ser_res += object_data
+            return ser_res
+
+        ser_res = bytearray(self._header)
+        ser_res += object_data
+        _pack_len(ser_res, self._object_len_pos, len(object_data))
+        ser_res += self._string_table_key
+        ser_res += len(string_table).to_bytes(4)
+        ser_res += string_table
+        _pack_len(ser_res, 1, len(ser_res) - 5)
+        return ser_res
+
+    def _compress_file(self, ser_res: bytearray) -> bytearray:
+        if self.compression.codec_id == 0:
+            return ser_res
+        compressed = bytearray(_COMPRESSED_MAGIC)
+        compressed += self.compression.codec_id.to_bytes(1)
+        compressed += self.compression.compress(ser_res)
+        return compressed
+
+    def _encoded_size(self, object, state: CodingState):
+        # Размер файла целиком, размер объекта и (при intern_strings) таблица
+        # строк - ее заполняет сам подсчет размера
+        object_size = self._object_size(object, state)
+        string_table = b""
+        if self.intern_strings:
+            string_table = state.string_table.encode(self.codes['string_table'])
+        if not self.embed_schema:
+            return len(self._fingerprint_header) + len(string_table) + object_size, object_size, string_table
+        size = len(self._header) + object_size
+        if string_table:
+            size += len(self._string_table_key) + 4 + len(string_table)
+        return size, object_size, string_table
+
+    def _write_with_header(self, object, buffer, offset: int, state: CodingState, sizes) -> int:
+        # То же, что _encode_with_header, но сразу в буфер нужного размера
+        size, object_size, string_table = sizes
+        if not self.embed_schema:
+            pos = offset + len(self._fingerprint_header)
+            buffer[offset:pos] = self._fingerprint_header
+            buffer[pos:pos + len(string_table)] = string_table
+            self._write_object(object, buffer, pos + len(string_table), state)
+            return offset + size
+
+        pos = offset + len(self._header)
+        buffer[offset:pos] = self._header
+        _pack_len(buffer, offset + 1, size - 5)
+        _pack_len(buffer, offset + self._object_len_pos, object_size)
+        pos = self._write_object(object, buffer, pos, state)
+        if string_table:
+            buffer[pos:pos + len(self._string_table_key)] = self._string_table_key
+            pos += len(self._string_table_key)
+            _pack_len(buffer, pos, len(string_table))
+            buffer[pos + 4:pos + 4 + len(string_table)] = string_table
+        return offset + size
+
+    @staticmethod
+    def _check_fits(buffer, offset: int, size: int):
+        if offset + size > len(buffer):
+            raise ValueError(
+                f"Buffer is too small: need {size} bytes at offset {offset}, "
+                f"but only {len(buffer) - offset} are available"
+            )
+
+    def _sized_object_encoder(self) -> bool:
+        # Собирает пару size/write для всего объекта. С dedup размер зависит
+        # от уже записанного, metrics замеряет обычный кодировщик, а сжатию
+        # нужны все данные сразу - тогда пары нет
+        if self._object_size is None and not self.dedup and self.metrics is None and self.compression.codec_id == 0:
+            self._object_size, self._write_object = self._compile_sized_encoder(self.schema)
+        return self._object_size is not None
+
+    def dumps(self, object) -> bytearray:
+        # Объект в байты без временного файла. Сразу в растущий bytearray:
+        # так быстрее, чем считать размер заранее и писать на место
+        return self._compress_file(self._encode_with_header(object))
+
+    def dump_into(self, object, buffer, offset: int = 0) -> int:
+        # Запись в готовый буфер (bytearray, memoryview, mmap) с позиции offset.
+        # Размер считается заранее, и объект пишется прямо в buffer, без
+        # промежуточной копии. Возвращает позицию сразу за записанными данными
+        if not self._sized_object_encoder():
+            ser_res = self._compress_file(self._encode_with_header(object))
+            self._check_fits(buffer, offset, len(ser_res))
+            buffer[offset:offset + len(ser_res)] = ser_res
+            return offset + len(ser_res)
+        state = CodingState()
+        sizes = self._encoded_size(object, state)
+        self._check_fits(buffer, offset, sizes[0])
+        return self._write_with_header(object, buffer, offset, state, sizes)
+
+    def loads(self, buffer, fields=None, lazy: bool = False):
+        return self._decode_with_header(memoryview(buffer), fields, lazy)
+
+    def serialize(self, object, out_path: Path):
+        ser_res = self.dumps(object)
         with open(out_path, "wb") as f:
             f.write(ser_res)
 
+    def _read_header(self, content):
+        # Разбираем верхний словарь: все ключи, кроме object_data, -
+        # это схема, с которой был записан файл
+        end = 5 + _unpack_len(content, 1)[0]
+        pos = 5
+        schema = {}
+        data_pos = None
+        while pos < end:
+            key, pos = self._recursive_dictionary_decode(content, pos + 4)
+            if key == "object_data":
+                data_pos = pos + 4
+                pos += 4 + _unpack_len(content, pos)[0]
+            elif key == "string_table":
+                pos += 4 + _unpack_len(content, pos)[0]
+            else:
+                schema[key], pos = self._recursive_dictionary_decode(content, pos + 4)
 
-    def _sub_deserialize(self, object, schema_to_use: Union[Dict, None], n_tabs: int = 0):
-        if schema_to_use is None:
-            schema_to_use = self.schema
-            
-        if not isinstance(schema_to_use, dict):
-            return object
+        return schema, data_pos
 
-        field_type = schema_to_use['type']
-        if field_type.startswith("nullable_"):
-            if object is None:
-                return None
-            else:
-                field_type = field_type[len("nullable_"):]
+    def _header_schema_end(self, content) -> int:
+        # Позиция ключа object_data в верхнем словаре: все записи до него -
+        # схема. Записи перескакиваются по длинам, без разбора
+        end = 5 + _unpack_len(content, 1)[0]
+        pos = 5
+        while pos < end:
+            key_len = _unpack_len(content, pos)[0]
+            if content[pos + 4:pos + 4 + key_len] == self._object_key:
+                return pos
+            pos += 4 + key_len
+            pos += 4 + _unpack_len(content, pos)[0]
+        raise ValueError("No object_data in the file")
 
-        if field_type == "list":
-            val_type = schema_to_use['value_type']
-            return [
-                self._sub_deserialize(
-                    sub_obj,
-                    val_type,
-                    n_tabs=n_tabs+1
+    def _resolve_serializer(self, fingerprint: bytes, schema: Union[Dict, None] = None):
+        # Сериализатор для данных, записанных со схемой fingerprint:
+        # мы сами, собранный по переданной схеме писателя
+        # или найденный в реестре
+        if fingerprint == self.fingerprint:
+            return self
+        if schema is not None:
+            if fingerprint not in self._writer_serializers:
+                self._writer_serializers[fingerprint] = Serializer(
+                    schema,
+                    self.module,
+                    generate_classes=self.generate_classes
                 )
-                for sub_obj in object
-            ]
-        
-        if field_type == "dict":
-            key_type = schema_to_use['value_type']['keys']
-            values_type = schema_to_use['value_type']['values']
-            res = {}
-            for key, value in object.items():
-                k = self._sub_deserialize(
-                    key,
-                    key_type,
-                    n_tabs=n_tabs+1
-                )
-                v = self._sub_deserialize(
-                    value,
-                    values_type,
-                    n_tabs=n_tabs+2
-                )
-                res[k] = v
-            
+            return self._writer_serializers[fingerprint]
+        if self.registry is None:
+            raise ValueError(
+                f"Data was written with schema {fingerprint.hex()}, "
+                "but no schema registry was given to resolve it"
+            )
+        return self.registry.serializer(fingerprint, self.module, self.generate_classes)
+
+    def _read_string_table(self, content, pos: int):
+        # Таблица строк, если она есть на этой позиции
+        if pos < len(content) and content[pos] == self.codes['string_table'][0]:
+            return self._recursive_dictionary_decode(content, pos)
+        return None, pos
+
+    def _read_trailing_string_table(self, content, data_pos: int):
+        # Ключ string_table, идущий в верхнем словаре сразу за object_data
+        end = 5 + _unpack_len(content, 1)[0]
+        pos = data_pos + _unpack_len(content, data_pos - 4)[0]
+        if pos >= end:
+            return None
+        key, pos = self._recursive_dictionary_decode(content, pos + 4)
+        if key != "string_table":
+            return None
+        strings, _ = self._read_string_table(content, pos + 4)
+        return strings
+
+    def _decode_with_header(self, content: memoryview, fields=None, lazy: bool = False):
+        if content[:len(_COMPRESSED_MAGIC)] == _COMPRESSED_MAGIC:
+            codec = get_codec(content[len(_COMPRESSED_MAGIC)])
+            content = memoryview(codec.decompress(content[len(_COMPRESSED_MAGIC) + 1:]))
+
+        if content[:len(_FINGERPRINT_MAGIC)] == _FINGERPRINT_MAGIC:
+            data_pos = len(self._fingerprint_header)
+            fingerprint = bytes(content[len(_FINGERPRINT_MAGIC):data_pos])
+            writer = self._resolve_serializer(fingerprint)
+            strings, data_pos = self._read_string_table(content, data_pos)
+            res, _ = self._reader_decoder(writer, fields, lazy)(content, data_pos, CodingState(strings))
             return res
 
-        classname = getattr(sys.modules[self.module], schema_to_use['classname']) # globals()[schema_to_use['classname']]
-        class_instance = classname()
-
-        for field in schema_to_use['value_type']:
-            setattr(
-                class_instance,
-                field,
-                self._sub_deserialize(
-                    object[field],
-                    schema_to_use['value_type'][field],
-                    n_tabs=n_tabs+1
-                )
+        # Схема встроена в файл. Если она совпадает с нашей побайтово,
+        # разбирать ее не нужно - сразу переходим к данным
+        if content[5:self._object_len_pos] == self._header[5:self._object_len_pos]:
+            writer = self
+            data_pos = self._object_len_pos + 4
+        else:
+            # Иначе ищем отпечаток писателя по байтам его схемы
+            # и только для новой схемы разбираем ее и собираем декодер
+            schema_end = self._header_schema_end(content)
+            schema_bytes = bytes(content[5:schema_end])
+            fingerprint = self._writer_fingerprints.get(schema_bytes)
+            if fingerprint is None:
+                schema, data_pos = self._read_header(content)
+                fingerprint = schema_fingerprint(schema)
+                writer = self._resolve_serializer(fingerprint, schema)
+                self._writer_fingerprints[schema_bytes] = fingerprint
+            else:
+                writer = self if fingerprint == self.fingerprint else self._writer_serializers[fingerprint]
+                data_pos = schema_end + 4 + len(self._object_key) + 4
+
+        state = CodingState(self._read_trailing_string_table(content, data_pos))
+        res, _ = self._reader_decoder(writer, fields, lazy)(content, data_pos, state)
+        return res
+
+    def _columns(self):
+        if self._column_codecs is None:
+            self._column_codecs = (
+                self._compile_column_encoder(self.schema),
+                self._compile_column_decoder(self.schema)
             )
+        return self._column_codecs
+
+    def dumps_many(self, objects) -> bytearray:
+        # Пачка записей пишется по колонкам: все age подряд, все name подряд и т.д.
+        objects = list(objects)
+        columns = []
+        self._columns()[0](objects, columns)
+
+        column_data = bytearray()
+        for column in columns:
+            column_data += len(column).to_bytes(4)
+            column_data += column
+
+        schema_bytes = self._recursive_dictionary_encode(self.written_schema) if self.embed_schema else b""
+        ser_res = bytearray(_BATCH_MAGIC)
+        ser_res += self.compression.codec_id.to_bytes(1)
+        ser_res += self.fingerprint
+        ser_res += len(schema_bytes).to_bytes(4)
+        ser_res += schema_bytes
+        ser_res += len(objects).to_bytes(4)
+        ser_res += self.compression.compress(column_data)
+        return ser_res
+
+    def loads_many(self, buffer) -> list:
+        content = memoryview(buffer)
+        if content[:len(_BATCH_MAGIC)] != _BATCH_MAGIC:
+            raise ValueError("Data is not a columnar batch")
+        pos = len(_BATCH_MAGIC)
+        codec = get_codec(content[pos])
+        pos += 1
+        fingerprint = bytes(content[pos:pos + _FINGERPRINT_SIZE])
+        pos += _FINGERPRINT_SIZE
+        schema_len = _unpack_len(content, pos)[0]
+        pos += 4
+        schema = None
+        if schema_len:
+            schema, _ = self._recursive_dictionary_decode(content, pos)
+        pos += schema_len
+        count = _unpack_len(content, pos)[0]
+        column_data = memoryview(codec.decompress(content[pos + 4:]))
+
+        def iter_columns():
+            pos = 0
+            while pos < len(column_data):
+                column_len = _unpack_len(column_data, pos)[0]
+                pos += 4
+                yield column_data[pos:pos + column_len]
+                pos += column_len
 
-        return class_instance
+        writer = self._resolve_serializer(fingerprint, schema)
+        return writer._columns()[1](iter_columns(), count)
 
-    def deserialize(self, in_path: Path):
+    def serialize_many(self, objects, out_path: Path):
+        ser_res = self.dumps_many(objects)
+        with open(out_path, "wb") as f:
+            f.write(ser_res)
+
+    def deserialize_many(self, in_path: Path) -> list:
         with open(in_path, "rb") as r:
             content = r.read()
 
-        parsed_content = self._recursive_dictionary_decode(content)
-        
-        obj_data = parsed_content['object_data']
-        schema = {k: v for k, v in parsed_content.items() if k != "object_data"}
+        return self.loads_many(content)
+
+    def deserialize(self, in_path: Path, fields=None, lazy: bool = False):
+        # fields - читать только эти поля (остальные перескакиваются по длине),
+        # lazy - вернуть LazyRecord, декодирующий поля при обращении
+        with open(in_path, "rb") as r:
+            content = r.read()
 
-        res = self._sub_deserialize(obj_data, schema)
-        return res
\ No newline at end of file
+        return self.loads(content, fields, lazy)
@@ -0,0 +1,96 @@
+from typing import Callable, Dict
+from pathlib import Path
+import bz2
+import importlib.util
+import lzma
+import zlib
+
+
+# Сжатие блоков сериализатора. В заголовке файла хранится номер кодека,
+# так что читателю не нужно знать, с какими настройками писали файл.
+# Свои кодеки добавляются через register_codec.
+
+_codecs_by_name: Dict[str, "Codec"] = {}
+_codecs_by_id: Dict[int, "Codec"] = {}
+
+# Параметры LZ77 такие же, как в тестах третьей лабораторной
+LZ77_WINDOW_SIZE = 400
+LZ77_LOOKAHEAD_BUFFER_LEN = 15
+_ARCHIVER_PATH = Path(__file__).resolve().parent.parent / "thbd-lab-3" / "archiver.py"
+
+
+class Codec:
+    def __init__(
+            self,
+            codec_id: int,
+            name: str,
+            compress: Callable[[bytes], bytes],
+            decompress: Callable[[bytes], bytes]
+    ):
+        self.codec_id = codec_id
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+    def __repr__(self) -> str:
+        return f"Codec {self.name} ({self.codec_id})"
+
+
+def register_codec(codec_id: int, name: str, compress, decompress) -> Codec:
+    if not 0 <= codec_id <= 255:
+        raise ValueError(f"Codec id must fit into one byte, got {codec_id}")
+    if codec_id in _codecs_by_id and _codecs_by_id[codec_id].name != name:
+        raise ValueError(f"Codec id {codec_id} is already taken by {_codecs_by_id[codec_id].name}")
+    codec = Codec(codec_id, name, compress, decompress)
+    _codecs_by_name[name] = codec
+    _codecs_by_id[codec_id] = codec
+    return codec
+
+
+def get_codec(codec) -> Codec:
+    # codec - имя кодека или его номер из заголовка файла
+    if codec is None:
+        codec = "none"
+    if isinstance(codec, int):
+        if codec not in _codecs_by_id:
+            raise ValueError(f"Unknown compression codec id {codec}")
+        return _codecs_by_id[codec]
+    if codec not in _codecs_by_name:
+        raise ValueError(f"Unknown compression codec {codec}, available: {sorted(_codecs_by_name)}")
+    return _codecs_by_name[codec]
+
+
+def _load_archiver():
+    # LZ77 из thbd-lab-3/archiver.py; ему нужен bitarray
+    spec = importlib.util.spec_from_file_location("archiver", _ARCHIVER_PATH)
+    archiver = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(archiver)
+    return archiver
+
+
+_archiver = None
+
+
+def _lz77_compress(data: bytes) -> bytes:
+    global _archiver
+    if _archiver is None:
+        _archiver = _load_archiver()
+    return _archiver.compress_bytes(bytes(data), LZ77_WINDOW_SIZE, LZ77_LOOKAHEAD_BUFFER_LEN)
+
+
+def _lz77_decompress(data: bytes) -> bytes:
+    global _archiver
+    if _archiver is None:
+        _archiver = _load_archiver()
+    return _archiver.decompress_bytes(bytes(data))
+
+
+def _identity(data: bytes) -> bytes:
+    return data
+
+
+register_codec(0, "none", _identity, _identity)
+register_codec(1, "zlib", zlib.compress, zlib.decompress)
+register_codec(2, "lzma", lzma.compress, lzma.decompress)
+register_codec(3, "bz2", bz2.compress, bz2.decompress)
+register_codec(4, "lz77", _lz77_compress, _lz77_decompress)
@@ -0,0 +1,215 @@
+from typing import Union
+from pathlib import Path
+import os
+import struct
+
+from binary_serializer import Serializer, CodingState, schema_fingerprint
+from compression import get_codec
+
+
+# Файл-контейнер для множества записей (по образцу DataFileWriter из avro):
+#
+#   заголовок: MAGIC | номер кодека (1) | отпечаток схемы (8) | длина схемы (4) | схема
+#              | синхромаркер (16)
+#   блок:      число записей (4) | длина блока (4) | записи подряд | синхромаркер (16)
+#
+# Схема в заголовке пишется, только если сериализатор встраивает ее
+# в файлы (embed_schema=True), иначе длина = 0 и схема ищется по отпечатку.
+# Записи в блоке идут без разделителей - каждая запись сама знает свою длину.
+# Если сериализатор собирает таблицу строк (intern_strings=True), она пишется
+# в начале каждого блока, и номера строк действуют только внутри блока.
+# Если задан кодек сжатия (Serializer(..., compression=...)), каждый блок
+# (вместе с таблицей строк) сжимается отдельно, длина блока - уже сжатая.
+# Синхромаркер случайный для каждого файла и позволяет проверить,
+# что блок прочитан целиком и границы не съехали.
+CONTAINER_MAGIC = b"\xfeSCF"
+SYNC_SIZE = 16
+
+_BLOCK_HEADER = struct.Struct(">II")
+
+
+def _read_exactly(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError(f"Unexpected end of container: wanted {size} bytes, got {len(data)}")
+    return data
+
+
+def read_container_header(stream):
+    if _read_exactly(stream, len(CONTAINER_MAGIC)) != CONTAINER_MAGIC:
+        raise ValueError("Not a serializer container file")
+    codec = get_codec(_read_exactly(stream, 1)[0])
+    fingerprint = _read_exactly(stream, 8)
+    schema_len = int.from_bytes(_read_exactly(stream, 4))
+    schema_bytes = _read_exactly(stream, schema_len)
+    sync_marker = _read_exactly(stream, SYNC_SIZE)
+    return codec, fingerprint, schema_bytes, sync_marker
+
+
+def _block_string_table(serializer: Serializer, state: CodingState) -> bytes:
+    # Таблица строк блока, закодированного с состоянием state
+    if not serializer.intern_strings:
+        return b""
+    return state.string_table.encode(serializer.codes['string_table'])
+
+
+def encode_block(serializer: Serializer, objects):
+    # Кодирует записи в один блок контейнера, возвращает (число записей, байты блока)
+    state = CodingState()
+    block = bytearray()
+    record_count = 0
+    for object in objects:
+        serializer._encode_object(object, block, state)
+        record_count += 1
+    return record_count, _block_string_table(serializer, state) + block
+
+
+def decode_block(writer: Serializer, decode_object, record_count: int, block):
+    block = memoryview(block)
+    strings, pos = writer._read_string_table(block, 0)
+    state = CodingState(strings)
+    for _ in range(record_count):
+        record, pos = decode_object(block, pos, state)
+        yield record
+
+
+class ContainerWriter:
+    def __init__(
+            self,
+            out_path: Union[Path, str],
+            serializer: Serializer,
+            block_size: int = 64 * 1024,
+            append: bool = False
+    ):
+        # block_size - сколько байт записей копится в памяти,
+        # прежде чем блок уйдет на диск
+        self.serializer = serializer
+        self.block_size = block_size
+        self._block = bytearray()
+        self._block_count = 0
+        # состояние кодирования текущего блока (его таблица строк)
+        self._state = CodingState()
+
+        if append and os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+            self._stream = open(out_path, "r+b")
+            self.codec, fingerprint, _, self.sync_marker = read_container_header(self._stream)
+            if fingerprint != serializer.fingerprint:
+                self._stream.close()
+                raise ValueError(
+                    f"Can't append to {out_path}: it was written with schema "
+                    f"{fingerprint.hex()}, serializer has {serializer.fingerprint.hex()}"
+                )
+            self._stream.seek(0, os.SEEK_END)
+        else:
+            self._stream = open(out_path, "wb")
+            self.codec = serializer.compression
+            self.sync_marker = os.urandom(SYNC_SIZE)
+            schema_bytes = b""
+            if serializer.embed_schema:
+                schema_bytes = serializer._recursive_dictionary_encode(serializer.written_schema)
+            self._stream.write(CONTAINER_MAGIC)
+            self._stream.write(self.codec.codec_id.to_bytes(1))
+            self._stream.write(serializer.fingerprint)
+            self._stream.write(len(schema_bytes).to_bytes(4))
+            self._stream.write(schema_bytes)
+            self._stream.write(self.sync_marker)
+
+    def append(self, object):
+        self.serializer._encode_object(object, self._block, self._state)
+        self._block_count += 1
+        if len(self._block) >= self.block_size:
+            self.flush()
+
+    def extend(self, objects):
+        for object in objects:
+            self.append(object)
+
+    def flush(self):
+        if self._block_count == 0:
+            return
+        self.write_block(self._block_count, _block_string_table(self.serializer, self._state) + self._block)
+        self._block = bytearray()
+        self._block_count = 0
+        self._state = CodingState()
+
+    def write_block(self, record_count: int, block: bytes, compressed: bool = False):
+        # Готовый блок (например, закодированный в другом процессе, см. parallel.py).
+        # compressed=True - блок уже сжат кодеком этого файла
+        if not compressed:
+            block = self.codec.compress(block)
+        self._stream.write(_BLOCK_HEADER.pack(record_count, len(block)))
+        self._stream.write(block)
+        self._stream.write(self.sync_marker)
+        self._stream.flush()
+
+    def close(self):
+        if self._stream.closed:
+            return
+        self.flush()
+        self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ContainerReader:
+    def __init__(
+            self,
+            in_path: Union[Path, str],
+            serializer: Serializer,
+            fields=None,
+            lazy: bool = False
+    ):
+        # fields и lazy - как у Serializer.deserialize
+        self.serializer = serializer
+        self._stream = open(in_path, "rb")
+        self.codec, fingerprint, schema_bytes, self.sync_marker = read_container_header(self._stream)
+
+        schema = None
+        if schema_bytes:
+            schema, _ = serializer._recursive_dictionary_decode(memoryview(schema_bytes))
+            if schema_fingerprint(schema) != fingerprint:
+                raise ValueError("Container header is corrupted: schema doesn't match its fingerprint")
+        self.fingerprint = fingerprint
+        self.schema = schema
+        self._writer = serializer._resolve_serializer(fingerprint, schema)
+        # схема писателя: встроенная в файл или найденная в реестре
+        self.writer_schema = self._writer.schema
+        self._decode_object = serializer._reader_decoder(self._writer, fields, lazy)
+
+    def iter_blocks(self, decompress: bool = True):
+        # Отдает блоки по одному: (число записей, байты блока).
+        # decompress=False - отдать блоки сжатыми (распакует тот, кто будет декодировать)
+        while True:
+            block_header = self._stream.read(_BLOCK_HEADER.size)
+            if not block_header:
+                return
+            if len(block_header) != _BLOCK_HEADER.size:
+                raise ValueError("Unexpected end of container inside a block header")
+            record_count, block_len = _BLOCK_HEADER.unpack(block_header)
+            block = _read_exactly(self._stream, block_len)
+            if _read_exactly(self._stream, SYNC_SIZE) != self.sync_marker:
+                raise ValueError("Container is corrupted: sync marker mismatch")
+            yield record_count, self.codec.decompress(block) if decompress else block
+
+    def __iter__(self):
+        # В памяти одновременно держится только текущий блок
+        for record_count, block in self.iter_blocks():
+            yield from decode_block(self._writer, self._decode_object, record_count, block)
+
+    def close(self):
+        self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_records(in_path: Union[Path, str], serializer: Serializer, fields=None, lazy: bool = False):
+    with ContainerReader(in_path, serializer, fields, lazy) as reader:
+        yield from reader
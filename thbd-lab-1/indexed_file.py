@@ -0,0 +1,211 @@
+from typing import Union
+from pathlib import Path
+from array import array
+import mmap
+import struct
+import sys
+
+from binary_serializer import Serializer, CodingState, schema_fingerprint
+
+
+# Файл с индексом для произвольного доступа к записям:
+#
+#   MAGIC | отпечаток схемы (8) | длина схемы (4) | схема
+#   | записи подряд
+#   | [таблица строк, если intern_strings]
+#   | смещения записей: uint64 x N
+#   | [индекс по ключу: смещения ключей uint64 x (N + 1) | номера записей uint64 x N | ключи подряд]
+#   | хвост: позиция смещений | N | позиция индекса | позиция таблицы строк | MAGIC
+#
+# Числа индекса и хвоста - little-endian, 0 в позиции - "раздела нет".
+# Ключи в индексе отсортированы, поиск по ним - бинарный прямо по mmap,
+# так что файл не читается в память целиком ни при открытии, ни при поиске.
+INDEXED_MAGIC = b"\xfeSIF"
+
+_TRAILER = struct.Struct("<QQQQ4s")
+_U64 = struct.Struct("<Q")
+
+
+def _encode_key(key) -> bytes:
+    # Ключ нужен только для сравнения на равенство, поэтому годится repr
+    return repr(key).encode('utf-8')
+
+
+def _pack_u64(values) -> bytes:
+    packed = array("Q", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+class IndexedWriter:
+    def __init__(
+            self,
+            out_path: Union[Path, str],
+            serializer: Serializer,
+            key_field: Union[str, None] = None
+    ):
+        # key_field - поле верхнего уровня, по которому строится индекс для get()
+        self.serializer = serializer
+        self.key_field = key_field
+        self._offsets = []
+        self._keys = []
+        # состояние кодирования всего файла: таблица строк у файла одна
+        self._state = CodingState()
+
+        schema_bytes = b""
+        if serializer.embed_schema:
+            schema_bytes = serializer._recursive_dictionary_encode(serializer.written_schema)
+        self._stream = open(out_path, "wb")
+        self._stream.write(INDEXED_MAGIC)
+        self._stream.write(serializer.fingerprint)
+        self._stream.write(len(schema_bytes).to_bytes(4))
+        self._stream.write(schema_bytes)
+        self._pos = self._stream.tell()
+
+    def append(self, object):
+        record = bytearray()
+        # ссылки dedup могут вести в предыдущие записи - позиции считаются от начала файла
+        self._state.base = self._pos
+        self.serializer._encode_object(object, record, self._state)
+        if self.key_field is not None:
+            self._keys.append((_encode_key(getattr(object, self.key_field)), len(self._offsets)))
+        self._offsets.append(self._pos)
+        self._stream.write(record)
+        self._pos += len(record)
+
+    def extend(self, objects):
+        for object in objects:
+            self.append(object)
+
+    def close(self):
+        if self._stream.closed:
+            return
+
+        strings_pos = 0
+        if self.serializer.intern_strings:
+            strings_pos = self._pos
+            self._pos += self._stream.write(
+                self._state.string_table.encode(self.serializer.codes['string_table'])
+            )
+
+        offsets_pos = self._pos
+        self._pos += self._stream.write(_pack_u64(self._offsets))
+
+        keys_pos = 0
+        if self.key_field is not None:
+            keys_pos = self._pos
+            self._keys.sort()
+            key_offsets = [0]
+            for key, _ in self._keys:
+                key_offsets.append(key_offsets[-1] + len(key))
+            self._pos += self._stream.write(_pack_u64(key_offsets))
+            self._pos += self._stream.write(_pack_u64(record for _, record in self._keys))
+            self._pos += self._stream.write(b"".join(key for key, _ in self._keys))
+
+        self._stream.write(_TRAILER.pack(offsets_pos, len(self._offsets), keys_pos, strings_pos, INDEXED_MAGIC))
+        self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class IndexedReader:
+    def __init__(
+            self,
+            in_path: Union[Path, str],
+            serializer: Serializer,
+            fields=None,
+            lazy: bool = False
+    ):
+        # fields и lazy - как у Serializer.deserialize
+        self._file = open(in_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        buffer = self._buffer
+
+        if buffer[:len(INDEXED_MAGIC)] != INDEXED_MAGIC:
+            raise ValueError(f"{in_path} is not an indexed serializer file")
+        (
+            self._offsets_pos,
+            self._count,
+            self._keys_pos,
+            strings_pos,
+            end_magic
+        ) = _TRAILER.unpack_from(buffer, len(buffer) - _TRAILER.size)
+        if end_magic != INDEXED_MAGIC:
+            raise ValueError(f"{in_path} has no index trailer: the file was not closed properly")
+
+        pos = len(INDEXED_MAGIC)
+        fingerprint = bytes(buffer[pos:pos + 8])
+        schema_len = int.from_bytes(buffer[pos + 8:pos + 12])
+        schema = None
+        if schema_len:
+            schema, _ = serializer._recursive_dictionary_decode(buffer, pos + 12)
+            if schema_fingerprint(schema) != fingerprint:
+                raise ValueError("Indexed file header is corrupted: schema doesn't match its fingerprint")
+
+        self._writer = serializer._resolve_serializer(fingerprint, schema)
+        self._decode_object = serializer._reader_decoder(self._writer, fields, lazy)
+        self._strings = None
+        if strings_pos:
+            self._strings, _ = serializer._read_string_table(buffer, strings_pos)
+
+        if self._keys_pos:
+            self._key_records_pos = self._keys_pos + 8 * (self._count + 1)
+            self._key_blob_pos = self._key_records_pos + 8 * self._count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(f"Record {index} is out of range, file has {self._count} records")
+        record_pos = _U64.unpack_from(self._buffer, self._offsets_pos + 8 * index)[0]
+        # своя таблица строк у каждого чтения: ленивые записи
+        # и другие файлы того же сериализатора ее не трогают
+        record, _ = self._decode_object(self._buffer, record_pos, CodingState(self._strings))
+        return record
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def _key_at(self, position: int):
+        start, end = struct.unpack_from("<QQ", self._buffer, self._keys_pos + 8 * position)
+        return bytes(self._buffer[self._key_blob_pos + start:self._key_blob_pos + end])
+
+    def get(self, key, default=None):
+        if not self._keys_pos:
+            raise ValueError("File was written without a key index (IndexedWriter(..., key_field=...))")
+        key = _encode_key(key)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count or self._key_at(low) != key:
+            return default
+        return self[_U64.unpack_from(self._buffer, self._key_records_pos + 8 * low)[0]]
+
+    def close(self):
+        self._buffer = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Ленивые записи еще держат ссылки на файл - mmap закроется вместе с ними
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,118 @@
+from typing import Dict
+from time import perf_counter_ns
+import json
+
+
+# Счетчики сериализатора: Serializer(..., metrics=SerializerMetrics()).
+# Кодировщик/декодировщик каждого поля схемы оборачивается замером,
+# без metrics обертки не создаются вовсе и ничего не стоят.
+#
+# По полям (путь вида basket.combos, вложенные элементы - items[],
+# значения словаря - combos{}, ключи - combos{keys}) копятся число вызовов,
+# полное время вместе с вложенными полями и число байт.
+# По типам схемы - число вызовов и собственное время без вложенных,
+# чтобы сумма по типам была равна общему времени
+
+_ROOT_PATH = "<object>"
+
+
+class SerializerMetrics:
+    def __init__(self):
+        self.fields = {}
+        self.types = {}
+        # время уже измеренных вложенных значений для каждого открытого замера
+        self._nested = []
+
+    def reset(self):
+        # Обертки держат ссылки на счетчики, поэтому обнуляем их на месте
+        for stats in list(self.fields.values()) + list(self.types.values()):
+            for counters in (stats["encode"], stats["decode"]):
+                counters[:] = [0] * len(counters)
+        self._nested.clear()
+
+    def _field_stats(self, path: str, field_type: str) -> Dict:
+        path = path or _ROOT_PATH
+        if path not in self.fields:
+            # [число, время нс, байты]
+            self.fields[path] = {"type": field_type, "encode": [0, 0, 0], "decode": [0, 0, 0]}
+        return self.fields[path]
+
+    def _type_stats(self, field_type: str) -> Dict:
+        if field_type not in self.types:
+            # [число, собственное время нс]
+            self.types[field_type] = {"encode": [0, 0], "decode": [0, 0]}
+        return self.types[field_type]
+
+    def measured_encoder(self, path: str, field_type: str, encode):
+        field_counters = self._field_stats(path, field_type)["encode"]
+        type_counters = self._type_stats(field_type)["encode"]
+        nested = self._nested
+
+        def encode_measured(value, out: bytearray, state):
+            size = len(out)
+            nested.append(0)
+            start = perf_counter_ns()
+            try:
+                encode(value, out, state)
+            finally:
+                elapsed = perf_counter_ns() - start
+                inner = nested.pop()
+                if nested:
+                    nested[-1] += elapsed
+            field_counters[0] += 1
+            field_counters[1] += elapsed
+            field_counters[2] += len(out) - size
+            type_counters[0] += 1
+            type_counters[1] += elapsed - inner
+
+        return encode_measured
+
+    def measured_decoder(self, path: str, field_type: str, decode):
+        field_counters = self._field_stats(path, field_type)["decode"]
+        type_counters = self._type_stats(field_type)["decode"]
+        nested = self._nested
+
+        def decode_measured(buffer, pos: int, state):
+            nested.append(0)
+            start = perf_counter_ns()
+            try:
+                value, end = decode(buffer, pos, state)
+            finally:
+                elapsed = perf_counter_ns() - start
+                inner = nested.pop()
+                if nested:
+                    nested[-1] += elapsed
+            field_counters[0] += 1
+            field_counters[1] += elapsed
+            field_counters[2] += end - pos
+            type_counters[0] += 1
+            type_counters[1] += elapsed - inner
+            return value, end
+
+        return decode_measured
+
+    def to_dict(self) -> Dict:
+        return {
+            "fields": {
+                path: {
+                    "type": stats["type"],
+                    **{
+                        op: {"count": count, "time_ns": time_ns, "bytes": size}
+                        for op in ("encode", "decode")
+                        for count, time_ns, size in [stats[op]]
+                    }
+                }
+                for path, stats in self.fields.items()
+            },
+            "types": {
+                field_type: {
+                    op: {"count": count, "self_time_ns": time_ns}
+                    for op in ("encode", "decode")
+                    for count, time_ns in [stats[op]]
+                }
+                for field_type, stats in self.types.items()
+            }
+        }
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent, ensure_ascii=False)
@@ -0,0 +1,132 @@
+from typing import Dict, Union
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+
+from binary_serializer import Serializer
+from container import ContainerWriter, ContainerReader, encode_block, decode_block
+from compression import get_codec
+
+
+# Параллельная сериализация больших наборов записей.
+# Записи режутся на куски по chunk_size, куски кодируются в пуле процессов
+# (схема компилируется один раз на процесс, в initializer) и пишутся
+# блоками контейнера (container.py) строго в исходном порядке.
+# Сжатие и распаковка блоков тоже делаются в дочерних процессах.
+# Классы записей должны находиться в дочерних процессах по caller_module_name.
+# Реестр схем (registry) нужен только главному процессу: дочерним
+# передается уже найденная схема писателя.
+
+_worker_serializer = None
+_worker_decoder = None
+_worker_codec = None
+
+
+def _init_encoder(schema: Dict, caller_module_name, serializer_options: Dict):
+    global _worker_serializer
+    _worker_serializer = Serializer(schema, caller_module_name, **serializer_options)
+
+
+def _encode_chunk(objects: list):
+    record_count, block = encode_block(_worker_serializer, objects)
+    return record_count, _worker_serializer.compression.compress(block)
+
+
+def _init_decoder(
+        schema: Dict,
+        caller_module_name,
+        serializer_options: Dict,
+        fingerprint: bytes,
+        writer_schema: Dict,
+        fields,
+        codec_id: int
+):
+    global _worker_serializer, _worker_decoder, _worker_codec
+    _worker_codec = get_codec(codec_id)
+    serializer = Serializer(schema, caller_module_name, **serializer_options)
+    _worker_serializer = serializer._resolve_serializer(fingerprint, writer_schema)
+    _worker_decoder = serializer._reader_decoder(_worker_serializer, fields)
+
+
+def _decode_chunk(task):
+    record_count, block = task
+    block = _worker_codec.decompress(block)
+    return list(decode_block(_worker_serializer, _worker_decoder, record_count, block))
+
+
+def _chunked(objects, chunk_size: int):
+    objects = iter(objects)
+    while True:
+        chunk = list(islice(objects, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _ordered_map(executor: ProcessPoolExecutor, function, tasks, window: int):
+    # Как executor.map, но в работе одновременно не больше window задач,
+    # так что вход может быть ленивым и сколь угодно большим
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(function, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def serialize_parallel(
+        objects,
+        out_path: Union[Path, str],
+        schema: Dict,
+        caller_module_name,
+        chunk_size: int = 10000,
+        max_workers: Union[int, None] = None,
+        registry=None,
+        **serializer_options
+):
+    max_workers = max_workers or os.cpu_count()
+    serializer = Serializer(schema, caller_module_name, registry=registry, **serializer_options)
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_encoder,
+        initargs=(schema, caller_module_name, serializer_options)
+    ) as executor, ContainerWriter(out_path, serializer) as writer:
+        for record_count, block in _ordered_map(
+            executor, _encode_chunk, _chunked(objects, chunk_size), 2 * max_workers
+        ):
+            writer.write_block(record_count, block, compressed=True)
+
+
+def deserialize_parallel(
+        in_path: Union[Path, str],
+        schema: Dict,
+        caller_module_name,
+        fields=None,
+        max_workers: Union[int, None] = None,
+        registry=None,
+        **serializer_options
+):
+    # Генератор: блоки контейнера декодируются в пуле, записи отдаются по порядку.
+    # Схему писателя, не встроенную в файл, находит в реестре главный процесс
+    max_workers = max_workers or os.cpu_count()
+    serializer = Serializer(schema, caller_module_name, registry=registry, **serializer_options)
+    with ContainerReader(in_path, serializer) as reader, ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_decoder,
+        initargs=(
+            schema,
+            caller_module_name,
+            serializer_options,
+            reader.fingerprint,
+            reader.writer_schema,
+            fields,
+            reader.codec.codec_id
+        )
+    ) as executor:
+        for records in _ordered_map(
+            executor, _decode_chunk, reader.iter_blocks(decompress=False), 2 * max_workers
+        ):
+            yield from records
@@ -0,0 +1,110 @@
+from typing import Dict, Union
+import sys
+
+
+# Классы записей, собранные прямо по yaml схеме (вместо написанных руками
+# в classes.py). У них __slots__ вместо __dict__, поэтому миллионы
+# прочитанных записей занимают в памяти заметно меньше.
+# Созданные классы кладутся в этот модуль под именем "classname_отпечаток
+# схемы класса", чтобы их экземпляры можно было передавать между процессами
+# через pickle, а одноименные классы разных схем не затирали друг друга.
+
+_SCALAR_DEFAULTS = {
+    "string": str,
+    "bool": bool,
+    "int": int,
+    "varint": int,
+    "sint": int,
+    "int8": int,
+    "int16": int,
+    "int64": int,
+    "float": float,
+    "float32": float,
+}
+
+
+def _none():
+    return None
+
+
+def _default_factory(schema_to_use, classes: Dict):
+    field_type = schema_to_use['type'] if isinstance(schema_to_use, dict) else schema_to_use
+    if field_type.startswith("nullable_"):
+        return _none
+    if field_type == "list":
+        return list
+    if field_type == "dict":
+        return dict
+    if field_type == "class":
+        return classes[schema_to_use['classname']]
+    return _SCALAR_DEFAULTS[field_type]
+
+
+def make_record_class(classname: str, defaults: Dict, global_name: Union[str, None] = None) -> type:
+    # defaults - "имя поля -> фабрика значения по умолчанию",
+    # global_name - имя класса в этом модуле (по нему его найдет pickle)
+    if global_name is None:
+        global_name = classname
+    existing_class = getattr(sys.modules[__name__], global_name, None)
+    if isinstance(existing_class, type):
+        return existing_class
+    field_names = tuple(defaults)
+
+    def __init__(self, **values):
+        unknown_fields = set(values) - set(field_names)
+        if unknown_fields:
+            raise TypeError(f"{classname} has no fields {sorted(unknown_fields)}")
+        for field, default in defaults.items():
+            setattr(self, field, values[field] if field in values else default())
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{field}={getattr(self, field, None)!r}" for field in field_names)
+        return f"{classname}({values})"
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, field, None) == getattr(other, field, None) for field in field_names)
+
+    record_class = type(classname, (), {
+        '__slots__': field_names,
+        '__init__': __init__,
+        '__repr__': __repr__,
+        '__eq__': __eq__,
+        '__module__': __name__,
+        '__qualname__': global_name,
+    })
+    setattr(sys.modules[__name__], global_name, record_class)
+    return record_class
+
+
+def make_record_classes(schema_to_use, classes: Dict = None) -> Dict[str, type]:
+    # Обходит схему и возвращает {classname: класс} для всех классов в ней,
+    # вложенные классы создаются раньше тех, кто их содержит
+    if classes is None:
+        classes = {}
+    if not isinstance(schema_to_use, dict):
+        return classes
+
+    field_type = schema_to_use['type']
+    if field_type.startswith("nullable_"):
+        field_type = field_type[len("nullable_"):]
+
+    if field_type == "class":
+        # импорт здесь: binary_serializer сам импортирует этот модуль
+        from binary_serializer import schema_fingerprint
+
+        classname = schema_to_use['classname']
+        defaults = {}
+        for field, field_schema in schema_to_use['value_type'].items():
+            make_record_classes(field_schema, classes)
+            defaults[field] = _default_factory(field_schema, classes)
+        fingerprint = schema_fingerprint({**schema_to_use, 'type': "class"})
+        classes[classname] = make_record_class(classname, defaults, f"{classname}_{fingerprint.hex()}")
+    elif field_type == "list":
+        make_record_classes(schema_to_use['value_type'], classes)
+    elif field_type == "dict":
+        make_record_classes(schema_to_use['value_type']['keys'], classes)
+        make_record_classes(schema_to_use['value_type']['values'], classes)
+
+    return classes
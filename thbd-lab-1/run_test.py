@@ -1,55 +1,167 @@
-import yaml
-from pprint import pprint
+import abc
+import argparse
+import csv
+import io
+import json
+import tracemalloc
 from pathlib import Path
+from statistics import median, quantiles
+from time import perf_counter_ns
 
-from classes import CustomerBasket, UserClass
+import yaml
+
+from classes import UserClass
 from binary_serializer import Serializer
 import schema_pb2 as ProtobufSchema
 import avro.schema
 from avro.datafile import DataFileReader, DataFileWriter
-from avro.io import DatumReader, DatumWriter
-import json
+from avro.io import DatumReader, DatumWriter, BinaryEncoder, BinaryDecoder
+
+try:
+    import fastavro
+except ImportError:
+    fastavro = None
+
+
+# Бенчмарк сериализаторов: моя реализация, protobuf, avro и fastavro
+# (если установлен). Каждый формат - адаптер с общим интерфейсом (Codec),
+# схемы разбираются один раз при создании адаптера.
+# Перевод объектов classes.py в формат библиотеки (convert),
+# кодирование/декодирование в памяти и запись/чтение с диска замеряются
+# отдельно, на пачках от одного пользователя до 10^4 записей,
+# в двух режимах: single - каждая запись отдельно, batch - вся пачка разом
+# тем способом, который формат предлагает для множества записей.
+# Для каждого замера - прогрев и несколько повторов, в отчет идут
+# медиана и перцентили, пропускная способность (записей/с, МБ/с),
+# размер и пиковая память (tracemalloc).
+#
+# Отдельно замеряется моя реализация на данных с глубокой вложенностью
+# (--depths): list<dict<string, list<dict<string, ... int>>>> заданной глубины.
+#
+# python run_test.py --sizes 1 1000 100000 --repeats 5 --modes single batch
+# python run_test.py --depths 1 64 128 --depth-records 200
+# python run_test.py --save-baseline OUT/baseline.json
+# python run_test.py --baseline OUT/baseline.json   # код возврата 1 при регрессии
+
+DEFAULT_SIZES = [1, 100, 10_000]
+DEFAULT_DEPTHS = [1, 16, 64, 128]
+# листьев в глубокой записи при любой глубине, чтобы сравнивались
+# только накладные расходы на уровень вложенности
+DEPTH_LEAVES = 64
+OUT_DIR = Path("OUT")
+# Записи всех форматов пишутся в файл одинаково: длина (4 байта) + запись
+LEN_SIZE = 4
+
+AVRO_SCHEMA = {
+    "namespace": "userclass.avro",
+    "type": "record",
+    "name": "UserClass",
+    "fields": [
+        {"name": "age", "type": "int"},
+        {"name": "name", "type": "string"},
+        {"name": "surname", "type": "string"},
+        {"name": "current_balance", "type": "float"},
+        {"name": "basket_items", "type": {"type": "array", "items": "string"}},
+        {"name": "basket_prices", "type": {"type": "array", "items": "float"}},
+        {"name": "basket_quantities", "type": {"type": "array", "items": "int"}},
+        {"name": "basket_combos", "type": {
+            "type": "map", "values": {
+                "type": "array", "items": "string"
+            }
+        }},
+        {"name": "loyalty_programmes", "type": {"type": "map", "values": "boolean"}},
+        {
+            "name": "very_complicated_list_of_dicts_of_lists",
+            "type": {
+                "type": "array",
+                "items": {
+                        "type": "map",
+                        "values": {
+                                "type": "array",
+                                "items": {
+                                    "type": "array", "items": "int"
+                                }
+                        }
+                }
+            }
+        }
+    ]
+}
+
+
+def make_user(i: int = 0) -> UserClass:
+    # i = 0 - исходный пользователь из примера, дальше - его вариации,
+    # чтобы пачка не состояла из одинаковых записей
+    user = UserClass()
+    user.age = 27 + i % 50
+    user.name = "John"
+    user.surname = "Doe" if i == 0 else f"Doe{i}"
+    user.current_balance = 100.0 + i % 1000
+    user.basket.items = ["Soap", "Latex Gloves", "Detergent"]
+    user.basket.prices = [15.0, 15.0, 60.0 + i % 7]
+    user.basket.quantities = [1, 1, 1 + i % 3]
+    user.basket.combos = {
+       "BigCheese": ["Cheese", "Sauce", "Napkins"],
+       "CocaColaExtra": ["CocaCola", "Ice", "Bonus Glass"]
+    }
+    user.very_complicated_list_of_dicts_of_lists = [
+        {"HelloWorld": [[1, 2], [3, 4], [5, 6 + i % 10]]},
+        {
+            "Hey, serializers!": [[10, 20, 30, 40, 50]],
+            "Hey, yaml!": [[1100, 1200, 1300, 1400, 1500, 1600, 1700]]
+        }
+    ]
+    return user
+
+
+class Event:
+    pass
 
 
-from time import time
-from statistics import mean, stdev
-
-from tqdm import tqdm
-
-def run_my_serizlier(object, schema):
-    ser = Serializer(schema, __name__)
-    start = time()
-    ser.serialize(object, Path("OUT/my_serializer.bin"))
-    stop = time()
-    save_time = round(stop-start, 5)
-    start = time()
-    ser.deserialize(Path("OUT/my_serializer.bin"))
-    stop = time()
-    load_time = round(stop-start, 5)
-    return save_time, load_time
-
-
-def run_protobuf_serializer(object):
-    start = time()
-    with open(Path("OUT/protobuf_serializer.pbf"), "wb") as fd:
-        fd.write(object.SerializeToString())
-    stop = time()
-    save_time = round(stop-start, 5)
-
-    start = time()
-    _obj = object.__class__()
-    with open(Path("OUT/protobuf_serializer.pbf"), "rb") as fd:
-        _obj.ParseFromString(fd.read())
-    stop = time()
-    load_time = round(stop-start, 5)
-    return save_time, load_time
-
-
-def run_avro_serizlier(user, avro_schema):
-    start = time()
-    schema = avro.schema.parse(avro_schema)
-    writer = DataFileWriter(open(Path("OUT/avro_user.avro"), "wb"), DatumWriter(), schema)
-    avro_user = {
+def make_deep_event(depth: int):
+    # Чередование list и dict<string, ...> с int в самом низу,
+    # на нижних уровнях списки пошире - всего DEPTH_LEAVES листьев
+    schema, value = "int", 7
+    wide_levels = DEPTH_LEAVES.bit_length() - 1
+    for level in range(depth):
+        if level % 2:
+            schema = {"type": "dict", "value_type": {"keys": "string", "values": schema}}
+            value = {f"key_{level}": value}
+        else:
+            schema = {"type": "list", "value_type": schema}
+            value = [value] * (2 if level < 2 * wide_levels else 1)
+    event = Event()
+    event.payload = value
+    return {"type": "class", "classname": "Event", "value_type": {"payload": schema}}, event
+
+
+def to_protobuf(user: UserClass):
+    protobuf_user = ProtobufSchema.UserClass()
+    protobuf_user.age = user.age
+    protobuf_user.name = user.name
+    protobuf_user.surname = user.surname
+    protobuf_user.current_balance = user.current_balance
+    protobuf_user.basket.items.extend(user.basket.items)
+    protobuf_user.basket.prices.extend(user.basket.prices)
+    protobuf_user.basket.quantities.extend(user.basket.quantities)
+    for combo, items in user.basket.combos.items():
+        protobuf_user.basket.combos[combo].strings.extend(items)
+    for programme, enabled in user.loyalty_programmes.items():
+        protobuf_user.loyalty_programmes[programme] = enabled
+
+    for mapping in user.very_complicated_list_of_dicts_of_lists:
+        stlri = ProtobufSchema.StringToListOfRepeatedInts()
+        for key, lists in mapping.items():
+            for ints in lists:
+                ri = ProtobufSchema.RepeatedInt()
+                ri.ints.extend(ints)
+                stlri.mapping[key].lists.append(ri)
+        protobuf_user.very_complicated_list_of_dicts_of_lists.repeated_stlris.append(stlri)
+    return protobuf_user
+
+
+def to_avro(user: UserClass) -> dict:
+    return {
         "age": user.age,
         "name": user.name,
         "surname": user.surname,
@@ -58,198 +170,383 @@ def run_avro_serizlier(user, avro_schema):
         "basket_prices": user.basket.prices,
         "basket_quantities": user.basket.quantities,
         "basket_combos": user.basket.combos,
+        "loyalty_programmes": user.loyalty_programmes,
         "very_complicated_list_of_dicts_of_lists": user.very_complicated_list_of_dicts_of_lists
     }
-    writer.append(avro_user)
-    writer.close()
-    stop = time()
-    save_time = round(stop-start, 5)
-
-    start = time()
-    reader = DataFileReader(open(Path("OUT/avro_user.avro"), "rb"), DatumReader())
-    for user in reader:
-        pass
-    
-    reader.close()
-    stop = time()
-    load_time = round(stop-start, 5)
-    return save_time, load_time
-        
 
 
-if __name__ == "__main__":
+def frame(blobs) -> bytes:
+    # Записи подряд, перед каждой - длина
+    out = bytearray()
+    for blob in blobs:
+        out += len(blob).to_bytes(LEN_SIZE)
+        out += blob
+    return bytes(out)
 
-    N_RUN = 10000
 
-    with open(Path("MySerializerData/example_schema.yaml"), "r") as r:
-        schema = yaml.safe_load(r)
+def unframe(content) -> list:
+    content = memoryview(content)
+    blobs = []
+    pos = 0
+    while pos < len(content):
+        blob_len = int.from_bytes(content[pos:pos + LEN_SIZE])
+        pos += LEN_SIZE
+        blobs.append(content[pos:pos + blob_len])
+        pos += blob_len
+    return blobs
 
-    user = UserClass()
-    user.age = 27
-    user.name = "John"
-    user.surname = "Doe"
-    user.current_balance = 100.0
-    user.basket.items = ["Soap", "Latex Gloves", "Detergent"]
-    user.basket.prices = [15.0, 15.0, 60.0]
-    user.basket.quantities = [1, 1, 1]
-    user.basket.combos = {
-       "BigCheese": ["Cheese", "Sauce", "Napkins"],
-       "CocaColaExtra": ["CocaCola", "Ice", "Bonus Glass"]
+
+class Codec(abc.ABC):
+    # Общий интерфейс формата для бенчмарка. Пачка по умолчанию -
+    # отдельные записи с длинами (frame), форматы со своим способом
+    # писать много записей переопределяют encode_batch/decode_batch
+    name = None
+
+    def convert(self, users: list) -> list:
+        return users
+
+    @abc.abstractmethod
+    def encode_one(self, record) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def decode_one(self, blob):
+        ...
+
+    def encode_batch(self, records: list) -> bytes:
+        return frame(map(self.encode_one, records))
+
+    def decode_batch(self, content) -> list:
+        return list(map(self.decode_one, unframe(content)))
+
+
+class MyCodec(Codec):
+    name = "My"
+
+    def __init__(self, schema: dict, caller_module_name: str = "classes"):
+        # Схема, как и у protobuf/avro, известна читателю заранее -
+        # в запись идет только ее отпечаток. Классы записей ищутся
+        # в caller_module_name
+        self.serializer = Serializer(schema, caller_module_name, embed_schema=False)
+
+    def encode_one(self, record) -> bytes:
+        return self.serializer.dumps(record)
+
+    def decode_one(self, blob):
+        return self.serializer.loads(blob)
+
+    def encode_batch(self, records: list) -> bytes:
+        # Пачка - колоночный формат serialize_many, только в памяти
+        return self.serializer.dumps_many(records)
+
+    def decode_batch(self, content) -> list:
+        return self.serializer.loads_many(content)
+
+
+class ProtobufCodec(Codec):
+    # У схемы нет сообщения-списка пользователей, поэтому пачка -
+    # сообщения с длинами, как и принято для потока protobuf
+    name = "Protobuf"
+
+    def convert(self, users: list) -> list:
+        return list(map(to_protobuf, users))
+
+    def encode_one(self, record) -> bytes:
+        return record.SerializeToString()
+
+    def decode_one(self, blob):
+        record = ProtobufSchema.UserClass()
+        record.ParseFromString(blob)
+        return record
+
+
+class AvroCodec(Codec):
+    # single - запись без контейнера (схема у читателя и писателя общая),
+    # batch - один контейнер avro (DataFileWriter) на всю пачку
+    name = "Avro"
+
+    def __init__(self):
+        self.schema = avro.schema.parse(json.dumps(AVRO_SCHEMA))
+        self.writer = DatumWriter(self.schema)
+        self.reader = DatumReader(self.schema)
+
+    def convert(self, users: list) -> list:
+        return list(map(to_avro, users))
+
+    def encode_one(self, record) -> bytes:
+        buffer = io.BytesIO()
+        self.writer.write(record, BinaryEncoder(buffer))
+        return buffer.getvalue()
+
+    def decode_one(self, blob):
+        return self.reader.read(BinaryDecoder(io.BytesIO(blob)))
+
+    def encode_batch(self, records: list) -> bytes:
+        buffer = io.BytesIO()
+        writer = DataFileWriter(buffer, DatumWriter(), self.schema)
+        for record in records:
+            writer.append(record)
+        writer.flush()
+        content = buffer.getvalue()
+        writer.close()
+        return content
+
+    def decode_batch(self, content) -> list:
+        with DataFileReader(io.BytesIO(content), DatumReader()) as reader:
+            return list(reader)
+
+
+class FastavroCodec(AvroCodec):
+    name = "Fastavro"
+
+    def __init__(self):
+        self.schema = fastavro.parse_schema(AVRO_SCHEMA)
+
+    def encode_one(self, record) -> bytes:
+        buffer = io.BytesIO()
+        fastavro.schemaless_writer(buffer, self.schema, record)
+        return buffer.getvalue()
+
+    def decode_one(self, blob):
+        return fastavro.schemaless_reader(io.BytesIO(blob), self.schema)
+
+    def encode_batch(self, records: list) -> bytes:
+        buffer = io.BytesIO()
+        fastavro.writer(buffer, self.schema, records)
+        return buffer.getvalue()
+
+    def decode_batch(self, content) -> list:
+        return list(fastavro.reader(io.BytesIO(content), self.schema))
+
+
+def write_file(path: Path, content: bytes):
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def read_file(path: Path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def measure(fn, warmup: int, repeats: int) -> list:
+    # Время каждого повтора в наносекундах, прогревочные запуски не считаются
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = perf_counter_ns()
+        fn()
+        times.append(perf_counter_ns() - start)
+    return times
+
+
+def peak_memory(fn) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(times: list, records: int, size: int) -> dict:
+    # p90/p99 для малого числа повторов - по интерполяции между замерами
+    cuts = quantiles(times, n=100, method="inclusive") if len(times) > 1 else times * 99
+    median_s = median(times) / 1e9
+    return {
+        "median_ms": median(times) / 1e6,
+        "p90_ms": cuts[89] / 1e6,
+        "p99_ms": cuts[98] / 1e6,
+        "min_ms": min(times) / 1e6,
+        "records_per_s": records / median_s if median_s else float("inf"),
+        "mb_per_s": size / median_s / 1e6 if median_s else float("inf"),
     }
-    user.very_complicated_list_of_dicts_of_lists = [
-        {"HelloWorld": [[1, 2], [3, 4], [5, 6]]},
+
+
+def run_codec(codec: Codec, mode: str, users: list, warmup: int, repeats: int) -> list:
+    if mode == "single":
+        def encode(records):
+            return frame(map(codec.encode_one, records))
+
+        def decode(content):
+            return list(map(codec.decode_one, unframe(content)))
+    else:
+        encode, decode = codec.encode_batch, codec.decode_batch
+
+    records = codec.convert(users)
+    content = encode(records)
+    path = OUT_DIR / f"bench_{codec.name.lower()}_{mode}.bin"
+    write_file(path, content)
+    if len(decode(read_file(path))) != len(users):
+        raise RuntimeError(f"{codec.name} failed to read its own records")
+
+    # в single отдельные записи обрамляются длинами - это часть
+    # encode/decode, как и у batch-форматов со своей разметкой
+    phases = {
+        "convert": lambda: codec.convert(users),
+        "encode": lambda: encode(records),
+        "decode": lambda: decode(content),
+        "write": lambda: write_file(path, content),
+        "read": lambda: read_file(path),
+    }
+    rows = []
+    for phase, fn in phases.items():
+        row = {
+            "engine": codec.name,
+            "mode": mode,
+            "records": len(users),
+            "phase": phase,
+            "bytes": len(content),
+            **summarize(measure(fn, warmup, repeats), len(users), len(content)),
+        }
+        if phase in ("convert", "encode", "decode"):
+            row["peak_memory_bytes"] = peak_memory(fn)
+        rows.append(row)
+    return rows
+
+
+def run_depth(depth: int, records: int, warmup: int, repeats: int) -> list:
+    # Глубокие схемы кодируются теми же вложенными функциями. Глубина
+    # ограничена лимитом рекурсии (binary_serializer._max_schema_depth)
+    schema, event = make_deep_event(depth)
+    codec = MyCodec(schema, __name__)
+    events = [event] * records
+    content = frame(map(codec.encode_one, events))
+    if len(list(map(codec.decode_one, unframe(content)))) != records:
+        raise RuntimeError(f"My failed to read its own records at depth {depth}")
+
+    phases = {
+        "encode": lambda: frame(map(codec.encode_one, events)),
+        "decode": lambda: list(map(codec.decode_one, unframe(content))),
+    }
+    return [
         {
-            "Hey, serializers!": [[10, 20, 30, 40, 50]],
-            "Hey, yaml!": [[1100, 1200, 1300, 1400, 1500, 1600, 1700]]
+            "engine": codec.name,
+            "mode": f"depth{depth}",
+            "records": records,
+            "phase": phase,
+            "bytes": len(content),
+            **summarize(measure(fn, warmup, repeats), records, len(content)),
         }
+        for phase, fn in phases.items()
     ]
+
+
+def compare_with_baseline(rows: list, baseline_path: Path, threshold: float) -> list:
+    # Регрессия - медиана хуже базовой больше чем на threshold (0.1 = 10%)
+    # или вырос размер данных
+    with open(baseline_path, "r") as r:
+        baseline = {
+            (row["engine"], row.get("mode", "single"), row["records"], row["phase"]): row
+            for row in json.load(r)["results"]
+        }
+    regressions = []
+    for row in rows:
+        old = baseline.get((row["engine"], row["mode"], row["records"], row["phase"]))
+        if old is None:
+            continue
+        slowdown = row["median_ms"] / old["median_ms"] - 1 if old["median_ms"] else 0.0
+        row["baseline_median_ms"] = old["median_ms"]
+        row["change"] = slowdown
+        if slowdown > threshold or row["bytes"] > old["bytes"]:
+            regressions.append(row)
+    return regressions
+
+
+def save_results(rows: list, json_path: Path, csv_path: Path):
+    with open(json_path, "w") as w:
+        json.dump({"results": rows}, w, indent=2)
+    fieldnames = []
+    for row in rows:
+        fieldnames.extend(key for key in row if key not in fieldnames)
+    with open(csv_path, "w", newline="") as w:
+        writer = csv.DictWriter(w, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_table(rows: list):
+    print(
+        f"{'engine':>9} {'mode':>6} {'records':>9} {'phase':>7} {'median ms':>11} {'p99 ms':>10}"
+        f" {'rec/s':>12} {'MB/s':>9} {'bytes':>12} {'peak KB':>10}"
+    )
+    for row in rows:
+        peak = row.get("peak_memory_bytes")
+        print(
+            f"{row['engine']:>9} {row['mode']:>6} {row['records']:>9} {row['phase']:>7}"
+            f" {row['median_ms']:>11.3f} {row['p99_ms']:>10.3f}"
+            f" {row['records_per_s']:>12.0f} {row['mb_per_s']:>9.2f} {row['bytes']:>12}"
+            f" {'' if peak is None else peak // 1024:>10}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serializer benchmark: My / Protobuf / Avro / Fastavro")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="records per payload")
+    parser.add_argument("--engines", nargs="+", default=["My", "Protobuf", "Avro", "Fastavro"])
+    parser.add_argument("--modes", nargs="+", choices=["single", "batch"], default=["single", "batch"])
+    parser.add_argument("--depths", type=int, nargs="*", default=DEFAULT_DEPTHS, help="nesting depths for My")
+    parser.add_argument("--depth-records", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--json", type=Path, default=OUT_DIR / "bench_results.json")
+    parser.add_argument("--csv", type=Path, default=OUT_DIR / "bench_results.csv")
+    parser.add_argument("--baseline", type=Path, help="compare with results saved earlier")
+    parser.add_argument("--save-baseline", type=Path, help="also save these results as a baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown vs baseline")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    OUT_DIR.mkdir(exist_ok=True)
+
+    with open(Path("MySerializerData/example_schema.yaml"), "r") as r:
+        schema = yaml.safe_load(r)
+
     print("Original user:")
-    print(user)
-
-    # ------------- МОЯ РЕАЛИЗАЦИЯ ----------
-    # import cProfile
-
-    # profile_fname = "run_test.prof"
-    # profiler = cProfile.Profile()
-    # result = profiler.runcall(run_my_serizlier, user, schema)
-    # profiler.print_stats(sort='cumtime')
-    # input(">>> ")
-
-    my_save_times = []
-    my_load_times = []
-    for _ in tqdm(range(N_RUN), total=N_RUN):
-        my_save_time, my_load_time = run_my_serizlier(user, schema)
-        my_save_times.append(my_save_time)
-        my_load_times.append(my_load_time)
-    # -------------КОНЕЦ МОЕЙ РЕАЛИЗАЦИИ -----------
-
-    # -------------------------------------------------------
-    # PROTOBUF РЕАЛИЗАЦИЯ
-    protobuf_user = ProtobufSchema.UserClass()
-    protobuf_user.age = 27
-    protobuf_user.name = "John"
-    protobuf_user.surname = "Doe"
-    protobuf_user.current_balance = 100.0
-    protobuf_user.basket.items.extend(["Soap", "Latex Gloves", "Detergent"])
-    protobuf_user.basket.prices.extend([15.0, 15.0, 60.0])
-    protobuf_user.basket.quantities.extend([1, 1, 1])
-    protobuf_user.basket.combos["BigCheese"].strings.extend(["Cheese", "Sauce", "Napkins"])
-    protobuf_user.basket.combos["CocaColaExtra"].strings.extend(["CocaCola", "Ice", "Bonus Glass"])
-    
-    stlri1 = ProtobufSchema.StringToListOfRepeatedInts()
-    ri = ProtobufSchema.RepeatedInt()
-    ri.ints.extend([1, 2])
-    stlri1.mapping["HelloWorld"].lists.append(ri)
-    ri = ProtobufSchema.RepeatedInt()
-    ri.ints.extend([3, 4])
-    stlri1.mapping["HelloWorld"].lists.append(ri)
-    ri = ProtobufSchema.RepeatedInt()
-    ri.ints.extend([5, 6])
-    stlri1.mapping["HelloWorld"].lists.append(ri)
-
-    stlri2 = ProtobufSchema.StringToListOfRepeatedInts()
-    ri = ProtobufSchema.RepeatedInt()
-    ri.ints.extend([10, 20, 30, 40, 50])
-    stlri2.mapping["Hey, serializers!"].lists.append(ri)
-    ri = ProtobufSchema.RepeatedInt()
-    ri.ints.extend([1100, 1200, 1300, 1400, 1500, 1600, 1700])
-    stlri2.mapping["Hey, yaml!"].lists.append(ri)
-    protobuf_user.very_complicated_list_of_dicts_of_lists.repeated_stlris.extend([stlri1, stlri2])
-
-    protobuf_save_times = []
-    protobuf_load_times = []
-    for _ in tqdm(range(N_RUN), total=N_RUN):
-        protobuf_save_time, protobuf_load_time = run_protobuf_serializer(protobuf_user)
-        protobuf_save_times.append(protobuf_load_time)
-        protobuf_load_times.append(protobuf_load_time)
-
-    # КОНЕЦ PROTOBUF РЕАЛИЗАЦИИ
-    # --------------------------------------------
-
-    # ------------- FASTAVRO РЕАЛИЗАЦИЯ ----------
-    avro_schema = {
-        "namespace": "userclass.avro",
-        "type": "record",
-        "name": "UserClass",
-        "fields": [
-            {"name": "age", "type": "int"},
-            {"name": "name", "type": "string"},
-            {"name": "surname", "type": "string"},
-            {"name": "current_balance", "type": "float"},
-            {"name": "basket_items", "type": {"type": "array", "items": "string"}},
-            {"name": "basket_prices", "type": {"type": "array", "items": "float"}},
-            {"name": "basket_quantities", "type": {"type": "array", "items": "int"}},
-            {"name": "basket_combos", "type": {
-                "type": "map", "values": {
-                    "type": "array", "items": "string"
-                }
-            }},
-            {
-                "name": "very_complicated_list_of_dicts_of_lists",
-                "type": {
-                    "type": "array",
-                    "items": {
-                            "type": "map",
-                            "values": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "array", "items": "int"
-                                    }
-                            }
-                    }
-                }
-            }
-        ]
+    print(make_user(0))
+
+    codecs = {
+        "My": lambda: MyCodec(schema),
+        "Protobuf": ProtobufCodec,
+        "Avro": AvroCodec,
+        "Fastavro": FastavroCodec,
     }
+    engines = [name for name in args.engines if name != "Fastavro" or fastavro is not None]
+    if len(engines) != len(args.engines):
+        print("fastavro is not installed, skipping it")
+    codecs = {name: codecs[name]() for name in engines}
+
+    rows = []
+    for size in args.sizes:
+        users = [make_user(i) for i in range(size)]
+        # на больших пачках повторов меньше, чтобы прогон укладывался во время
+        repeats = max(2, min(args.repeats, args.repeats * 10_000 // size))
+        for codec in codecs.values():
+            for mode in args.modes:
+                rows.extend(run_codec(codec, mode, users, args.warmup, repeats))
+
+    if "My" in engines:
+        for depth in args.depths:
+            rows.extend(run_depth(depth, args.depth_records, args.warmup, args.repeats))
+
+    regressions = []
+    if args.baseline is not None:
+        regressions = compare_with_baseline(rows, args.baseline, args.threshold)
+
+    print_table(rows)
+    save_results(rows, args.json, args.csv)
+    if args.save_baseline is not None:
+        save_results(rows, args.save_baseline, args.save_baseline.with_suffix(".csv"))
 
-    # measure cpu time of run_avro_serizlier function
-    avro_schema_json = json.dumps(avro_schema)
-    avro_save_times = []
-    avro_load_times = []
-    for _ in tqdm(range(N_RUN), total=N_RUN):
-        
-        
-        avro_save_time, avro_load_time = run_avro_serizlier(user, avro_schema_json)
-        avro_save_times.append(avro_save_time)
-        avro_load_times.append(avro_load_time)
-
-    # -------------- КОНЕЦ FASTAVRO РЕАЛИЗАЦИИ -----
-
-    import pandas as pd
-    import os
-
-    out = pd.DataFrame({
-        "Method": [
-            "My",
-            "Protobuf",
-            "Avro"
-        ],
-        "Total Save Time": [
-            sum(my_save_times),
-            sum(protobuf_save_times),
-            sum(avro_save_times)
-        ],
-        "Std. of save time": [
-            stdev(my_save_times),
-            stdev(protobuf_save_times),
-            stdev(avro_save_times)
-        ],
-        "Total Load Time": [
-            sum(my_load_times),
-            sum(protobuf_load_times),
-            sum(avro_save_times)
-        ],
-        "Std. of load time": [
-            stdev(my_load_times),
-            stdev(protobuf_load_times),
-            stdev(avro_save_times)
-        ],
-        "Out File Size": [
-            os.path.getsize(Path("OUT/my_serializer.bin")),
-            os.path.getsize(Path("OUT/protobuf_serializer.pbf")),
-            os.path.getsize(Path("OUT/avro_user.avro")),
-        ]
-    })
-
-    out = out.sort_values(by='Total Load Time').reset_index(drop=True)
-    out.to_excel("Bench results.xlsx", index=False)
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {args.baseline}:")
+        for row in regressions:
+            print(
+                f"\t{row['engine']} {row['mode']} x{row['records']} {row['phase']}: "
+                f"{row['baseline_median_ms']:.3f} -> {row['median_ms']:.3f} ms ({row['change']:+.0%}),"
+                f" {row['bytes']} bytes"
+            )
+        raise SystemExit(1)
@@ -0,0 +1,60 @@
+from typing import Dict, Union
+from pathlib import Path
+
+import yaml
+
+from binary_serializer import Serializer, schema_fingerprint
+
+
+class SchemaRegistry:
+    def __init__(
+            self,
+            schema_dir: Union[Path, str, None] = None,
+            schemas: Union[Dict[str, Dict], None] = None
+    ):
+        # Схемы берутся либо из папки с yaml файлами, либо из словаря
+        # "имя -> схема". Разобранные схемы и собранные под них
+        # сериализаторы кешируются по отпечатку
+        self.schema_dir = None if schema_dir is None else Path(schema_dir)
+        self._schemas = {}
+        self._serializers = {}
+        self._loaded_files = set()
+
+        if schemas is not None:
+            for schema in schemas.values():
+                self.register(schema)
+
+    def register(self, schema: Dict) -> bytes:
+        fingerprint = schema_fingerprint(schema)
+        self._schemas.setdefault(fingerprint, schema)
+        return fingerprint
+
+    def _scan_schema_dir(self):
+        # Читаем только файлы, которых еще не видели:
+        # новые схемы можно подкладывать в папку на лету
+        if self.schema_dir is None:
+            return
+        for schema_path in sorted(self.schema_dir.glob("*.y*ml")):
+            if schema_path in self._loaded_files:
+                continue
+            with open(schema_path, "r") as r:
+                self.register(yaml.safe_load(r))
+            self._loaded_files.add(schema_path)
+
+    def get(self, fingerprint: bytes) -> Dict:
+        if fingerprint not in self._schemas:
+            self._scan_schema_dir()
+        if fingerprint not in self._schemas:
+            raise KeyError(f"Schema {fingerprint.hex()} is not in the registry")
+        return self._schemas[fingerprint]
+
+    def serializer(self, fingerprint: bytes, caller_module_name, generate_classes: bool = False) -> Serializer:
+        key = (fingerprint, caller_module_name, generate_classes)
+        if key not in self._serializers:
+            self._serializers[key] = Serializer(
+                self.get(fingerprint),
+                caller_module_name,
+                embed_schema=False,
+                generate_classes=generate_classes
+            )
+        return self._serializers[key]
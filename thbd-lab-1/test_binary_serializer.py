@@ -0,0 +1,482 @@
+import pickle
+import sys
+
+import pytest
+
+from binary_serializer import Serializer
+from container import ContainerWriter, encode_block, decode_block, iter_records
+from schema_registry import SchemaRegistry
+
+
+class Record:
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and vars(other) == vars(self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({vars(self)})"
+
+
+class Item(Record):
+    pass
+
+
+ITEM_SCHEMA = {"title": "string", "price": "float"}
+
+# По полю на каждый тип схемы
+SCHEMA = {
+    "type": "class",
+    "classname": "Record",
+    "value_type": {
+        "name": "string",
+        "count": "int",
+        "ratio": "float",
+        "flag": "bool",
+        "small": "int8",
+        "medium": "int16",
+        "big": "int64",
+        "single": "float32",
+        "unsigned": "varint",
+        "signed": "sint",
+        "maybe_name": "nullable_string",
+        "maybe_count": "nullable_int",
+        "maybe_ratio": "nullable_float",
+        "maybe_flag": "nullable_bool",
+        "maybe_small": "nullable_int8",
+        "maybe_big": "nullable_int64",
+        "maybe_single": "nullable_float32",
+        "maybe_unsigned": "nullable_varint",
+        "maybe_signed": "nullable_sint",
+        "tags": {"type": "list", "value_type": "string"},
+        "ints": {"type": "list", "value_type": "int"},
+        "floats": {"type": "list", "value_type": "float"},
+        "flags": {"type": "list", "value_type": "bool"},
+        "deltas": {"type": "list", "value_type": "sint"},
+        "maybe_ints": {"type": "nullable_list", "value_type": "int"},
+        "scores": {"type": "dict", "value_type": {"keys": "string", "values": "float"}},
+        "maybe_scores": {"type": "nullable_dict", "value_type": {"keys": "string", "values": "int"}},
+        "nested": {
+            "type": "list",
+            "value_type": {
+                "type": "dict",
+                "value_type": {"keys": "string", "values": {"type": "list", "value_type": "int"}}
+            }
+        },
+        "item": {"type": "class", "classname": "Item", "value_type": ITEM_SCHEMA},
+        "maybe_item": {"type": "nullable_class", "classname": "Item", "value_type": ITEM_SCHEMA},
+        "items": {
+            "type": "list",
+            "value_type": {"type": "class", "classname": "Item", "value_type": ITEM_SCHEMA}
+        },
+    }
+}
+
+OPTIONS = {
+    "plain": {},
+    "fingerprint": {"embed_schema": False},
+    "packed": {"packed_arrays": True},
+    "interned": {"intern_strings": True},
+    "interned_fingerprint": {"intern_strings": True, "embed_schema": False},
+    "zlib": {"compression": "zlib"},
+    "dedup": {"dedup": True},
+    "lzma": {"compression": "lzma"},
+    "everything": {"packed_arrays": True, "intern_strings": True, "dedup": True, "compression": "bz2"},
+}
+
+
+def make_record(i: int = 0) -> Record:
+    return Record(
+        name=f"Ёжик {i}",
+        count=i,
+        ratio=0.5 + i,
+        flag=i % 2 == 0,
+        small=-128 + i,
+        medium=-(2 ** 15),
+        big=2 ** 63 - 1,
+        single=1.5,
+        unsigned=2 ** 40,
+        signed=-(2 ** 40),
+        maybe_name=None,
+        maybe_count=2 ** 32 - 1,
+        maybe_ratio=None,
+        maybe_flag=False,
+        maybe_small=127,
+        maybe_big=-(2 ** 63),
+        maybe_single=None,
+        maybe_unsigned=0,
+        maybe_signed=None,
+        tags=["class", "", "名前", "name"],
+        ints=[0, 1, 2 ** 32 - 1],
+        floats=[-1.25, 0.0],
+        flags=[True, False],
+        deltas=[-1, 0, 1, -(2 ** 63)],
+        maybe_ints=None,
+        scores={"a": 1.0, "ü": -2.5},
+        maybe_scores={},
+        nested=[{"x": [1, 2], "y": []}, {}],
+        item=Item(title="soap", price=15.0),
+        maybe_item=None,
+        items=[Item(title="glove", price=1.0), Item(title="", price=-0.5)],
+    )
+
+
+def edge_records() -> list:
+    # Пустые строки и контейнеры, граничные значения целых
+    # и, наоборот, заполненные nullable поля
+    empty = make_record(0)
+    vars(empty).update(
+        name="", count=0, ratio=0.0, small=127, medium=2 ** 15 - 1, big=-(2 ** 63), single=0.0,
+        unsigned=0, signed=0, maybe_small=-128, maybe_big=2 ** 63 - 1, maybe_count=0,
+        tags=[], ints=[], floats=[], flags=[], deltas=[], maybe_ints=[], scores={}, maybe_scores=None,
+        nested=[], items=[], item=Item(title="", price=0.0),
+    )
+    full = make_record(1)
+    vars(full).update(
+        maybe_name="ünïcödé ✓ 🙂", maybe_ratio=-1e300, maybe_flag=True, maybe_single=0.25,
+        maybe_signed=-1, maybe_unsigned=2 ** 63, maybe_ints=[2 ** 32 - 1, 0],
+        maybe_scores={"": 0, "ключ": 2 ** 32 - 1}, maybe_item=Item(title="мыло", price=-0.5),
+        nested=[{"": []}, {"日本": [2 ** 32 - 1] * 3}],
+    )
+    return [make_record(0), empty, full]
+
+
+def make_serializer(options: dict) -> Serializer:
+    if options.get("embed_schema") is False:
+        options = {**options, "registry": SchemaRegistry()}
+    return Serializer(SCHEMA, __name__, **options)
+
+
+@pytest.mark.parametrize("options", OPTIONS.values(), ids=OPTIONS.keys())
+def test_dumps_matches_serialize(options, tmp_path):
+    serializer = make_serializer(options)
+    record = make_record(3)
+    serializer.serialize(record, tmp_path / "record.bin")
+    data = serializer.dumps(record)
+    assert data == (tmp_path / "record.bin").read_bytes()
+    assert serializer.deserialize(tmp_path / "record.bin") == record
+    assert serializer.loads(data) == record
+
+
+@pytest.mark.parametrize("options", OPTIONS.values(), ids=OPTIONS.keys())
+def test_sized_dump_into_matches_encoder(options):
+    # dump_into считает размер и пишет на место отдельной парой функций -
+    # байты должны совпадать с обычным кодировщиком
+    serializer = make_serializer(options)
+    assert serializer._sized_object_encoder() == ("dedup" not in options and "compression" not in options)
+    for record in edge_records() + [make_record(3)]:
+        data = serializer.dumps(record)
+        buffer = bytearray(len(data) + 5)
+        assert serializer.dump_into(record, memoryview(buffer), 5) == len(buffer)
+        assert buffer[5:] == data
+
+
+@pytest.mark.parametrize("options", OPTIONS.values(), ids=OPTIONS.keys())
+def test_dump_into_matches_dumps(options):
+    serializer = make_serializer(options)
+    record = make_record(1)
+    data = serializer.dumps(record)
+    buffer = bytearray(len(data) + 10)
+    assert serializer.dump_into(record, buffer, 3) == 3 + len(data)
+    assert buffer[3:3 + len(data)] == data
+    assert serializer.loads(memoryview(buffer)[3:3 + len(data)]) == record
+    with pytest.raises(ValueError):
+        serializer.dump_into(record, bytearray(len(data) - 1))
+
+
+SHARED_SCHEMA = {
+    "type": "class",
+    "classname": "Record",
+    "value_type": {
+        "a": {"type": "list", "value_type": "int"},
+        "b": {"type": "list", "value_type": "int"},
+        "c": {"type": "nullable_list", "value_type": "int"},
+        "d": {"type": "nullable_list", "value_type": "int"},
+    }
+}
+
+
+def shared_record(a, b, c=None, d=None) -> Record:
+    return Record(a=a, b=b, c=c, d=d)
+
+
+def test_dedup_writes_equal_subtrees_once():
+    serializer = Serializer(SHARED_SCHEMA, __name__, dedup=True)
+    record = shared_record([1, 2, 3], [1, 2, 3], [1, 2, 3], [1, 2, 3])
+    data = serializer.dumps(record)
+    assert len(data) < len(Serializer(SHARED_SCHEMA, __name__).dumps(record))
+
+    # списки изменяемы: по ссылке читается новая копия
+    decoded = serializer.loads(data)
+    assert decoded == record
+    assert decoded.a is not decoded.b and decoded.c is not decoded.d
+    decoded.a.append(4)
+    assert decoded.b == [1, 2, 3]
+
+    projected = serializer.loads(data, fields=["b", "d"])
+    assert projected.b == [1, 2, 3] and projected.d == [1, 2, 3]
+
+    lazy = serializer.loads(data, lazy=True)
+    assert lazy.b == [1, 2, 3] and lazy.d == [1, 2, 3]
+
+    # схема читателя отличается - данные читает декодер с приведением типов
+    reader_schema = {**SHARED_SCHEMA, "value_type": {
+        key: {**field, "value_type": "int64"} for key, field in SHARED_SCHEMA["value_type"].items()
+    }}
+    assert Serializer(reader_schema, __name__).loads(data) == record
+    assert Serializer(reader_schema, __name__).loads(data, fields=["b", "d"]) == projected
+
+    # универсальный декодер (без схемы) тоже понимает ссылки назад
+    _, data_pos = serializer._read_header(memoryview(data))
+    generic, _ = serializer._recursive_dictionary_decode(memoryview(data), data_pos)
+    assert generic == {"a": [1, 2, 3], "b": [1, 2, 3], "c": [1, 2, 3], "d": [1, 2, 3]}
+
+
+def test_dedup_follows_changed_objects():
+    serializer = Serializer(SHARED_SCHEMA, __name__, dedup=True)
+    shared = [1]
+    first = serializer.dumps(shared_record(shared, shared))
+    shared.append(2)
+    second = serializer.loads(serializer.dumps(shared_record(shared, [], shared)))
+    assert serializer.loads(first) == shared_record([1], [1])
+    assert second == shared_record([1, 2], [], [1, 2])
+
+
+NESTED_SCHEMA = {
+    "type": "class",
+    "classname": "Record",
+    "value_type": {
+        "a": {"type": "list", "value_type": {"type": "list", "value_type": "int"}},
+        "b": {"type": "list", "value_type": {"type": "list", "value_type": "int"}},
+        "c": {"type": "nullable_list", "value_type": "int"},
+        "d": {"type": "nullable_list", "value_type": "int"},
+    }
+}
+
+
+def test_dedup_refers_to_earlier_records_of_a_block():
+    # Одинаковые поддеревья разных записей блока пишутся один раз,
+    # в том числе внешние списки, внутри которых уже стоят ссылки
+    serializer = Serializer(NESTED_SCHEMA, __name__, dedup=True)
+    records = [
+        shared_record([[1, 2], [3, 4]], [[1, 2], [3, 4]], [index], None)
+        for index in range(20)
+    ]
+    _, block = encode_block(serializer, records)
+    _, plain_block = encode_block(Serializer(NESTED_SCHEMA, __name__), records)
+    assert len(block) < len(plain_block) // 2
+    _, second_block = encode_block(serializer, records[:2])
+    _, first_block = encode_block(serializer, records[:1])
+    # во второй записи списки a и b - ссылки, они короче даже пустых списков
+    _, empty_block = encode_block(Serializer(NESTED_SCHEMA, __name__), [shared_record([], [], [1], None)])
+    assert len(second_block) - len(first_block) < len(empty_block)
+    assert list(decode_block(serializer, serializer._decode_object, len(records), block)) == records
+
+
+def test_generated_classes_of_different_schemas_do_not_collide():
+    first_schema = {"type": "class", "classname": "Point", "value_type": {"x": "int"}}
+    second_schema = {"type": "class", "classname": "Point", "value_type": {"x": "int", "label": "string"}}
+    first = Serializer(first_schema, __name__, generate_classes=True)
+    second = Serializer(second_schema, __name__, generate_classes=True)
+    first_class, second_class = first.classes["Point"], second.classes["Point"]
+    assert first_class is not second_class
+    assert Serializer(first_schema, __name__, generate_classes=True).classes["Point"] is first_class
+
+    point = first.loads(first.dumps(first_class(x=1)))
+    labeled = second.loads(second.dumps(second_class(x=2, label="два")))
+    assert pickle.loads(pickle.dumps(point)) == first_class(x=1)
+    assert pickle.loads(pickle.dumps(labeled)) == second_class(x=2, label="два")
+
+    # сериализатор писателя из реестра тоже собирает свои классы
+    registry = SchemaRegistry(schemas={"point": second_schema})
+    reader = Serializer(first_schema, __name__, registry=registry, generate_classes=True)
+    writer = Serializer(second_schema, __name__, embed_schema=False, generate_classes=True)
+    assert type(reader.loads(writer.dumps(labeled))) is first_class
+    assert reader._resolve_serializer(writer.fingerprint).classes["Point"] is second_class
+
+
+def point_schema(x_type: str) -> dict:
+    return {"type": "class", "classname": "Record", "value_type": {"x": x_type, "label": "string"}}
+
+
+@pytest.mark.parametrize("writer_type, reader_type, value", [
+    ("int8", "int16", -5),
+    ("int16", "int", 2 ** 15 - 1),
+    ("int8", "int64", -128),
+    ("int", "int64", 2 ** 32 - 1),
+    ("int", "float", 7),
+    ("float32", "float", 0.5),
+])
+def test_widening_promotions(writer_type, reader_type, value):
+    writer = Serializer(point_schema(writer_type), __name__)
+    reader = Serializer(point_schema(reader_type), __name__)
+    decoded = reader.loads(writer.dumps(Record(x=value, label="p")))
+    assert decoded == Record(x=value, label="p")
+    assert type(decoded.x) is type(float(value) if reader_type == "float" else value)
+
+
+@pytest.mark.parametrize("writer_type, reader_type", [
+    ("int64", "int"),
+    ("int16", "int8"),
+    ("float", "float32"),
+    ("float", "int"),
+    ("int64", "float"),
+    ("varint", "int64"),
+    ("string", "int"),
+])
+def test_narrowing_promotions_are_rejected(writer_type, reader_type):
+    writer = Serializer(point_schema(writer_type), __name__)
+    reader = Serializer(point_schema(reader_type), __name__)
+    data = writer.dumps(Record(x="1" if writer_type == "string" else 1, label="p"))
+    with pytest.raises(ValueError):
+        reader.loads(data)
+
+
+def test_writer_schemas_are_found_by_fingerprint():
+    reader = Serializer(point_schema("int64"), __name__)
+    writers = [Serializer(point_schema(x_type), __name__) for x_type in ("int8", "int16", "int")]
+    for _ in range(2):
+        for i, writer in enumerate(writers):
+            assert reader.loads(writer.dumps(Record(x=i, label=str(i)))) == Record(x=i, label=str(i))
+    assert set(reader._writer_fingerprints.values()) == {writer.fingerprint for writer in writers}
+    assert set(reader._writer_serializers) == {writer.fingerprint for writer in writers}
+
+
+def test_reader_defaults_are_not_written(tmp_path):
+    # default - только для читателя: None и отрицательные значения
+    # не кодируются в заголовок и не меняют отпечаток схемы
+    reader_schema = {"type": "class", "classname": "Record", "value_type": {
+        "x": "int8",
+        "label": "string",
+        "note": {"type": "nullable_string", "default": None},
+        "delta": {"type": "int", "default": -1},
+        "item": {"type": "nullable_class", "classname": "Item", "default": None, "value_type": {
+            "title": {"type": "string", "default": "?"},
+        }},
+    }}
+    without_defaults = {**reader_schema, "value_type": {
+        "x": "int8",
+        "label": "string",
+        "note": {"type": "nullable_string"},
+        "delta": {"type": "int"},
+        "item": {"type": "nullable_class", "classname": "Item", "value_type": {"title": {"type": "string"}}},
+    }}
+    reader = Serializer(reader_schema, __name__)
+    assert reader.fingerprint == Serializer(without_defaults, __name__).fingerprint
+    record = Record(x=1, label="p", note=None, delta=5, item=None)
+    assert reader.loads(reader.dumps(record)) == record
+    assert reader.loads_many(reader.dumps_many([record])) == [record]
+    with ContainerWriter(tmp_path / "records.bin", reader) as writer:
+        writer.append(record)
+    assert list(iter_records(tmp_path / "records.bin", Serializer(without_defaults, __name__))) == [record]
+
+    decoded = reader.loads(Serializer(point_schema("int8"), __name__).dumps(Record(x=1, label="p")))
+    assert decoded == Record(x=1, label="p", note=None, delta=-1, item=None)
+
+
+@pytest.mark.parametrize("field", ["name", "item.title"])
+def test_single_field_name_is_not_split(field):
+    serializer = Serializer(SCHEMA, __name__)
+    data = serializer.dumps(make_record(2))
+    assert vars(serializer.loads(data, fields=field)) == vars(serializer.loads(data, fields=[field]))
+    lazy = serializer.loads(data, fields=field, lazy=True)
+    assert set(lazy._field_offsets) == {field.split(".")[0]}
+
+
+def test_single_field_name_with_schema_resolution():
+    data = Serializer(point_schema("int8"), __name__).dumps(Record(x=1, label="p"))
+    assert vars(Serializer(point_schema("int"), __name__).loads(data, fields="label")) == {"label": "p"}
+
+
+@pytest.mark.parametrize("options", OPTIONS.values(), ids=OPTIONS.keys())
+def test_dumps_many_matches_serialize_many(options, tmp_path):
+    serializer = make_serializer(options)
+    records = [make_record(i) for i in range(5)]
+    serializer.serialize_many(records, tmp_path / "records.bin")
+    data = serializer.dumps_many(records)
+    assert data == (tmp_path / "records.bin").read_bytes()
+    assert serializer.loads_many(data) == serializer.deserialize_many(tmp_path / "records.bin") == records
+    assert serializer.loads_many(serializer.dumps_many([])) == []
+    with pytest.raises(ValueError):
+        serializer.loads_many(serializer.dumps(records[0]))
+
+
+@pytest.mark.parametrize("options", OPTIONS.values(), ids=OPTIONS.keys())
+def test_round_trip_edge_values(options):
+    serializer = make_serializer(options)
+    for record in edge_records():
+        data = serializer.dumps(record)
+        assert serializer.loads(data) == record
+
+        lazy = serializer.loads(data, lazy=True)
+        assert {field: getattr(lazy, field) for field in SCHEMA["value_type"]} == vars(record)
+
+        projected = serializer.loads(data, fields=["name", "item.title", "maybe_item.price", "maybe_scores"])
+        expected_item = None if record.maybe_item is None else Item(price=record.maybe_item.price)
+        assert vars(projected) == {
+            "name": record.name,
+            "item": Item(title=record.item.title),
+            "maybe_item": expected_item,
+            "maybe_scores": record.maybe_scores,
+        }
+
+
+def deep_record(depth: int):
+    # list<dict<string, list<...int>>> глубины depth
+    schema, value = "int", 7
+    for level in range(depth):
+        if level % 2:
+            schema = {"type": "dict", "value_type": {"keys": "string", "values": schema}}
+            value = {f"уровень {level}": value}
+        else:
+            schema = {"type": "list", "value_type": schema}
+            value = [value, value] if level < 4 else [value]
+    return {"type": "class", "classname": "Record", "value_type": {"payload": schema}}, Record(payload=value)
+
+
+@pytest.mark.parametrize("options", [OPTIONS["plain"], OPTIONS["everything"]], ids=["plain", "everything"])
+def test_round_trip_deep_nesting(options):
+    schema, record = deep_record(150)
+    serializer = Serializer(schema, __name__, **options)
+    data = serializer.dumps(record)
+    assert serializer.loads(data) == record
+    assert serializer.loads(data, lazy=True).payload == record.payload
+    assert serializer.loads_many(serializer.dumps_many([record, record])) == [record, record]
+
+
+def test_too_deep_schema_is_rejected():
+    recursion_limit = sys.getrecursionlimit()
+    schema, _ = deep_record(20000)
+    with pytest.raises(ValueError):
+        Serializer(schema, __name__)
+    assert sys.getrecursionlimit() == recursion_limit
+
+
+def test_schema_evolution():
+    writer_schema = {"type": "class", "classname": "Record", "value_type": {
+        "id": "int8",
+        "name": "string",
+        "dropped": {"type": "list", "value_type": "string"},
+        "item": {"type": "class", "classname": "Item", "value_type": {"title": "string", "price": "float32"}},
+    }}
+    reader_schema = {"type": "class", "classname": "Record", "value_type": {
+        "id": "int64",
+        "name": "string",
+        "added": {"type": "list", "value_type": "int", "default": [1]},
+        "item": {"type": "class", "classname": "Item", "value_type": {
+            "price": "float",
+            "currency": {"type": "string", "default": "RUB"},
+        }},
+    }}
+    written = Record(id=-3, name="Ёжик", dropped=["a"], item=Item(title="soap", price=1.5))
+    reader = Serializer(reader_schema, __name__)
+    for options in ({}, {"intern_strings": True, "dedup": True}):
+        writer = Serializer(writer_schema, __name__, **options)
+        decoded = reader.loads(writer.dumps(written))
+        assert decoded == Record(id=-3, name="Ёжик", added=[1], item=Item(price=1.5, currency="RUB"))
+        decoded.added.append(2)
+        assert reader.loads(writer.dumps(written)).added == [1]
+        assert vars(reader.loads(writer.dumps(written), fields=["item.currency", "id"])) == {
+            "id": -3, "item": Item(currency="RUB")
+        }
@@ -0,0 +1,90 @@
+import pytest
+
+from binary_serializer import Serializer
+from container import ContainerWriter, iter_records
+from test_binary_serializer import OPTIONS, SCHEMA, Item, edge_records, make_record, make_serializer
+
+
+class Person:
+    def __init__(self, name: str = "", city: str = ""):
+        self.name = name
+        self.city = city
+
+    def __eq__(self, other):
+        return type(other) is type(self) and vars(other) == vars(self)
+
+    def __repr__(self) -> str:
+        return f"Person({self.name!r}, {self.city!r})"
+
+
+PERSON_SCHEMA = {
+    "type": "class",
+    "classname": "Person",
+    "value_type": {"name": "string", "city": "string"},
+}
+
+
+def test_interned_block_survives_other_calls(tmp_path):
+    serializer = Serializer(PERSON_SCHEMA, __name__, intern_strings=True)
+    with ContainerWriter(tmp_path / "people.bin", serializer) as writer:
+        writer.append(Person("alice", "paris"))
+        assert serializer.loads(serializer.dumps(Person("zed", "tokyo"))) == Person("zed", "tokyo")
+        writer.append(Person("bob", "paris"))
+
+    assert list(iter_records(tmp_path / "people.bin", serializer)) == [
+        Person("alice", "paris"), Person("bob", "paris")
+    ]
+
+
+def test_lazy_records_keep_their_strings(tmp_path):
+    serializer = Serializer(PERSON_SCHEMA, __name__, intern_strings=True)
+    first = serializer.loads(serializer.dumps(Person("alice", "paris")), lazy=True)
+    second = serializer.loads(serializer.dumps(Person("bob", "tokyo")), lazy=True)
+    with ContainerWriter(tmp_path / "people.bin", serializer) as writer:
+        writer.append(Person("carol", "oslo"))
+        assert (first.name, first.city) == ("alice", "paris")
+        writer.append(Person("dave", "rome"))
+    assert (second.city, second.name) == ("tokyo", "bob")
+
+    assert list(iter_records(tmp_path / "people.bin", serializer)) == [
+        Person("carol", "oslo"), Person("dave", "rome")
+    ]
+
+
+@pytest.mark.parametrize("options", OPTIONS.values(), ids=OPTIONS.keys())
+def test_container_appends_and_reads(options, tmp_path):
+    serializer = make_serializer(options)
+    first = [make_record(i) for i in range(40)]
+    # маленькие блоки - записи расходятся по многим блокам
+    with ContainerWriter(tmp_path / "records.bin", serializer, block_size=512) as writer:
+        writer.extend(first)
+    with ContainerWriter(tmp_path / "records.bin", serializer, block_size=512, append=True) as writer:
+        writer.extend(edge_records())
+    records = first + edge_records()
+
+    assert list(iter_records(tmp_path / "records.bin", serializer)) == records
+    lazy = list(iter_records(tmp_path / "records.bin", serializer, lazy=True))
+    assert [(record.maybe_name, record.items) for record in lazy] == [
+        (record.maybe_name, record.items) for record in records
+    ]
+    projected = iter_records(tmp_path / "records.bin", serializer, fields=["count", "item.title"])
+    assert [vars(record) for record in projected] == [
+        {"count": record.count, "item": Item(title=record.item.title)} for record in records
+    ]
+
+
+def test_container_append_needs_the_same_schema(tmp_path):
+    with ContainerWriter(tmp_path / "people.bin", Serializer(SCHEMA, __name__)) as writer:
+        writer.append(make_record(0))
+    with pytest.raises(ValueError):
+        ContainerWriter(tmp_path / "people.bin", Serializer(PERSON_SCHEMA, __name__), append=True)
+
+
+def test_container_read_with_newer_schema(tmp_path):
+    with ContainerWriter(tmp_path / "people.bin", Serializer(PERSON_SCHEMA, __name__)) as writer:
+        writer.extend([Person("alice", "paris"), Person("Юля", "")])
+    reader_schema = {**PERSON_SCHEMA, "value_type": {"name": "string", "age": {"type": "int8", "default": 0}}}
+    reader = Serializer(reader_schema, __name__)
+    assert [(person.name, person.age) for person in iter_records(tmp_path / "people.bin", reader)] == [
+        ("alice", 0), ("Юля", 0)
+    ]
@@ -0,0 +1,75 @@
+import pytest
+
+from binary_serializer import Serializer
+from indexed_file import IndexedWriter, IndexedReader
+from test_binary_serializer import OPTIONS, edge_records, make_record, make_serializer
+
+
+class Person:
+    def __init__(self, name: str = "", city: str = "", age: int = 0):
+        self.name = name
+        self.city = city
+        self.age = age
+
+    def __eq__(self, other):
+        return type(other) is type(self) and vars(other) == vars(self)
+
+    def __repr__(self) -> str:
+        return f"Person({self.name!r}, {self.city!r}, {self.age})"
+
+
+SCHEMA = {
+    "type": "class",
+    "classname": "Person",
+    "value_type": {"name": "string", "city": "string", "age": "int"},
+}
+
+PEOPLE = [Person("alice", "paris", 30), Person("bob", "paris", 41), Person("Юля", "tokyo", 0)]
+
+
+@pytest.mark.parametrize("intern_strings", [False, True])
+def test_random_access_and_key_lookup(intern_strings, tmp_path):
+    serializer = Serializer(SCHEMA, __name__, intern_strings=intern_strings)
+    with IndexedWriter(tmp_path / "people.idx", serializer, key_field="name") as writer:
+        writer.extend(PEOPLE)
+
+    with IndexedReader(tmp_path / "people.idx", serializer) as reader:
+        assert len(reader) == len(PEOPLE)
+        assert reader[2] == PEOPLE[2]
+        assert reader[-3] == PEOPLE[0]
+        assert list(reader) == PEOPLE
+        assert reader.get("bob") == PEOPLE[1]
+        assert reader.get("nobody") is None
+        with pytest.raises(IndexError):
+            reader[3]
+
+
+def test_interned_file_survives_other_calls(tmp_path):
+    serializer = Serializer(SCHEMA, __name__, intern_strings=True)
+    with IndexedWriter(tmp_path / "people.idx", serializer) as writer:
+        writer.append(PEOPLE[0])
+        assert serializer.loads(serializer.dumps(Person("zed", "oslo"))) == Person("zed", "oslo")
+        writer.append(PEOPLE[1])
+
+    with IndexedReader(tmp_path / "people.idx", serializer, lazy=True) as reader:
+        first, second = reader[0], reader[1]
+        other = serializer.loads(serializer.dumps(Person("zed", "oslo")), lazy=True)
+        assert (second.city, second.name, second.age) == ("paris", "bob", 41)
+        assert (other.name, first.name) == ("zed", "alice")
+
+
+@pytest.mark.parametrize("options", OPTIONS.values(), ids=OPTIONS.keys())
+def test_indexed_round_trip(options, tmp_path):
+    serializer = make_serializer(options)
+    records = [make_record(i) for i in range(20)] + edge_records()
+    with IndexedWriter(tmp_path / "records.idx", serializer, key_field="name") as writer:
+        writer.extend(records)
+
+    with IndexedReader(tmp_path / "records.idx", serializer) as reader:
+        assert list(reader) == records
+        assert reader[-1] == records[-1]
+        assert reader.get(records[7].name) == records[7]
+    with IndexedReader(tmp_path / "records.idx", serializer, fields="maybe_item") as reader:
+        assert [vars(record) for record in reader] == [{"maybe_item": record.maybe_item} for record in records]
+    with IndexedReader(tmp_path / "records.idx", serializer, lazy=True) as reader:
+        assert reader[21].nested == records[21].nested
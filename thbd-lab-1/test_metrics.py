@@ -0,0 +1,242 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from binary_serializer import Serializer
+from classes import UserClass
+from metrics import SerializerMetrics
+
+EXAMPLE_SCHEMA = yaml.safe_load(
+    (Path(__file__).parent / "MySerializerData" / "example_schema.yaml").read_text()
+)
+
+COMBOS = {
+    "BigCheese": ["Cheese", "Sauce", "Napkins"],
+    "CocaColaExtra": ["CocaCola", "Ice", "Bonus Glass"]
+}
+VERY_COMPLICATED = [
+    {"HelloWorld": [[1, 2], [3, 4], [5, 6]]},
+    {
+        "Hey, serializers!": [[10, 20, 30, 40, 50]],
+        "Hey, yaml!": [[1100, 1200, 1300, 1400, 1500, 1600, 1700]]
+    }
+]
+
+
+def make_user() -> UserClass:
+    # Пользователь из примера (как make_user(0) в run_test.py)
+    user = UserClass()
+    user.name = "John"
+    user.surname = "Doe"
+    user.age = 27
+    user.current_balance = 100.0
+    user.basket.items = ["Soap", "Latex Gloves", "Detergent"]
+    user.basket.quantities = [1, 1, 1]
+    user.basket.prices = [15.0, 15.0, 60.0]
+    user.basket.combos = COMBOS
+    user.very_complicated_list_of_dicts_of_lists = VERY_COMPLICATED
+    return user
+
+
+def string_size(value: str) -> int:
+    # код string + признак строки целиком + длина + utf-8
+    return 1 + 1 + 4 + len(value.encode("utf-8"))
+
+
+def list_size(item_sizes) -> int:
+    # код + длина + длина перед каждым элементом
+    return 1 + 4 + sum(4 + size for size in item_sizes)
+
+
+def dict_size(pair_sizes) -> int:
+    return 1 + 4 + sum(8 + key_size + value_size for key_size, value_size in pair_sizes)
+
+
+def int_list_size(values) -> int:
+    return list_size([1 + 4] * len(values))
+
+
+def measured(serializer: Serializer):
+    # Все функции, до которых можно дойти от кодировщика и декодировщика объекта
+    seen = {}
+    pending = [serializer._encode_object, serializer._decode_object]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, (list, tuple)):
+            pending.extend(value)
+        elif callable(value) and hasattr(value, "__code__") and id(value) not in seen:
+            seen[id(value)] = value
+            pending.extend(cell.cell_contents for cell in value.__closure__ or ())
+    return {function.__name__ for function in seen.values()} & {"encode_measured", "decode_measured"}
+
+
+@pytest.fixture
+def metrics():
+    return SerializerMetrics()
+
+
+@pytest.fixture
+def serializer(metrics):
+    return Serializer(EXAMPLE_SCHEMA, "classes", metrics=metrics)
+
+
+def test_measured_encoder_counts_calls_and_bytes(metrics):
+    def encode(value, out: bytearray, state):
+        out += value
+
+    encode_measured = metrics.measured_encoder("field", "string", encode)
+    out = bytearray(b"xx")
+    encode_measured(b"abc", out, None)
+    encode_measured(b"de", out, None)
+
+    assert out == b"xxabcde"
+    count, time_ns, size = metrics.fields["field"]["encode"]
+    assert (count, size) == (2, 5)
+    assert time_ns > 0
+    assert metrics.types["string"]["encode"] == [2, time_ns]
+    assert metrics.fields["field"]["decode"] == [0, 0, 0]
+
+
+def test_measured_decoder_counts_calls_and_bytes(metrics):
+    def decode(buffer, pos: int, state):
+        return buffer[pos], pos + 3
+
+    decode_measured = metrics.measured_decoder("", "int", decode)
+    assert decode_measured(b"abcdefg", 1, None) == (ord("b"), 4)
+
+    # пустой путь - сам объект
+    count, time_ns, size = metrics.fields["<object>"]["decode"]
+    assert (count, size) == (1, 3)
+    assert metrics.types["int"]["decode"] == [1, time_ns]
+
+
+def test_nested_time_is_not_counted_twice(metrics):
+    def encode_inner(value, out: bytearray, state):
+        out += b"inner"
+
+    encode_inner_measured = metrics.measured_encoder("outer.inner", "string", encode_inner)
+
+    def encode_outer(value, out: bytearray, state):
+        out += b"<"
+        encode_inner_measured(value, out, state)
+        encode_inner_measured(value, out, state)
+        out += b">"
+
+    metrics.measured_encoder("outer", "class", encode_outer)(None, bytearray(), None)
+
+    outer_time = metrics.fields["outer"]["encode"][1]
+    inner_time = metrics.fields["outer.inner"]["encode"][1]
+    assert metrics.fields["outer"]["encode"][2] == 12
+    assert metrics.fields["outer.inner"]["encode"][2] == 10
+    assert metrics.types["string"]["encode"] == [2, inner_time]
+    assert metrics.types["class"]["encode"] == [1, outer_time - inner_time]
+
+
+def test_failed_call_keeps_nesting_consistent(metrics):
+    def encode(value, out: bytearray, state):
+        raise TypeError("bad value")
+
+    with pytest.raises(TypeError):
+        metrics.measured_encoder("broken", "int", encode)(1, bytearray(), None)
+
+    assert metrics._nested == []
+    assert metrics.fields["broken"]["encode"] == [0, 0, 0]
+
+
+def test_example_schema_paths(serializer, metrics):
+    user = make_user()
+    data = serializer.dumps(user)
+    serializer.loads(data)
+
+    fields = metrics.fields
+    pairs = [pair for item in VERY_COMPLICATED for pair in item.items()]
+    int_lists = [values for _, lists in pairs for values in lists]
+    combos_size = dict_size(
+        (string_size(key), list_size(map(string_size, values))) for key, values in COMBOS.items()
+    )
+    item_sizes = [
+        dict_size((string_size(key), list_size(map(int_list_size, lists))) for key, lists in item.items())
+        for item in VERY_COMPLICATED
+    ]
+    expected = {
+        "basket.combos": ("dict", 1, combos_size),
+        "basket.combos{keys}": ("string", 2, sum(map(string_size, COMBOS))),
+        "basket.combos{}": ("list", 2, sum(list_size(map(string_size, values)) for values in COMBOS.values())),
+        "basket.combos{}[]": ("string", 6, sum(string_size(value) for values in COMBOS.values() for value in values)),
+        "very_complicated_list_of_dicts_of_lists": ("list", 1, list_size(item_sizes)),
+        "very_complicated_list_of_dicts_of_lists[]": ("dict", 2, sum(item_sizes)),
+        "very_complicated_list_of_dicts_of_lists[]{keys}": ("string", 3, sum(string_size(key) for key, _ in pairs)),
+        "very_complicated_list_of_dicts_of_lists[]{}": (
+            "list", 3, sum(list_size(map(int_list_size, lists)) for _, lists in pairs)
+        ),
+        "very_complicated_list_of_dicts_of_lists[]{}[]": ("list", 5, sum(map(int_list_size, int_lists))),
+        "very_complicated_list_of_dicts_of_lists[]{}[][]": ("int", 18, 18 * 5),
+    }
+    for path, (field_type, count, size) in expected.items():
+        assert fields[path]["type"] == field_type, path
+        for op in ("encode", "decode"):
+            assert fields[path][op][0] == count, (path, op)
+            assert fields[path][op][2] == size, (path, op)
+
+    assert combos_size == 165
+    assert list_size(item_sizes) == 324
+    # весь объект - все, кроме заголовка со схемой
+    object_size = fields["<object>"]["encode"][2]
+    assert object_size == fields["<object>"]["decode"][2]
+    assert object_size < len(data)
+
+
+def test_type_self_times_add_up_to_total(serializer, metrics):
+    serializer.loads(serializer.dumps(make_user()))
+
+    for op in ("encode", "decode"):
+        total = metrics.fields["<object>"][op][1]
+        assert sum(stats[op][1] for stats in metrics.types.values()) == total
+        assert all(stats[op][1] >= 0 for stats in metrics.types.values())
+        # число вызовов по типам - то же, что по полям
+        assert sum(stats[op][0] for stats in metrics.types.values()) == sum(
+            stats[op][0] for stats in metrics.fields.values()
+        )
+
+
+def test_reset_keeps_compiled_wrappers_counting(serializer, metrics):
+    user = make_user()
+    serializer.loads(serializer.dumps(user))
+    first = {path: (stats["encode"][0], stats["encode"][2]) for path, stats in metrics.fields.items()}
+
+    metrics.reset()
+    assert all(
+        stats["encode"] == [0, 0, 0] and stats["decode"] == [0, 0, 0]
+        for stats in metrics.fields.values()
+    )
+    assert all(stats["encode"] == [0, 0] and stats["decode"] == [0, 0] for stats in metrics.types.values())
+
+    serializer.loads(serializer.dumps(user))
+    assert {path: (stats["encode"][0], stats["encode"][2]) for path, stats in metrics.fields.items()} == first
+
+
+def test_to_json(serializer, metrics):
+    serializer.loads(serializer.dumps(make_user()))
+
+    report = json.loads(metrics.to_json())
+    assert report == metrics.to_dict()
+    combos = report["fields"]["basket.combos"]
+    assert combos["type"] == "dict"
+    assert combos["encode"]["count"] == 1
+    assert combos["encode"]["bytes"] == 165
+    assert combos["decode"]["time_ns"] == metrics.fields["basket.combos"]["decode"][1]
+    assert report["types"]["string"]["encode"] == {
+        "count": metrics.types["string"]["encode"][0],
+        "self_time_ns": metrics.types["string"]["encode"][1],
+    }
+
+
+def test_no_wrappers_without_metrics(serializer):
+    assert measured(serializer) == {"encode_measured", "decode_measured"}
+
+    plain = Serializer(EXAMPLE_SCHEMA, "classes")
+    assert plain.metrics is None
+    assert measured(plain) == set()
+    assert plain.loads(plain.dumps(make_user())).basket.combos == COMBOS
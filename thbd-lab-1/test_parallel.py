@@ -0,0 +1,52 @@
+import pytest
+
+from binary_serializer import Serializer
+from parallel import serialize_parallel, deserialize_parallel
+from schema_registry import SchemaRegistry
+
+
+class Point:
+    def __init__(self, x: int = 0, label: str = ""):
+        self.x = x
+        self.label = label
+
+    def __eq__(self, other):
+        return type(other) is type(self) and vars(other) == vars(self)
+
+    def __repr__(self) -> str:
+        return f"Point({self.x}, {self.label!r})"
+
+
+SCHEMA = {"type": "class", "classname": "Point", "value_type": {"x": "int", "label": "string"}}
+READER_SCHEMA = {"type": "class", "classname": "Point", "value_type": {"x": "int64", "label": "string"}}
+
+POINTS = [Point(i, f"точка {i % 7}") for i in range(250)]
+
+OPTIONS = {
+    "plain": {},
+    "zlib": {"compression": "zlib"},
+    "interned": {"intern_strings": True},
+}
+
+
+@pytest.mark.parametrize("options", OPTIONS.values(), ids=OPTIONS.keys())
+def test_parallel_matches_serialize_many(options, tmp_path):
+    serializer = Serializer(SCHEMA, __name__, **options)
+    serializer.serialize_many(POINTS, tmp_path / "many.bin")
+    expected = serializer.deserialize_many(tmp_path / "many.bin")
+
+    serialize_parallel(POINTS, tmp_path / "points.bin", SCHEMA, __name__, chunk_size=16, max_workers=3, **options)
+    assert list(deserialize_parallel(tmp_path / "points.bin", SCHEMA, __name__, max_workers=3, **options)) == expected
+    assert expected == POINTS
+
+
+def test_parallel_with_registry(tmp_path):
+    registry = SchemaRegistry()
+    serialize_parallel(
+        POINTS, tmp_path / "points.bin", SCHEMA, __name__,
+        chunk_size=32, max_workers=2, registry=registry, embed_schema=False
+    )
+    records = deserialize_parallel(
+        tmp_path / "points.bin", READER_SCHEMA, __name__, fields=["x"], max_workers=2, registry=registry
+    )
+    assert [point.x for point in records] == [point.x for point in POINTS]
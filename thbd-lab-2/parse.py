@@ -1,65 +1,664 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.ipc as ipc
 import pyarrow.csv as pv
 import pyarrow.parquet as pq
 import pyarrow.orc as orc
 from pathlib import Path
-from time import time
+from time import perf_counter
+from itertools import product
+from multiprocessing import get_context
+from statistics import median
+import argparse
+import io
 import os
+import resource
+import shutil
 import pandas as pd
 
+import synthetic_data
 
-filename = Path("input.csv")
-parquet_output = Path("parquet_out.parquet")
-orc_output = Path("orc_output.orc")
 
-stats = []
+# CSV читается потоком, пачками по block_size байт (pv.open_csv), и каждая
+# пачка сразу дописывается в parquet (ParquetWriter) и orc (ORCWriter).
+# В памяти одновременно держится несколько пачек, а не вся таблица,
+# поэтому входной файл может быть сколь угодно большим.
+# Типы колонок выводятся один раз, по первым --sample-mb МБ файла,
+# и закрепляются (ConvertOptions.column_types) для всех чтений CSV,
+# так что схема не зависит от --block-size и одинакова у всех пачек.
+# Если тип колонки по началу файла не угадать (например, в начале
+# только целые, а дальше дробные), его можно задать явно: --column-types
+#
+# python parse.py --input input.csv --block-size 64
+# python parse.py --input input.csv --column-types id:int64 price:double created:timestamp[s]
+#
+# --sweep - перебор настроек записи: для parquet кодек (и уровень сжатия),
+# размер row group, словарное кодирование и размер страницы данных,
+# для orc - кодек и размер stripe. CSV один раз перекладывается в arrow
+# файл (sweep_input.arrow), из которого каждая комбинация читает пачки
+# через mmap, а сама комбинация (запись + чтение) идет в отдельном процессе,
+# чтобы пиковая память считалась для нее одной.
+# Результат - таблица, отсортированная по среднему месту по размеру,
+# времени записи и чтения, и sweep_results.csv
+#
+# python parse.py --input sample.csv --sweep --parquet-codecs snappy zstd:3 --row-groups 131072 1048576
+#
+# --read-scenarios - после конвертации замеряет чтение записанных файлов:
+# все колонки, только --columns (проекция), с фильтром строк
+# (--filter-column, --filter-op, --filter-value; для parquet фильтр
+# отбрасывает row group по статистикам min/max), через mmap и обычным
+# чтением, без потоков и с потоками на --cores ядрах. Для каждого сценария -
+# медиана задержки и сколько байт реально прочитано из файла.
+# У orc в pyarrow нет фильтра при чтении, строки отбираются уже после
+#
+# python parse.py --read-scenarios --columns id price --filter-column price --filter-value 100
+#
+# --generate-mb - вместо готового input.csv сначала сгенерировать его
+# (synthetic_data.py) заданного размера из --seed по описанию --schema,
+# чтобы результаты повторялись на других машинах и запусках
+#
+# python parse.py --generate-mb 1024 --seed 42 --schema id:int:sorted city:str_low user:str_high
+#
+# --dataset - после конвертации CSV еще раз потоком пишется в папки
+# parquet_dataset/ и orc_dataset/ с hive разбиением по --partition-column
+# (column=value/part-N.*), файлы пишутся параллельно, размер файла
+# ограничен --max-file-mb (переводится в строки по размеру строки
+# в одиночном файле). Затем сравнивается полный скан датасета со сканом
+# с фильтром по колонке разбиения, который читает только подходящие папки
+#
+# python parse.py --dataset --partition-column category --max-file-mb 256 --write-threads 8
 
-original_filesize = os.stat(filename).st_size
-stats.append([original_filesize / 1024**2, None, None, 100])
+MB = 1024**2
 
 
-print(f"Original filesize = {(original_filesize  / 1024**2):.5f} megabytes")
-table = pv.read_csv(filename)
-start = time()
-pq.write_table(table, parquet_output)
-write_time = time() - start
-start = time()
-pq.read_table(parquet_output)
-read_time = time() - start
+def parse_args():
+    parser = argparse.ArgumentParser(description="Streaming CSV -> Parquet/ORC benchmark")
+    parser.add_argument("--input", type=Path, default=Path("input.csv"))
+    parser.add_argument("--parquet-output", type=Path, default=Path("parquet_out.parquet"))
+    parser.add_argument("--orc-output", type=Path, default=Path("orc_output.orc"))
+    parser.add_argument("--block-size", type=int, default=64, help="CSV block per record batch, MB")
+    parser.add_argument("--sample-mb", type=int, default=64, help="CSV sample the column types are inferred from")
+    parser.add_argument("--column-types", nargs="+", default=[], help="pinned column types, name:type (int64, double...)")
+    parser.add_argument("--generate-mb", type=float, help="generate a synthetic input of this size first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--schema",
+        nargs="+",
+        default=synthetic_data.DEFAULT_COLUMNS,
+        help="synthetic columns, name:type[:sorted][:nulls=F]",
+    )
+    parser.add_argument("--null-fraction", type=float, default=0.0)
+    parser.add_argument("--dataset", action="store_true", help="benchmark partitioned datasets")
+    parser.add_argument("--partition-column", help="by default the first string column")
+    parser.add_argument("--partition-value", help="scanned partition, by default the first one found")
+    parser.add_argument("--max-file-mb", type=float, default=512)
+    parser.add_argument("--max-partitions", type=int, default=1024)
+    parser.add_argument("--write-threads", type=int, help="I/O threads writing files in parallel")
+    parser.add_argument("--sweep", action="store_true", help="benchmark a matrix of writer settings")
+    parser.add_argument("--sweep-output", type=Path, default=Path("sweep_results.csv"))
+    parser.add_argument(
+        "--parquet-codecs",
+        nargs="+",
+        default=["none", "snappy", "gzip", "lz4", "brotli", "zstd:1", "zstd:3", "zstd:9"],
+        help="codec or codec:level",
+    )
+    parser.add_argument("--row-groups", type=int, nargs="+", default=[128 * 1024, 1024 * 1024], help="rows")
+    parser.add_argument("--dictionary", nargs="+", choices=["on", "off"], default=["on", "off"])
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[64, 1024], help="data page size, KB")
+    parser.add_argument(
+        "--orc-codecs",
+        nargs="+",
+        default=["uncompressed", "snappy", "zlib", "lz4", "zstd"],
+    )
+    parser.add_argument("--stripe-sizes", type=int, nargs="+", default=[16, 64], help="MB")
+    parser.add_argument("--read-scenarios", action="store_true", help="benchmark projection/filter/mmap/thread reads")
+    parser.add_argument("--columns", nargs="+", help="projected columns, by default the first 3")
+    parser.add_argument("--filter-column", help="by default the first numeric column")
+    parser.add_argument("--filter-op", choices=["<", "<=", ">", ">=", "=="], default=">=")
+    parser.add_argument("--filter-value", help="by default keeps the top 10%% of the column range")
+    parser.add_argument("--cores", type=int, nargs="+", help="thread pool sizes, by default 1, 2, 4 ... all")
+    parser.add_argument("--read-repeats", type=int, default=5)
+    return parser.parse_args()
 
-stats.append([
-    round(os.stat(parquet_output).st_size / 1024**2, 5),
-    round(write_time, 5),
-    round(read_time, 5),
-    round(os.stat(parquet_output).st_size * 100 / original_filesize, 5),
-])
-print(f"Writing a parquet table took {(write_time):5f} seconds")
-print(f"Reading it back took {read_time:.5f} seconds")
-print(f"Parquet filesize = {(os.stat(parquet_output).st_size / 1024**2):.5f} megabytes")
-print(f"In % to original filesize = {(os.stat(parquet_output).st_size * 100 / original_filesize):.5f}")
 
+def peak_rss() -> float:
+    # Пик памяти процесса с его запуска, в МБ (ru_maxrss в Linux - в КБ)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
-start = time()
-orc.write_table(table, orc_output)
-write_time = time() - start
-start = time()
-orc.read_table(orc_output)
-read_time = time() - start
 
-stats.append([
-    round(os.stat(orc_output).st_size / 1024**2, 5),
-    round(write_time, 5),
-    round(read_time, 5),
-    round(os.stat(orc_output).st_size * 100 / original_filesize, 5),
-])
+def parse_column_types(specs: list) -> dict:
+    # ["id:int64", "created:timestamp[s]"] -> {"id": pa.int64(), "created": pa.timestamp("s")}
+    column_types = {}
+    for spec in specs:
+        name, _, type_name = spec.rpartition(":")
+        if not name:
+            raise ValueError(f"Column type {spec} is not name:type")
+        column_types[name] = pa.type_for_alias(type_name)
+    return column_types
 
 
-print(f"Writing an orc table took {(time()-start):5f} seconds")
-print(f"Reading it back took {read_time:.5f} seconds")
-print(f"Orc filesize = {(os.stat(orc_output).st_size / 1024**2):.5f} megabytes")
-print(f"In % to original filesize = {(os.stat(orc_output).st_size * 100 / original_filesize):.5f}")
+def csv_convert_options(filename: Path, sample_mb: int, column_types: dict) -> pv.ConvertOptions:
+    # Схема выводится один раз по пробному куску начала файла (явно заданные
+    # типы не выводятся) и дальше закреплена для всех пачек
+    reader = pv.open_csv(
+        filename,
+        read_options=pv.ReadOptions(block_size=sample_mb * MB),
+        convert_options=pv.ConvertOptions(column_types=column_types),
+    )
+    schema = reader.schema
+    reader.close()
+    return pv.ConvertOptions(column_types={field.name: field.type for field in schema})
 
 
-print("\n-----\nSUMMARY\n")
-stats = pd.DataFrame(stats, columns=["Size (MB)", "Write time (seconds)", "Read time (seconds", "% to the original size"])
-stats.index = ["Original", "Parquet", "ORC"]
-print(stats)
+def open_csv(filename: Path, block_size: int, convert_options: pv.ConvertOptions):
+    return pv.open_csv(
+        filename,
+        read_options=pv.ReadOptions(block_size=block_size),
+        convert_options=convert_options,
+    )
+
+
+def convert(
+        filename: Path,
+        parquet_output: Path,
+        orc_output: Path,
+        block_size: int,
+        convert_options: pv.ConvertOptions
+) -> dict:
+    # Один проход по CSV, время чтения CSV и записи каждого формата считается отдельно
+    times = {"csv": 0.0, "parquet": 0.0, "orc": 0.0}
+    rows = 0
+
+    start = perf_counter()
+    reader = open_csv(filename, block_size, convert_options)
+    times["csv"] += perf_counter() - start
+
+    with pq.ParquetWriter(parquet_output, reader.schema) as parquet_writer:
+        orc_writer = orc.ORCWriter(orc_output)
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    batch = reader.read_next_batch()
+                except StopIteration:
+                    break
+                times["csv"] += perf_counter() - start
+                rows += batch.num_rows
+
+                start = perf_counter()
+                parquet_writer.write_batch(batch)
+                times["parquet"] += perf_counter() - start
+
+                start = perf_counter()
+                orc_writer.write(pa.Table.from_batches([batch]))
+                times["orc"] += perf_counter() - start
+        finally:
+            start = perf_counter()
+            orc_writer.close()
+            times["orc"] += perf_counter() - start
+
+    return {"rows": rows, "times": times}
+
+
+def read_parquet(path: Path) -> int:
+    # Чтение тоже потоковое - по пачкам, без сборки всей таблицы
+    rows = 0
+    for batch in pq.ParquetFile(path).iter_batches():
+        rows += batch.num_rows
+    return rows
+
+
+def read_orc(path: Path) -> int:
+    orc_file = orc.ORCFile(path)
+    rows = 0
+    for stripe in range(orc_file.nstripes):
+        rows += orc_file.read_stripe(stripe).num_rows
+    return rows
+
+
+def stage_input(filename: Path, staging: Path, block_size: int, convert_options: pv.ConvertOptions) -> int:
+    # CSV -> arrow IPC файл без сжатия: дальше пачки читаются из него
+    # через mmap, и разбор CSV не входит в время каждой комбинации
+    reader = open_csv(filename, block_size, convert_options)
+    rows = 0
+    with ipc.new_file(staging, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def iter_staged(staging: Path):
+    with pa.memory_map(str(staging)) as source:
+        staged = ipc.open_file(source)
+        for i in range(staged.num_record_batches):
+            yield staged.get_batch(i)
+
+
+def write_parquet(batches, schema: pa.Schema, path: Path, options: dict, row_group_size: int):
+    # write_batch пишет минимум одну row group на вызов, поэтому пачки
+    # копятся до row_group_size строк и пишутся вместе
+    pending = []
+    pending_rows = 0
+    with pq.ParquetWriter(path, schema, **options) as writer:
+        for batch in batches:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= row_group_size:
+                writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_size)
+                pending = []
+                pending_rows = 0
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_size)
+
+
+def write_orc(batches, path: Path, options: dict):
+    writer = orc.ORCWriter(path, **options)
+    try:
+        for batch in batches:
+            writer.write(pa.Table.from_batches([batch]))
+    finally:
+        writer.close()
+
+
+def parquet_combinations(args) -> list:
+    combinations = []
+    for codec, row_group_size, dictionary, page_size in product(
+            args.parquet_codecs, args.row_groups, args.dictionary, args.page_sizes
+    ):
+        codec, _, level = codec.partition(":")
+        combinations.append({
+            "format": "parquet",
+            "codec": codec,
+            "level": int(level) if level else None,
+            "row_group_size": row_group_size,
+            "dictionary": dictionary == "on",
+            "page_size_kb": page_size,
+        })
+    return combinations
+
+
+def orc_combinations(args) -> list:
+    return [
+        {"format": "orc", "codec": codec, "stripe_size_mb": stripe_size}
+        for codec, stripe_size in product(args.orc_codecs, args.stripe_sizes)
+    ]
+
+
+def run_combination(task) -> dict:
+    # Выполняется в отдельном процессе: ru_maxrss - пик именно этой комбинации
+    staging, output, combination = task
+    with pa.memory_map(str(staging)) as source:
+        schema = ipc.open_file(source).schema
+    if combination["format"] == "parquet":
+        options = {
+            "compression": combination["codec"],
+            "compression_level": combination["level"],
+            "use_dictionary": combination["dictionary"],
+            "data_page_size": combination["page_size_kb"] * 1024,
+        }
+        _, write_time = timed(
+            write_parquet, iter_staged(staging), schema, output, options, combination["row_group_size"]
+        )
+        _, read_time = timed(read_parquet, output)
+    else:
+        options = {
+            "compression": combination["codec"],
+            "stripe_size": combination["stripe_size_mb"] * MB,
+        }
+        _, write_time = timed(write_orc, iter_staged(staging), output, options)
+        _, read_time = timed(read_orc, output)
+
+    size = os.stat(output).st_size
+    os.remove(output)
+    return {
+        **combination,
+        "size_mb": round(size / MB, 5),
+        "write_s": round(write_time, 5),
+        "read_s": round(read_time, 5),
+        "peak_rss_mb": round(peak_rss(), 1),
+    }
+
+
+def sweep(args):
+    block_size = args.block_size * MB
+    staging = Path("sweep_input.arrow")
+    convert_options = csv_convert_options(args.input, args.sample_mb, parse_column_types(args.column_types))
+    rows = stage_input(args.input, staging, block_size, convert_options)
+    original_filesize = os.stat(args.input).st_size
+    print(f"Sweeping writer settings over {rows} rows ({(original_filesize / MB):.5f} MB of CSV)")
+
+    combinations = parquet_combinations(args) + orc_combinations(args)
+    tasks = [
+        (staging, Path(f"sweep_{i}.{combination['format']}"), combination)
+        for i, combination in enumerate(combinations)
+    ]
+    results = []
+    # maxtasksperchild=1 - каждая комбинация в новом процессе
+    with get_context("spawn").Pool(processes=1, maxtasksperchild=1) as pool:
+        for result in pool.imap(run_combination, tasks):
+            print(
+                f"{result['format']:>8} {result['codec']:>12}: {result['size_mb']:.3f} MB, "
+                f"write {result['write_s']:.3f} s, read {result['read_s']:.3f} s"
+            )
+            results.append(result)
+    os.remove(staging)
+
+    stats = pd.DataFrame(results)
+    stats["% to the original size"] = (stats["size_mb"] * MB * 100 / original_filesize).round(5)
+    for column in ("size_mb", "write_s", "read_s"):
+        stats[f"rank_{column}"] = stats[column].rank(method="min")
+    stats["rank"] = stats[["rank_size_mb", "rank_write_s", "rank_read_s"]].mean(axis=1)
+    stats = stats.sort_values("rank").reset_index(drop=True)
+    stats.to_csv(args.sweep_output, index=False)
+
+    print("\n-----\nSWEEP\n")
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(stats.drop(columns=["rank_size_mb", "rank_write_s", "rank_read_s"]))
+    print(f"\nSaved to {args.sweep_output}")
+
+
+class CountingFile(io.FileIO):
+    # Файл, который считает прочитанные из него байты
+    def __init__(self, path: Path):
+        super().__init__(path, "rb")
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        read = super().readinto(buffer)
+        self.bytes_read += read or 0
+        return read
+
+
+_OPERATORS = {
+    "<": pc.less,
+    "<=": pc.less_equal,
+    ">": pc.greater,
+    ">=": pc.greater_equal,
+    "==": pc.equal,
+}
+
+
+def read_scenario(fmt: str, source, columns, row_filter, use_threads: bool) -> pa.Table:
+    if fmt == "parquet":
+        return pq.read_table(
+            source,
+            columns=columns,
+            filters=None if row_filter is None else [row_filter],
+            use_threads=use_threads,
+        )
+    # orc: фильтра при чтении нет - колонка фильтра читается
+    # вместе с проекцией, строки отбираются после
+    read_columns = columns
+    if row_filter is not None and columns is not None and row_filter[0] not in columns:
+        read_columns = columns + [row_filter[0]]
+    table = orc.ORCFile(source).read(columns=read_columns)
+    if row_filter is not None:
+        column, op, value = row_filter
+        table = table.filter(_OPERATORS[op](table[column], value))
+        if read_columns is not columns:
+            table = table.select(columns)
+    return table
+
+
+def default_filter(parquet_output: Path, schema: pa.Schema, args):
+    column = args.filter_column
+    if column is None:
+        numeric = [
+            field.name for field in schema
+            if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+        ]
+        if not numeric:
+            return None
+        column = numeric[0]
+    field_type = schema.field(column).type
+    if args.filter_value is not None:
+        value = args.filter_value
+        if pa.types.is_integer(field_type):
+            value = int(value)
+        elif pa.types.is_floating(field_type):
+            value = float(value)
+        return column, args.filter_op, value
+
+    # Порог - 90% диапазона по статистикам row group'ов: без сортировки
+    # по этой колонке подходящие строки есть почти в каждой row group
+    metadata = pq.ParquetFile(parquet_output).metadata
+    index = schema.get_field_index(column)
+    low, high = None, None
+    for row_group in range(metadata.num_row_groups):
+        statistics = metadata.row_group(row_group).column(index).statistics
+        if statistics is None or not statistics.has_min_max:
+            continue
+        low = statistics.min if low is None else min(low, statistics.min)
+        high = statistics.max if high is None else max(high, statistics.max)
+    if low is None:
+        return None
+    value = low + (high - low) * 0.9
+    if pa.types.is_integer(field_type):
+        value = int(value)
+    return column, args.filter_op, value
+
+
+def read_scenarios(args):
+    schema = pq.ParquetFile(args.parquet_output).schema_arrow
+    columns = args.columns or schema.names[:3]
+    row_filter = default_filter(args.parquet_output, schema, args)
+    scenarios = {"full": (None, None), "projection": (columns, None)}
+    if row_filter is not None:
+        scenarios["filter"] = (None, row_filter)
+        scenarios["projection+filter"] = (columns, row_filter)
+        print(f"Filter: {' '.join(map(str, row_filter))}")
+    print(f"Projection: {columns}")
+
+    cpu_count = os.cpu_count()
+    cores = args.cores
+    if cores is None:
+        cores = sorted({min(2 ** i, cpu_count) for i in range(cpu_count.bit_length() + 1)})
+    threads = [(False, 1)] + [(True, count) for count in cores]
+
+    rows = []
+    for fmt, path in (("parquet", args.parquet_output), ("orc", args.orc_output)):
+        file_size = os.stat(path).st_size
+        for scenario, (scenario_columns, scenario_filter) in scenarios.items():
+            # Сколько байт читается из файла, от mmap и потоков не зависит
+            with CountingFile(path) as counting:
+                result = read_scenario(fmt, pa.PythonFile(counting, mode="r"), scenario_columns, scenario_filter, False)
+                bytes_read = counting.bytes_read
+            for memory_map, (use_threads, cpu) in product((False, True), threads):
+                pa.set_cpu_count(cpu)
+                times = []
+                for _ in range(args.read_repeats):
+                    source = pa.memory_map(str(path)) if memory_map else pa.OSFile(str(path))
+                    with source:
+                        _, read_time = timed(
+                            read_scenario, fmt, source, scenario_columns, scenario_filter, use_threads
+                        )
+                    times.append(read_time)
+                rows.append({
+                    "format": fmt,
+                    "scenario": scenario,
+                    "mmap": memory_map,
+                    "threads": cpu if use_threads else "off",
+                    "rows": result.num_rows,
+                    "median ms": round(median(times) * 1000, 3),
+                    "MB read": round(bytes_read / MB, 5),
+                    "% of file read": round(bytes_read * 100 / file_size, 2),
+                })
+    pa.set_cpu_count(cpu_count)
+
+    print("\n-----\nREAD SCENARIOS\n")
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(pd.DataFrame(rows))
+
+
+def write_dataset(args, fmt: str, output: Path, rows_per_file: int, convert_options: pv.ConvertOptions) -> float:
+    if output.exists():
+        shutil.rmtree(output)
+    reader = open_csv(args.input, args.block_size * MB, convert_options)
+    _, write_time = timed(
+        ds.write_dataset,
+        reader,
+        output,
+        format=fmt,
+        partitioning=[args.partition_column],
+        partitioning_flavor="hive",
+        max_partitions=args.max_partitions,
+        max_rows_per_file=rows_per_file,
+        max_rows_per_group=min(rows_per_file, 1024 * 1024),
+        use_threads=True,
+    )
+    return write_time
+
+
+def dataset_size(output: Path) -> int:
+    return sum(path.stat().st_size for path in output.rglob("*") if path.is_file())
+
+
+def scan(dataset: ds.Dataset, row_filter) -> int:
+    return dataset.to_table(filter=row_filter).num_rows
+
+
+def dataset_scans(args, rows: int, convert_options: pv.ConvertOptions):
+    if args.write_threads is not None:
+        pa.set_io_thread_count(args.write_threads)
+    schema = pq.ParquetFile(args.parquet_output).schema_arrow
+    if args.partition_column is None:
+        strings = [field.name for field in schema if pa.types.is_string(field.type)]
+        if not strings:
+            raise ValueError("No string column to partition by, pass --partition-column")
+        args.partition_column = strings[0]
+    print(f"\nPartitioning by {args.partition_column}")
+
+    results = []
+    for fmt, single_file in (("parquet", args.parquet_output), ("orc", args.orc_output)):
+        output = Path(f"{fmt}_dataset")
+        # Ограничение размера файла переводится в строки по размеру
+        # строки в одиночном файле того же формата
+        rows_per_file = max(1, int(args.max_file_mb * MB * rows / os.stat(single_file).st_size))
+        write_time = write_dataset(args, fmt, output, rows_per_file, convert_options)
+
+        dataset = ds.dataset(output, format=fmt, partitioning="hive")
+        fragments = list(dataset.get_fragments())
+        value = args.partition_value
+        if value is None:
+            value = ds.get_partition_keys(fragments[0].partition_expression)[args.partition_column]
+        partition_type = dataset.schema.field(args.partition_column).type
+        row_filter = ds.field(args.partition_column) == pa.scalar(value).cast(partition_type)
+        pruned_fragments = len(list(dataset.get_fragments(filter=row_filter)))
+
+        for scan_name, scan_filter, files in (
+                ("full scan", None, len(fragments)),
+                ("pruned scan", row_filter, pruned_fragments),
+        ):
+            times = []
+            for _ in range(args.read_repeats):
+                scanned_rows, scan_time = timed(scan, dataset, scan_filter)
+                times.append(scan_time)
+            results.append({
+                "format": fmt,
+                "scan": scan_name,
+                "filter": "" if scan_filter is None else f"{args.partition_column} == {value}",
+                "files": files,
+                "rows": scanned_rows,
+                "median ms": round(median(times) * 1000, 3),
+                "write s": round(write_time, 5),
+                "dataset MB": round(dataset_size(output) / MB, 5),
+            })
+        if results[-2]["rows"] != rows:
+            raise RuntimeError(f"{fmt} dataset has {results[-2]['rows']} rows, expected {rows}")
+
+    print("\n-----\nDATASET\n")
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(pd.DataFrame(results))
+
+
+def timed(fn, *args, **kwargs):
+    start = perf_counter()
+    result = fn(*args, **kwargs)
+    return result, perf_counter() - start
+
+
+def generate_input(args):
+    columns = [synthetic_data.parse_column(spec, args.null_fraction) for spec in args.schema]
+    rows = synthetic_data.rows_for_size(columns, args.generate_mb, args.seed)
+    synthetic_data.write_csv(args.input, columns, rows, args.seed)
+    print(f"Generated {rows} rows into {args.input} (seed {args.seed})")
+
+
+def main():
+    args = parse_args()
+    if args.generate_mb is not None:
+        generate_input(args)
+    if args.sweep:
+        sweep(args)
+        return
+
+    filename = args.input
+    block_size = args.block_size * MB
+
+    original_filesize = os.stat(filename).st_size
+    print(f"Original filesize = {(original_filesize / MB):.5f} megabytes")
+    print(f"Streaming in blocks of {args.block_size} MB")
+
+    convert_options = csv_convert_options(filename, args.sample_mb, parse_column_types(args.column_types))
+    result = convert(filename, args.parquet_output, args.orc_output, block_size, convert_options)
+    write_rss = peak_rss()
+    write_arrow = pa.default_memory_pool().max_memory() / MB
+    rows = result["rows"]
+    times = result["times"]
+    print(f"Read {rows} rows of CSV in {times['csv']:.5f} seconds "
+          f"({original_filesize / MB / times['csv']:.2f} MB/s)")
+    print(f"Peak RSS while converting = {write_rss:.1f} MB, Arrow pool peak = {write_arrow:.1f} MB")
+
+    stats = [[round(original_filesize / MB, 5), None, None, 100, None, None, round(write_rss, 1)]]
+    for name, path, reader in (
+            ("parquet", args.parquet_output, read_parquet),
+            ("orc", args.orc_output, read_orc),
+    ):
+        read_rows, read_time = timed(reader, path)
+        if read_rows != rows:
+            raise RuntimeError(f"{name} file has {read_rows} rows, expected {rows}")
+        write_time = times[name]
+        size = os.stat(path).st_size
+        # МБ/с - по объему исходного CSV, чтобы форматы сравнивались на одной базе
+        stats.append([
+            round(size / MB, 5),
+            round(write_time, 5),
+            round(read_time, 5),
+            round(size * 100 / original_filesize, 5),
+            round(original_filesize / MB / write_time, 2),
+            round(original_filesize / MB / read_time, 2),
+            round(peak_rss(), 1),
+        ])
+        print(f"Writing a {name} file took {write_time:.5f} seconds")
+        print(f"Reading it back took {read_time:.5f} seconds")
+        print(f"{name.capitalize()} filesize = {(size / MB):.5f} megabytes")
+        print(f"In % to original filesize = {(size * 100 / original_filesize):.5f}")
+
+    print("\n-----\nSUMMARY\n")
+    stats = pd.DataFrame(stats, columns=[
+        "Size (MB)",
+        "Write time (seconds)",
+        "Read time (seconds)",
+        "% to the original size",
+        "Write (MB/s)",
+        "Read (MB/s)",
+        "Peak RSS (MB)",
+    ])
+    stats.index = ["Original", "Parquet", "ORC"]
+    print(stats)
+
+    if args.read_scenarios:
+        read_scenarios(args)
+    if args.dataset:
+        dataset_scans(args, rows, convert_options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import numpy as np
+from pathlib import Path
+import argparse
+import io
+
+
+# Детерминированный генератор данных для бенчмарка: одинаковые seed
+# и описание колонок дают побайтово одинаковый результат на любой машине.
+# Пачка номер i строится своим генератором numpy от (seed, i), поэтому
+# данные идут потоком и могут быть больше памяти.
+#
+# Колонка описывается строкой "имя:тип[:sorted][:nulls=доля]", типы:
+#   int        - целые
+#   float      - дробные
+#   str_low    - строки из небольшого словаря (--low-cardinality значений)
+#   str_high   - почти уникальные строки
+#   timestamp  - время в пределах года с 2020-01-01
+# sorted - колонка возрастает по всему файлу, nulls - доля пустых значений
+# (по умолчанию --null-fraction, у sorted колонок пустых нет)
+#
+# python synthetic_data.py --output input.csv --size-mb 1024 --seed 42 \
+#     --columns id:int:sorted price:float city:str_low user:str_high created:timestamp:sorted
+
+DEFAULT_COLUMNS = [
+    "id:int:sorted",
+    "amount:float",
+    "category:str_low",
+    "user:str_high",
+    "created_at:timestamp",
+]
+
+_KINDS = ("int", "float", "str_low", "str_high", "timestamp")
+_YEAR_SECONDS = 365 * 24 * 3600
+_START = np.datetime64("2020-01-01T00:00:00", "s")
+
+
+def parse_column(spec: str, null_fraction: float) -> dict:
+    name, kind, *options = spec.split(":")
+    if kind not in _KINDS:
+        raise ValueError(f"Unknown column type {kind} in {spec}, expected one of {_KINDS}")
+    column = {"name": name, "kind": kind, "sorted": False, "nulls": null_fraction}
+    for option in options:
+        if option == "sorted":
+            column["sorted"] = True
+        elif option.startswith("nulls="):
+            column["nulls"] = float(option[len("nulls="):])
+        else:
+            raise ValueError(f"Unknown column option {option} in {spec}")
+    if column["sorted"]:
+        column["nulls"] = 0.0
+    return column
+
+
+def _values(column: dict, rng, first_row: int, count: int, total_rows: int, low_cardinality: int) -> pa.Array:
+    # Значения строк first_row .. first_row + count; sorted колонки
+    # считаются от номера строки, так что порядок сохраняется между пачками
+    rows = np.arange(first_row, first_row + count, dtype=np.int64)
+    kind = column["kind"]
+    if kind == "int":
+        if column["sorted"]:
+            return pa.array(rows * 10 + rng.integers(0, 10, count))
+        return pa.array(rng.integers(0, 10**9, count))
+    if kind == "float":
+        if column["sorted"]:
+            return pa.array(rows + rng.random(count))
+        return pa.array(np.round(rng.lognormal(3, 1, count), 2))
+    if kind == "str_low":
+        categories = pa.array([f"category_{i:03d}" for i in range(low_cardinality)])
+        if column["sorted"]:
+            indices = rows * low_cardinality // max(total_rows, 1)
+        else:
+            indices = rng.integers(0, low_cardinality, count)
+        return categories.take(pa.array(indices))
+    if kind == "str_high":
+        numbers = rows if column["sorted"] else rng.integers(0, 2**62, count)
+        digits = pc.utf8_lpad(pc.cast(pa.array(numbers), pa.string()), 19, "0")
+        return pc.binary_join_element_wise("user_", digits, "")
+    # timestamp
+    if column["sorted"]:
+        seconds = rows * _YEAR_SECONDS // max(total_rows, 1)
+    else:
+        seconds = rng.integers(0, _YEAR_SECONDS, count)
+    return pa.array(_START + seconds.astype("timedelta64[s]"))
+
+
+def _batch(columns: list, rng, first_row: int, count: int, total_rows: int, low_cardinality: int) -> pa.RecordBatch:
+    arrays = []
+    for column in columns:
+        values = _values(column, rng, first_row, count, total_rows, low_cardinality)
+        if column["nulls"] > 0:
+            values = pc.if_else(pa.array(rng.random(count) < column["nulls"]), pa.scalar(None, values.type), values)
+        arrays.append(values)
+    return pa.RecordBatch.from_arrays(arrays, names=[column["name"] for column in columns])
+
+
+def iter_batches(
+        columns: list,
+        total_rows: int,
+        seed: int = 0,
+        batch_rows: int = 1024 * 1024,
+        low_cardinality: int = 16
+):
+    for batch_index, first_row in enumerate(range(0, total_rows, batch_rows)):
+        count = min(batch_rows, total_rows - first_row)
+        rng = np.random.default_rng([seed, batch_index])
+        yield _batch(columns, rng, first_row, count, total_rows, low_cardinality)
+
+
+def make_table(columns: list, total_rows: int, seed: int = 0, **options) -> pa.Table:
+    return pa.Table.from_batches(list(iter_batches(columns, total_rows, seed, **options)))
+
+
+def _csv_row_size(columns: list, seed: int, first_row: int, sample_rows: int, total_rows: int, low_cardinality: int) -> float:
+    # Средний размер строки CSV в пробной пачке со строк first_row .. first_row + sample_rows
+    rng = np.random.default_rng([seed, first_row])
+    sample = _batch(columns, rng, first_row, sample_rows, total_rows, low_cardinality)
+    buffer = io.BytesIO()
+    pv.write_csv(sample, buffer, pv.WriteOptions(include_header=False))
+    return buffer.tell() / sample_rows
+
+
+def rows_for_size(
+        columns: list,
+        size_mb: float,
+        seed: int = 0,
+        sample_rows: int = 10_000,
+        low_cardinality: int = 16,
+        **options
+) -> int:
+    # Число строк для CSV примерно заданного размера. У sorted колонок строки
+    # к концу файла длиннее (больше цифр), поэтому размер строки берется
+    # средним по пробным пачкам в начале, середине и конце диапазона,
+    # а диапазон уточняется, пока число строк не перестанет меняться
+    size = size_mb * 1024**2
+    rows = max(1, int(size / _csv_row_size(columns, seed, 0, sample_rows, sample_rows, low_cardinality)))
+    for _ in range(5):
+        starts = {0, max(0, rows // 2 - sample_rows // 2), max(0, rows - sample_rows)}
+        row_size = sum(
+            _csv_row_size(columns, seed, first_row, sample_rows, max(rows, sample_rows), low_cardinality)
+            for first_row in starts
+        ) / len(starts)
+        new_rows = max(1, int(size / row_size))
+        if abs(new_rows - rows) <= rows // 1000:
+            return new_rows
+        rows = new_rows
+    return rows
+
+
+def write_csv(path: Path, columns: list, total_rows: int, seed: int = 0, **options) -> int:
+    batches = iter_batches(columns, total_rows, seed, **options)
+    first = next(batches)
+    with pv.CSVWriter(path, first.schema) as writer:
+        writer.write_batch(first)
+        for batch in batches:
+            writer.write_batch(batch)
+    return total_rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Deterministic synthetic dataset generator")
+    parser.add_argument("--output", type=Path, default=Path("input.csv"))
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument("--rows", type=int)
+    size.add_argument("--size-mb", type=float, help="approximate CSV size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--columns", nargs="+", default=DEFAULT_COLUMNS, help="name:type[:sorted][:nulls=F]")
+    parser.add_argument("--null-fraction", type=float, default=0.0)
+    parser.add_argument("--low-cardinality", type=int, default=16)
+    parser.add_argument("--batch-rows", type=int, default=1024 * 1024)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    columns = [parse_column(spec, args.null_fraction) for spec in args.columns]
+    options = {"batch_rows": args.batch_rows, "low_cardinality": args.low_cardinality}
+    rows = args.rows
+    if rows is None:
+        rows = rows_for_size(columns, args.size_mb, args.seed, **options)
+    write_csv(args.output, columns, rows, args.seed, **options)
+    print(f"Wrote {rows} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -37,20 +37,12 @@ def get_best_match(data, current_position, lookahead_len, win_size):
     return None
 
 
-def compress(
-        window_size: int,
-        lookahead_buffer_len: int,
-        input_file: Union[Path, str],
-        output_file: Union[Path, str]
-):
-    data = None
+def compress_bytes(data: bytes, window_size: int, lookahead_buffer_len: int, verbose: bool = False) -> bytes:
     i = 0
     output_buffer = bitarray(endian='big')
 
-    with open(input_file, 'rb') as instream:
-        data = instream.read()
-
-    print(f"Will compress {len(data)} bytes")
+    if verbose:
+        print(f"Will compress {len(data)} bytes")
     while i < len(data):
         match = get_best_match(data, i, lookahead_buffer_len, window_size)
         if match: 
@@ -76,6 +68,8 @@ def compress(
             # Просто идем на следующий бит
             i += 1
         
+        if not verbose:
+            continue
         if i == len(data) // 4:
             print("25% done")
         elif i == len(data) // 2:
@@ -84,9 +78,57 @@ def compress(
             print("75% done")
 
     output_buffer.fill()
+    return output_buffer.tobytes()
+
+
+def compress(
+        window_size: int,
+        lookahead_buffer_len: int,
+        input_file: Union[Path, str],
+        output_file: Union[Path, str]
+):
+    with open(input_file, 'rb') as instream:
+        data = instream.read()
+
+    compressed = compress_bytes(data, window_size, lookahead_buffer_len, verbose=True)
 
     with open(output_file, 'wb') as outstream:
-        outstream.write(output_buffer.tobytes())
+        outstream.write(compressed)
+
+
+def decompress_bytes(compressed: bytes, verbose: bool = False) -> bytes:
+    data = bitarray(endian='big')
+    data.frombytes(compressed)
+    buf = []
+
+    if verbose:
+        print(f"Will decode {len(data) // 8} bytes")
+    while len(data) >= 9:
+        # Загрузка - обратный процесс от кодирования
+        # Сначала грузим флаг, смотрим является ли вставка ключом
+        flag = data.pop(0)
+
+        if not flag:
+            # Если нет, то вписываем следующие 8 бит как есть
+            byte = data[0:8].tobytes()
+
+            buf.append(byte)
+            del data[0:8]
+        else:
+            # Если флаг установлен, то вычислим дистанцию до ключа
+            # и длину ключа
+            byte1 = ord(data[0:8].tobytes())
+            byte2 = ord(data[8:16].tobytes())
+
+            del data[0:16]
+            dist = (byte1 << 4) | (byte2 >> 4)
+            length = (byte2 & 0xf)
+
+            # Вписываем байты в массив
+            for i in range(length):
+                buf.append(buf[-dist])
+
+    return b''.join(buf)
 
 
 def decompress(
@@ -94,37 +136,8 @@ def decompress(
         output_file: Union[Path, str]
     ):
 
-        data = bitarray(endian='big')
-        buf = []
-
         with open(input_file, 'rb') as input_file:
-            data.fromfile(input_file)
-
-        print(f"Will decode {len(data) // 8} bytes")
-        while len(data) >= 9:
-            # Загрузка - обратный процесс от кодирования
-            # Сначала грузим флаг, смотрим является ли вставка ключом
-            flag = data.pop(0)
-
-            if not flag:
-                # Если нет, то вписываем следующие 8 бит как есть
-                byte = data[0:8].tobytes()
-
-                buf.append(byte)
-                del data[0:8]
-            else:
-                # Если флаг установлен, то вычислим дистанцию до ключа
-                # и длину ключа
-                byte1 = ord(data[0:8].tobytes())
-                byte2 = ord(data[8:16].tobytes())
-
-                del data[0:16]
-                dist = (byte1 << 4) | (byte2 >> 4)
-                length = (byte2 & 0xf)
-
-                # Вписываем байты в массив
-                for i in range(length):
-                    buf.append(buf[-dist])
+            decompressed = decompress_bytes(input_file.read(), verbose=True)
 
         with open(output_file, 'wb') as output_file:
-            output_file.write(b''.join(buf))
\ No newline at end of file
+            output_file.write(decompressed)